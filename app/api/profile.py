@@ -5,6 +5,7 @@ import datetime
 import json
 
 from app.models import db, repository
+from app.core.personalization_engine import invalidate_learning_style
 from app.schemas.profile import ProfileCreateRequest, ProfileUpdateRequest, ProfileResponse
 
 router = APIRouter()
@@ -78,6 +79,8 @@ async def update_profile(user_id: str, request: ProfileUpdateRequest, db_session
             user_id=user_id,
             profile_data=profile_data
         )
+        if "study_preferences" in profile_data:
+            invalidate_learning_style(user_id)
         
         # Format response
         profile_data = repository.get_user_profile(db_session, user_id)
@@ -32,10 +32,11 @@ async def update_progress(request: ProgressUpdateRequest, db_session = Depends(d
         raise HTTPException(status_code=500, detail=f"Error updating progress: {str(e)}")
 
 @router.get("/{user_id}", response_model=ProgressResponse)
-async def get_progress(user_id: str, topics: Optional[List[str]] = None, db_session = Depends(db.get_db)):
+async def get_progress(user_id: str, topics: Optional[List[str]] = None, include_topics: bool = True,
+                       db_session = Depends(db.get_db)):
     """Get progress summary for a student"""
     try:
-        progress = progress_tracker.get_student_progress(db_session, user_id, topics)
+        progress = progress_tracker.get_student_progress(db_session, user_id, topics, include_topics)
         return progress
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving progress: {str(e)}")
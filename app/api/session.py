@@ -1,8 +1,8 @@
 # app/api/session.py
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
-import json
 
 from app.models import db, repository
 from app.core.factory import get_factory
@@ -17,6 +17,9 @@ class ActivityExecuteRequest(BaseModel):
     session_id: str
     activity_index: Optional[int] = None
 
+class SessionExecuteAllRequest(BaseModel):
+    session_id: str
+
 router = APIRouter()
 
 @router.post("/quick", response_model=Dict[str, Any])
@@ -67,6 +70,77 @@ async def execute_session_activity(request: ActivityExecuteRequest, db_session =
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error executing activity: {str(e)}")
 
+@router.post("/execute/stream")
+async def stream_session_activity(request: ActivityExecuteRequest):
+    """
+    Execute an activity in a study session, streaming its result as server-sent events
+    
+    Each chunk of the result is sent as a data event as soon as it is generated.
+    A failure after the stream has started is sent as an error event.
+    """
+    # Dependencies are closed before a streamed body is sent, so the stream owns its session
+    db_session = db.SessionLocal()
+    orchestrator = get_factory().get_session_orchestrator()
+    chunks = orchestrator.execute_activity_stream(
+        session_id=request.session_id,
+        activity_index=request.activity_index,
+        db=db_session
+    )
+    
+    # Pull the first chunk up front so an unknown session is still a 404
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+    except ValueError as e:
+        db_session.close()
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        db_session.close()
+        raise HTTPException(status_code=500, detail=f"Error executing activity: {str(e)}")
+    
+    async def events():
+        try:
+            yield _sse_event(first_chunk)
+            async for chunk in chunks:
+                yield _sse_event(chunk)
+            yield "event: done\ndata: \n\n"
+        except Exception as e:
+            yield _sse_event(f"Error executing activity: {str(e)}", "error")
+        finally:
+            await chunks.aclose()
+            db_session.close()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def _sse_event(text: str, event: str = None) -> str:
+    """Format text as a server-sent event, one data line per line of text"""
+    data = "".join(f"data: {line}\n" for line in text.split("\n"))
+    return f"event: {event}\n{data}\n" if event else f"{data}\n"
+
+@router.post("/execute-all", response_model=Dict[str, Any])
+async def execute_all_session_activities(request: SessionExecuteAllRequest, db_session = Depends(db.get_db)):
+    """Execute all remaining activities in a study session concurrently"""
+    try:
+        # Get factory and session orchestrator
+        factory = get_factory()
+        orchestrator = factory.get_session_orchestrator()
+        
+        # Execute the activities
+        result = await orchestrator.execute_all_activities(
+            session_id=request.session_id,
+            db=db_session
+        )
+        
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error executing activities: {str(e)}")
+
 @router.get("/{session_id}", response_model=Dict[str, Any])
 async def get_session(session_id: str, db_session = Depends(db.get_db)):
     """Get a study session by ID"""
@@ -75,16 +149,10 @@ async def get_session(session_id: str, db_session = Depends(db.get_db)):
         factory = get_factory()
         orchestrator = factory.get_session_orchestrator()
         
-        # Get the session
-        session = orchestrator.get_session(session_id)
-        
-        # If not found in memory, try the database
+        # Get the session from memory, falling back to the database
+        session = await orchestrator.get_session(session_id, db_session)
         if not session:
-            record = repository.get_study_session(db_session, session_id)
-            if record:
-                session = json.loads(record.content)
-            else:
-                raise HTTPException(status_code=404, detail="Session not found")
+            raise HTTPException(status_code=404, detail="Session not found")
         
         return session
     except HTTPException:
@@ -96,13 +164,16 @@ async def get_session(session_id: str, db_session = Depends(db.get_db)):
 async def get_user_sessions(user_id: str, db_session = Depends(db.get_db)):
     """Get all sessions for a user"""
     try:
-        # Get from database
+        # Get from database, with the activity results of all sessions in one query
         records = repository.get_user_study_sessions(db_session, user_id)
+        events = repository.get_study_session_events(db_session, [record.id for record in records])
+        orchestrator = get_factory().get_session_orchestrator()
         
         sessions = []
         for record in records:
             try:
-                session = json.loads(record.content)
+                session = await orchestrator.get_session(record.id) or \
+                    orchestrator.plan_from_record(record, events.get(record.id, []))
                 sessions.append(session)
             except:
                 continue
@@ -49,9 +49,6 @@ except ImportError as e:
     # print("SK module not available")
     SK_AVAILABLE = False
 
-from dotenv import load_dotenv
-load_dotenv()
-
 class StudyBuddyFactory:
     """Factory for creating Study Buddy components with optional SK integration"""
     
@@ -65,12 +62,23 @@ class StudyBuddyFactory:
         if self.use_sk and not SK_AVAILABLE:
             self.use_sk = False
             print("Warning: Semantic Kernel not available, falling back to direct implementation")
+        self._message_processor = None
+        self._session_orchestrator = None
+        self._study_planner = None
     
     def get_message_processor(self) -> MessageProcessor:
-        """Get the appropriate message processor implementation"""
-        if self.use_sk and SK_AVAILABLE:
-            return SKMessageProcessor()
-        return MessageProcessor()
+        """
+        Get the appropriate message processor implementation
+        
+        The processor holds conversation history, cached prompts and (with SK)
+        the initialized kernel functions, so one instance is shared across requests.
+        """
+        if self._message_processor is None:
+            if self.use_sk and SK_AVAILABLE:
+                self._message_processor = SKMessageProcessor()
+            else:
+                self._message_processor = MessageProcessor()
+        return self._message_processor
     
     def get_quiz_generator(self) -> QuizGenerator:
         """Get the appropriate quiz generator implementation"""
@@ -97,7 +105,18 @@ class StudyBuddyFactory:
         return PersonalizationEngine()
     
     def get_study_planner(self) -> StudyPlanGenerator:
-        """Get the appropriate study planner implementation"""
+        """
+        Get the appropriate study planner implementation
+        
+        The planner holds no per-request state, so one instance (and with SK,
+        one resolved chat service) is shared across requests.
+        """
+        if self._study_planner is None:
+            self._study_planner = self._create_study_planner()
+        return self._study_planner
+    
+    def _create_study_planner(self) -> StudyPlanGenerator:
+        """Create the study planner implementation"""
         if self.use_sk and SK_AVAILABLE:
             try:
                 return SKStudyPlanGenerator()
@@ -108,7 +127,18 @@ class StudyBuddyFactory:
     
     # Add to the StudyBuddyFactory class
     def get_session_orchestrator(self) -> SessionOrchestrator:
-        """Get the appropriate session orchestrator implementation"""
+        """
+        Get the appropriate session orchestrator implementation
+        
+        Active sessions and their unsaved results live in the orchestrator,
+        so one instance is shared across requests.
+        """
+        if self._session_orchestrator is None:
+            self._session_orchestrator = self._create_session_orchestrator()
+        return self._session_orchestrator
+    
+    def _create_session_orchestrator(self) -> SessionOrchestrator:
+        """Create the session orchestrator implementation"""
         if self.use_sk and SK_AVAILABLE:
             try:
                 return SKSessionOrchestrator()
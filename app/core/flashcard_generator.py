@@ -3,6 +3,9 @@ from typing import List, Dict, Any
 import re
 import uuid
 
+# One "Card N: / Front: / Back:" block of the model's flashcard output
+CARD_PATTERN_RE = re.compile(r"Card\s+(\d+):\s*\n+Front:\s*(.*?)\s*\n+Back:\s*(.*?)(?=\n+Card\s+\d+:|\Z)", re.DOTALL)
+
 class FlashcardGenerator:
     """Service for generating flashcards from document content"""
     
@@ -106,11 +109,8 @@ Remember to follow the exact format specified above. Each flashcard should have:
         """Parse the generated flashcards text into structured cards"""
         cards = []
         
-        # Pattern to identify cards
-        card_pattern = r"Card\s+(\d+):\s*\n+Front:\s*(.*?)\s*\n+Back:\s*(.*?)(?=\n+Card\s+\d+:|\Z)"
-        
         # Find all cards
-        card_matches = re.finditer(card_pattern, text, re.DOTALL)
+        card_matches = CARD_PATTERN_RE.finditer(text)
         
         for match in card_matches:
             card_number = match.group(1)
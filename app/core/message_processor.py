@@ -1,18 +1,88 @@
 # app/core/message_processor.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 import os
-import json
-from openai import AsyncOpenAI
+import re
+import asyncio
+import logging
+import orjson
+from pathlib import Path
 
 from app.utils.context_retrieval import retrieve_enhanced_context, format_context_by_source
 from app.core.tutoring import TutoringSessionManager
-from dotenv import load_dotenv
-load_dotenv()
+from app.utils.logging_config import request_user_id
+from app.utils.tokens import get_encoding
+
+logger = logging.getLogger(__name__)
+
+# Map chat modes to the skill directories under app/skills/StudyBuddy
+MODE_TO_SKILL = {
+    "chat": "Chat",
+    "tutor": "Tutor",
+    "quiz": "QuizCreator",
+    "flashcard": "FlashcardCreator"
+}
+
+DEFAULT_SYSTEM_PROMPT = "You are Study Buddy, an AI tutor."
+HISTORY_PLACEHOLDER = "{{$history}}"
+HISTORY_HEADER = "Previous conversation:"
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\$(context|history|input)\}\}")
+
+# Short chat messages without a question ("hi", "thanks!") skip vector retrieval,
+# unless SKIP_TRIVIAL_RETRIEVAL is set to something other than "true"
+TRIVIAL_MESSAGE_MAX_WORDS = 3
+
+# Context window of the configured model, overridable for models other than gpt-4o
+DEFAULT_CONTEXT_WINDOW = 128000
+# Per-message framing overhead used by OpenAI chat models
+TOKENS_PER_MESSAGE = 4
+# Entries (user and assistant messages) kept in each user's conversation history
+MAX_HISTORY_ENTRIES = 20
+
+def compile_prompt_builder(template: str):
+    """
+    Generate a specialized builder function for a prompt template.
+    
+    The template is split on its {{$context}}, {{$history}} and {{$input}}
+    placeholders once, and the returned build(context, input, history="")
+    concatenates the literal parts and arguments in straight-line code
+    instead of rescanning the template with str.replace on every request.
+    """
+    pieces = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        if match.start() > position:
+            pieces.append(repr(template[position:match.start()]))
+        pieces.append(match.group(1))
+        position = match.end()
+    if position < len(template):
+        pieces.append(repr(template[position:]))
+    
+    source = f"def build(context, input, history=''):\n    return {' + '.join(pieces) or repr('')}\n"
+    namespace = {}
+    exec(compile(source, "<prompt-builder>", "exec"), namespace)
+    return namespace["build"]
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    """Count tokens in text, estimating ~4 characters per token without tiktoken"""
+    encoding = get_encoding(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
 
 class MessageProcessor:
     def __init__(self):
         self.conversation_history = {}
         self.tutoring_manager = TutoringSessionManager()
+        self._inflight = {}
+        self._prompt_parts = {}
+        self._system_tokens = {}
+        self._configs = {}
+        # Resolve skill file paths once instead of on every request
+        self._skills_dir = Path(__file__).resolve().parent.parent / "skills" / "StudyBuddy"
+        self._skill_paths = {
+            name: (self._skills_dir / name / "skprompt.txt", self._skills_dir / name / "config.json")
+            for name in MODE_TO_SKILL.values()
+        }
         self._setup_client()
     
     def _setup_client(self):
@@ -20,23 +90,41 @@ class MessageProcessor:
         token = os.environ.get("GITHUB_TOKEN")
         endpoint = os.getenv("ENDPOINT")
         self.model_name = os.getenv("GITHUB_MODEL", "openai/gpt-4o")
+        self.context_window = int(os.getenv("GITHUB_MODEL_CONTEXT_WINDOW", DEFAULT_CONTEXT_WINDOW))
+        self.skip_trivial_retrieval = os.getenv("SKIP_TRIVIAL_RETRIEVAL", "true").lower() == "true"
         
-        self.client = AsyncOpenAI(
-            base_url=endpoint,
-            api_key=token,
-        )
+        # The OpenAI SDK is imported and instantiated on first use to keep startup light
+        self._client = None
+        self._client_options = {"base_url": endpoint, "api_key": token}
         
-        print(f"OpenAI client configured for model: {self.model_name}")
+        logger.info("OpenAI client configured for model: %s", self.model_name)
+    
+    @property
+    def client(self):
+        """OpenAI client for GitHub's models, created on first access"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(**self._client_options)
+        return self._client
     
-    def _load_prompt_template(self, mode_name):
-        """Load prompt template from file"""
-        skills_directory = os.path.join(os.path.dirname(os.path.dirname(__file__)), "skills")
-        prompt_path = os.path.join(skills_directory, "StudyBuddy", mode_name, "skprompt.txt")
+    @client.setter
+    def client(self, value):
+        self._client = value
+    
+    def _get_skill_paths(self, mode_name):
+        """Return the (prompt_path, config_path) pair for a skill"""
+        paths = self._skill_paths.get(mode_name)
+        if paths is None:
+            paths = (self._skills_dir / mode_name / "skprompt.txt", self._skills_dir / mode_name / "config.json")
+        return paths
+    
+    async def _load_prompt_template(self, mode_name):
+        """Load prompt template from file without blocking the event loop"""
+        prompt_path, _ = self._get_skill_paths(mode_name)
         try:
-            with open(prompt_path, "r") as f:
-                return f.read()
+            return await asyncio.to_thread(prompt_path.read_text)
         except Exception as e:
-            print(f"Error loading {mode_name} prompt file: {e}")
+            logger.warning("Error loading %s prompt file: %s", mode_name, e)
             # Return fallback prompts if file not found
             if mode_name == "Chat":
                 return "You are a helpful study assistant named Study Buddy.\n\nPrevious conversation:\n{{$history}}\n\nContext from relevant documents:\n{{$context}}\n\nStudent: {{$input}}\n\nStudy Buddy:"
@@ -47,87 +135,210 @@ class MessageProcessor:
             elif mode_name == "FlashcardCreator":
                 return "You are Study Buddy in Flashcard Creator mode.\nCreate 5-8 flashcards covering important concepts.\n\nPrevious conversation:\n{{$history}}\n\nContext from relevant documents:\n{{$context}}\n\nStudent request: {{$input}}\n\nStudy Buddy (Flashcard Mode):"
     
-    def _load_config(self, mode_name):
-        """Load config from file"""
-        skills_directory = os.path.join(os.path.dirname(os.path.dirname(__file__)), "skills")
-        config_path = os.path.join(skills_directory, "StudyBuddy", mode_name, "config.json")
+    async def _load_config(self, mode_name):
+        """Load config from file without blocking the event loop"""
+        _, config_path = self._get_skill_paths(mode_name)
         try:
-            with open(config_path, "r") as f:
-                config = json.load(f)
-                return config.get("completion", {})
+            config = orjson.loads(await asyncio.to_thread(config_path.read_bytes))
+            return config.get("completion", {})
         except Exception as e:
-            print(f"Error loading {mode_name} config file: {e}")
+            logger.warning("Error loading %s config file: %s", mode_name, e)
             # Default configs
             return {
                 "max_tokens": 1000,
                 "temperature": 0.7
             }
     
+    def _split_prompt_template(self, template):
+        """
+        Split a skill template into a system instruction and a final user template.
+        
+        Everything before the history placeholder becomes the system message; the
+        history itself is sent as native chat turns, and the remainder (context and
+        input placeholders) becomes the final user message.
+        """
+        if HISTORY_PLACEHOLDER not in template:
+            return DEFAULT_SYSTEM_PROMPT, template
+        
+        system_part, _, user_part = template.partition(HISTORY_PLACEHOLDER)
+        system_part = system_part.rstrip()
+        if system_part.endswith(HISTORY_HEADER):
+            system_part = system_part[:-len(HISTORY_HEADER)].rstrip()
+        return system_part or DEFAULT_SYSTEM_PROMPT, user_part.strip()
+    
+    async def _get_prompt_parts(self, skill_name):
+        """Get the (system prompt, user prompt builder) pair for a skill, parsing it once"""
+        parts = self._prompt_parts.get(skill_name)
+        if parts is None:
+            template = await self._load_prompt_template(skill_name)
+            system_prompt, user_template = self._split_prompt_template(template)
+            parts = (system_prompt, compile_prompt_builder(user_template))
+            self._prompt_parts[skill_name] = parts
+            self._system_tokens[skill_name] = count_tokens(system_prompt, self.model_name) + TOKENS_PER_MESSAGE
+        return parts
+    
+    async def _get_config(self, skill_name):
+        """Get the completion config for a skill, loading it once"""
+        config = self._configs.get(skill_name)
+        if config is None:
+            config = await self._load_config(skill_name)
+            self._configs[skill_name] = config
+        return config
+    
+    def _fit_history(self, history, budget):
+        """Return the most recent history turns that fit within a token budget"""
+        used = 0
+        start = len(history)
+        while start > 0:
+            entry_tokens = count_tokens(history[start - 1]["content"], self.model_name) + TOKENS_PER_MESSAGE
+            if used + entry_tokens > budget:
+                break
+            used += entry_tokens
+            start -= 1
+        # Never open the window on an assistant turn
+        if start < len(history) and history[start]["role"] == "assistant":
+            start += 1
+        return history[start:]
+    
     def _format_history(self, history):
         """Format conversation history for inclusion in prompts"""
         if not history:
             return "No previous conversation."
         
-        formatted = []
-        for entry in history:
-            role = "Student" if entry["role"] == "user" else "Study Buddy"
-            formatted.append(f"{role}: {entry['content']}")
-        
-        return "\n".join(formatted)
+        return "\n".join(self._format_entry(entry) for entry in history)
+    
+    def _format_entry(self, entry):
+        """Format one history entry as a prompt line"""
+        role = "Student" if entry["role"] == "user" else "Study Buddy"
+        return f"{role}: {entry['content']}"
+    
+    def _needs_retrieval(self, message, mode):
+        """Check whether a message is worth a vector search"""
+        if not self.skip_trivial_retrieval or mode != "chat":
+            return True
+        return "?" in message or len(message.split()) > TRIVIAL_MESSAGE_MAX_WORDS
     
     def _get_skill_for_mode(self, mode):
         """Map mode to skill name"""
-        mode_to_skill = {
-            "chat": "Chat",
-            "tutor": "Tutor",
-            "quiz": "QuizCreator",
-            "flashcard": "FlashcardCreator"
-        }
-        return mode_to_skill.get(mode, "Chat")
+        return MODE_TO_SKILL.get(mode, "Chat")
+    
+    async def _resolve_context(self, message: str, mode: str, vector_search_client, context: str = None):
+        """Return (context, sources) for a message, searching the vector store unless context was supplied"""
+        # Get enhanced context from vector store, skipping greetings and acknowledgements
+        if context is not None:
+            return context, []
+        if self._needs_retrieval(message, mode):
+            search_results = await retrieve_enhanced_context(vector_search_client, message)
+            return format_context_by_source(search_results)
+        return "", []
+    
+    async def _build_messages(self, user_id: str, message: str, mode: str, context: str):
+        """
+        Build the chat messages for a request and return them with the skill config
+        
+        The user's history is read after the last await, so the messages see one
+        consistent snapshot of it even while other requests for the user run.
+        """
+        # Get the appropriate mode
+        skill_name = self._get_skill_for_mode(mode)
+        
+        # Load the prompt parts and config
+        system_prompt, build_user_prompt = await self._get_prompt_parts(skill_name)
+        config = await self._get_config(skill_name)
+        
+        # Add tutoring session context if in tutor mode
+        if mode == "tutor":
+            session_context = self.tutoring_manager.get_session(user_id).format_session_context()
+            # Add session context to the main context
+            context = context + "\n\n" + session_context if context else session_context
+        
+        user_prompt = build_user_prompt(context, message)
+        
+        logger.debug("Sending prompt to model with %s mode", skill_name)
+        
+        # Evict the oldest turns if the request would overflow the context window
+        max_tokens = config.get("max_tokens", 1000)
+        history_budget = (self.context_window - max_tokens - self._system_tokens[skill_name]
+                          - count_tokens(user_prompt, self.model_name) - TOKENS_PER_MESSAGE)
+        
+        # System instructions, prior turns in their native roles, then the new question
+        history = self.conversation_history.get(user_id, [])
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(self._fit_history(history, history_budget))
+        messages.append({"role": "user", "content": user_prompt})
+        return messages, config
+    
+    def _record_turn(self, user_id: str, message: str, mode: str, response_text: str) -> None:
+        """
+        Record a completed exchange in the user's history and tutoring session
+        
+        Runs without awaiting, so the append and trim happen as one step and
+        concurrent requests for the same user never lose each other's turns.
+        """
+        # Update tutoring session if in tutor mode
+        if mode == "tutor":
+            self.tutoring_manager.get_session(user_id).analyze_response(response_text)
+        self._append_history(user_id, message, response_text)
+    
+    def _append_history(self, user_id: str, message: str, response_text: str) -> None:
+        """Append an exchange to the user's history, trimming it to the most recent entries"""
+        history = self.conversation_history.setdefault(user_id, [])
+        history.append({"role": "user", "content": message})
+        history.append({"role": "assistant", "content": response_text})
+        
+        # Keep history to a reasonable size
+        if len(history) > MAX_HISTORY_ENTRIES:
+            self.conversation_history[user_id] = history[-MAX_HISTORY_ENTRIES:]
     
     async def process_message(self, user_id: str, message: str, mode: str = "chat", 
-                             vector_search_client=None) -> Dict[str, Any]:
-        """Process a message using GitHub's models via OpenAI client"""
-        # Initialize conversation history if needed
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
+                             vector_search_client=None, context: str = None) -> Dict[str, Any]:
+        """
+        Process a message using GitHub's models via OpenAI client
         
-        # Get conversation history
-        history = self.conversation_history[user_id]
+        When context is given (for example a study session's document context)
+        it is used as-is instead of searching the vector store.
+        """
+        request_user_id.set(user_id)
         
-        # Get enhanced context from vector store
-        search_results = await retrieve_enhanced_context(vector_search_client, message)
-        context, context_sources = format_context_by_source(search_results)
+        # Identical concurrent requests (e.g. double clicks) share one in-flight call
+        inflight_key = (user_id, mode, message, context)
+        while (inflight := self._inflight.get(inflight_key)) is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The shared call was cancelled (e.g. its client disconnected), so run
+                # the request ourselves; re-raise if this caller was the one cancelled
+                if not inflight.cancelled():
+                    raise
         
-        # Get the appropriate mode
-        skill_name = self._get_skill_for_mode(mode)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            result = await self._process_message(user_id, message, mode, vector_search_client, context)
+        except Exception as e:
+            # Waiters get the same error; retrieve it here so an unwatched future doesn't warn
+            future.set_exception(e)
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(inflight_key, None)
+    
+    async def _process_message(self, user_id: str, message: str, mode: str,
+                               vector_search_client, context: str = None) -> Dict[str, Any]:
+        """Generate a response for one message and record it in the user's history"""
+        context, context_sources = await self._resolve_context(message, mode, vector_search_client, context)
         
+        # The model call runs without holding anything, so concurrent requests for
+        # one user (such as a session's activities) overlap; the history is read
+        # and the turn recorded in await-free steps
         try:
-            # Load the prompt template and config
-            prompt_template = self._load_prompt_template(skill_name)
-            config = self._load_config(skill_name)
-            
-            # Format the prompt
-            formatted_history = self._format_history(history)
-            prompt = prompt_template.replace("{{$input}}", message)
-            prompt = prompt.replace("{{$history}}", formatted_history)
-            
-            # Add tutoring session context if in tutor mode
-            if mode == "tutor":
-                tutoring_session = self.tutoring_manager.get_session(user_id)
-                session_context = tutoring_session.format_session_context()
-                # Add session context to the main context
-                context = context + "\n\n" + session_context if context else session_context
-            
-            prompt = prompt.replace("{{$context}}", context)
-            
-            print(f"Sending prompt to model with {skill_name} mode")
-            
-            # Prepare messages for the API using GitHub's method
-            messages = [
-                {"role": "system", "content": "You are Study Buddy, an AI tutor."},
-                {"role": "user", "content": prompt}
-            ]
+            messages, config = await self._build_messages(user_id, message, mode, context)
             
             # Call the OpenAI client with GitHub's model
             response = await self.client.chat.completions.create(
@@ -139,29 +350,47 @@ class MessageProcessor:
             
             # Extract response text
             response_text = response.choices[0].message.content
-            
-            # Update tutoring session if in tutor mode
-            if mode == "tutor":
-                tutoring_session.analyze_response(response_text)
-            
-            # Update conversation history
-            history.append({"role": "user", "content": message})
-            history.append({"role": "assistant", "content": response_text})
-            
-            # Keep history to a reasonable size
-            if len(history) > 20:
-                history = history[-20:]
-            self.conversation_history[user_id] = history
+            self._record_turn(user_id, message, mode, response_text)
             
             return {
                 "response": response_text,
                 "context_used": context_sources
             }
         except Exception as e:
-            print(f"Error processing message: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error processing message: %s", e)
             return {
                 "response": f"I encountered an error while processing your request. Please try again. Error details: {str(e)}",
-                "context_used": []
-            }
\ No newline at end of file
+                "context_used": [],
+                "error": str(e)
+            }
+    
+    async def process_message_stream(self, user_id: str, message: str, mode: str = "chat",
+                                     vector_search_client=None, context: str = None) -> AsyncIterator[str]:
+        """
+        Process a message, yielding the response text as the model generates it
+        
+        The complete response is recorded in the user's history once the stream
+        ends. Errors are raised to the caller rather than returned as text.
+        """
+        request_user_id.set(user_id)
+        context, _ = await self._resolve_context(message, mode, vector_search_client, context)
+        
+        messages, config = await self._build_messages(user_id, message, mode, context)
+        stream = await self.client.chat.completions.create(
+            messages=messages,
+            temperature=config.get("temperature", 0.7),
+            max_tokens=config.get("max_tokens", 1000),
+            model=self.model_name,
+            stream=True
+        )
+        
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        
+        self._record_turn(user_id, message, mode, "".join(parts))
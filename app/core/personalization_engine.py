@@ -1,8 +1,209 @@
 # app/core/personalization_engine.py
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import datetime
+import asyncio
 import json
 import re
+import logging
+import threading
+import time
+from types import MappingProxyType
+from itertools import chain
+from dataclasses import dataclass
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy.exc import SQLAlchemyError
+from app.utils.error_handler import ActivityFetchError
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Process-local cache of computed learning styles, keyed by user_id
+_style_cache = TTLCache(maxsize=10_000, ttl=300)
+_style_cache_lock = threading.Lock()
+
+def invalidate_learning_style(user_id: str) -> None:
+    """Drop a user's cached learning style, e.g. after their study preferences change"""
+    with _style_cache_lock:
+        _style_cache.pop(user_id, None)
+
+# Learning style categories, frozen so the derived tables below cannot drift
+LEARNING_STYLES = MappingProxyType({
+    "visual": MappingProxyType({
+        "keywords": ("see", "view", "look", "watch", "observe", "visual", "picture", "image", "diagram", "chart"),
+        "patterns": ("I see what you mean", "I need to see it", "show me", "looks good", "I can picture that")
+    }),
+    "auditory": MappingProxyType({
+        "keywords": ("hear", "listen", "sound", "talk", "discuss", "audio", "noise", "loud", "quiet"),
+        "patterns": ("I hear what you're saying", "sounds good", "let's talk about", "I'm listening", "tell me")
+    }),
+    "reading_writing": MappingProxyType({
+        "keywords": ("read", "write", "note", "text", "list", "document", "book", "article", "word"),
+        "patterns": ("let me write that down", "I've read that", "in my notes", "make a list", "write it out")
+    }),
+    "kinesthetic": MappingProxyType({
+        "keywords": ("do", "feel", "touch", "practice", "try", "experience", "hands-on", "motion", "action"),
+        "patterns": ("let me try", "I feel like", "hands-on", "let's practice", "I need to experience it")
+    })
+})
+
+STYLE_ORDER = tuple(LEARNING_STYLES)
+STYLE_INDEX = MappingProxyType({style: idx for idx, style in enumerate(STYLE_ORDER)})
+
+# Stored learning styles are recomputed once they are 30 days old
+STYLE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+# Share of the final style score taken from conversation text vs. activity history
+TEXT_WEIGHT = 0.6
+ACTIVITY_WEIGHT = 0.4
+
+# Style score per quiz attempt, flashcard review and conversation (rows, in the
+# order _fetch_activity_counts returns them) for each style (columns, STYLE_ORDER)
+ACTIVITY_WEIGHTS = np.array([
+    # visual, auditory, reading_writing, kinesthetic
+    [0.0, 0.0, 0.5, 0.0],  # Quiz attempts favor reading/writing
+    [0.3, 0.0, 0.2, 0.0],  # Flashcard reviews favor visual and reading/writing
+    [0.0, 0.4, 0.0, 0.0],  # Conversations favor auditory
+])
+ACTIVITY_WEIGHTS.flags.writeable = False
+
+# Topic proficiency below/above which quizzes and flashcards get easier/harder
+LOW_PROFICIENCY = 0.3
+HIGH_PROFICIENCY = 0.7
+
+# Style confidence above which content is tailored strongly to the primary style
+STRONG_STYLE_CONFIDENCE = 0.7
+
+# Per-style presentation hints, tutoring tips, quiz/flashcard hints and study strategies
+PRESENTATION_HINTS = MappingProxyType({
+    "visual": (
+        "Include diagrams where possible",
+        "Use visual metaphors to explain concepts",
+        "Incorporate charts and graphs for data",
+        "Use color coding for important information"
+    ),
+    "auditory": (
+        "Suggest reading explanations aloud",
+        "Include discussion questions",
+        "Use auditory metaphors and sound-based examples",
+        "Suggest verbal mnemonics for memorization"
+    ),
+    "reading_writing": (
+        "Provide detailed written explanations",
+        "Include suggested note-taking strategies",
+        "Present information in lists and structured formats",
+        "Include suggested reading materials"
+    ),
+    "kinesthetic": (
+        "Include hands-on exercises to try",
+        "Suggest practical applications of concepts",
+        "Break learning into active steps",
+        "Use physical metaphors and examples"
+    )
+})
+
+TUTORING_TIPS = MappingProxyType({
+    "visual": "\n\nVisualization tip: Try creating a mental image or diagram to represent this concept.",
+    "auditory": "\n\nAuditory tip: Try explaining this concept aloud to solidify your understanding.",
+    "reading_writing": "\n\nReading/writing tip: Take a moment to write down the key points from this explanation.",
+    "kinesthetic": "\n\nHands-on tip: Think about a practical example where you could apply this concept."
+})
+
+QUESTION_STYLE_HINTS = MappingProxyType({
+    "visual": "Try to visualize the concept in your mind.",
+    "auditory": "Try reading the question aloud to yourself.",
+    "reading_writing": "Consider writing down key points before answering.",
+    "kinesthetic": "Think about how you would apply this concept practically."
+})
+
+FLASHCARD_STYLE_HINTS = MappingProxyType({
+    "visual": "Visualize an image representing this concept.",
+    "auditory": "Read the card aloud and discuss the concept.",
+    "reading_writing": "Write a summary in your own words after reviewing.",
+    "kinesthetic": "Think of a real-world example where you'd apply this."
+})
+
+STUDY_STRATEGIES = MappingProxyType({
+    "visual": (
+        "Use colored highlighters in your notes",
+        "Create mind maps for complex topics",
+        "Draw diagrams to represent concepts",
+        "Watch video explanations when available",
+        "Use flashcards with images or symbols"
+    ),
+    "auditory": (
+        "Record and listen to your notes",
+        "Discuss topics with study partners",
+        "Read important material aloud",
+        "Use verbal repetition for memorization",
+        "Create musical mnemonics for key concepts"
+    ),
+    "reading_writing": (
+        "Take detailed notes during study sessions",
+        "Rewrite key concepts in your own words",
+        "Create outlines and structured study guides",
+        "Use written repetition for memorization",
+        "Summarize what you've learned after each session"
+    ),
+    "kinesthetic": (
+        "Take breaks for physical movement",
+        "Use physical objects to represent concepts",
+        "Act out processes or sequences",
+        "Apply concepts to real-world scenarios",
+        "Study while standing or moving around"
+    )
+})
+
+def _index_style_terms(kind: str) -> Dict[str, Tuple[int, ...]]:
+    """Map each lowercased keyword or pattern to the indices of the styles that use it"""
+    index = {}
+    for style_idx, indicators in enumerate(LEARNING_STYLES.values()):
+        for term in indicators[kind]:
+            index.setdefault(term.lower(), []).append(style_idx)
+    return MappingProxyType({term: tuple(style_idxs) for term, style_idxs in index.items()})
+
+def _alternation(terms) -> str:
+    """Regex alternation of literal terms, longest first so longer terms win"""
+    return '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+
+def _build_style_automaton():
+    """Aho-Corasick automaton mapping each term to (term, ((style_idx, is_pattern), ...))"""
+    terms = {}
+    for term, style_idxs in _KEYWORD_STYLES.items():
+        terms.setdefault(term, []).extend((style_idx, False) for style_idx in style_idxs)
+    for term, style_idxs in _PATTERN_STYLES.items():
+        terms.setdefault(term, []).extend((style_idx, True) for style_idx in style_idxs)
+    
+    automaton = ahocorasick.Automaton()
+    for term, entries in terms.items():
+        automaton.add_word(term, (term, tuple(entries)))
+    automaton.make_automaton()
+    return automaton
+
+# Flattened lookup tables built once at import: every keyword (whole words) and
+# every pattern across all styles in one regex each, plus the optional automaton
+_KEYWORD_STYLES = _index_style_terms("keywords")
+_PATTERN_STYLES = _index_style_terms("patterns")
+_KEYWORD_REGEX = re.compile(r'\b(?:' + _alternation(_KEYWORD_STYLES) + r')\b')
+_PATTERN_REGEX = re.compile(_alternation(_PATTERN_STYLES))
+_STYLE_AUTOMATON = _build_style_automaton() if AHOCORASICK_AVAILABLE else None
+
+def _is_word_char(char: str) -> bool:
+    """Match the regex definition of a word character used by \\b"""
+    return char.isalnum() or char == "_"
+
+@dataclass
+class TopicSession:
+    """Everything personalized quiz/flashcard generation needs for one user and topic"""
+    learning_style: Dict[str, Any]
+    progress: Any
+    context: str
+    sources: List[str]
 
 class PersonalizationEngine:
     """
@@ -10,25 +211,12 @@ class PersonalizationEngine:
     progress, and detected learning style.
     """
     
-    # Learning style categories
-    LEARNING_STYLES = {
-        "visual": {
-            "keywords": ["see", "view", "look", "watch", "observe", "visual", "picture", "image", "diagram", "chart"],
-            "patterns": ["I see what you mean", "I need to see it", "show me", "looks good", "I can picture that"]
-        },
-        "auditory": {
-            "keywords": ["hear", "listen", "sound", "talk", "discuss", "audio", "noise", "loud", "quiet"],
-            "patterns": ["I hear what you're saying", "sounds good", "let's talk about", "I'm listening", "tell me"]
-        },
-        "reading_writing": {
-            "keywords": ["read", "write", "note", "text", "list", "document", "book", "article", "word"],
-            "patterns": ["let me write that down", "I've read that", "in my notes", "make a list", "write it out"]
-        },
-        "kinesthetic": {
-            "keywords": ["do", "feel", "touch", "practice", "try", "experience", "hands-on", "motion", "action"],
-            "patterns": ["let me try", "I feel like", "hands-on", "let's practice", "I need to experience it"]
-        }
-    }
+    LEARNING_STYLES = LEARNING_STYLES
+    STYLE_ORDER = STYLE_ORDER
+    STYLE_INDEX = STYLE_INDEX
+    
+    # Most recent user text scanned for style indicators; older text adds little signal
+    MAX_STYLE_SCAN_CHARS = 100_000
     
     def __init__(self):
         self.default_style = "reading_writing"  # Default style if no clear preference detected
@@ -45,81 +233,183 @@ class PersonalizationEngine:
         Returns:
             Dict with detected learning style and confidence scores
         """
-        from app.models import models, repository
+        # Styles change slowly; reuse one computed in the last few minutes
+        cached_style = self._get_cached_learning_style(user_id)
+        if cached_style is not None:
+            return cached_style
+        
+        # The profile read, history/activity queries and profile write all block,
+        # so run them off the event loop
+        return await asyncio.to_thread(self._load_learning_style, db, user_id, conversation_history)
+    
+    def _load_learning_style(self, db, user_id: str,
+                             conversation_history: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Return the stored learning style if fresh, otherwise recompute and store it"""
+        from app.models import repository
         
         # Get user profile
         profile = repository.get_user_profile(db, user_id)
-        profile_data = {}
         
-        if profile:
-            # Use existing learning style information if available
-            profile_data = profile.get("study_preferences", {})
-            if profile_data and "learning_style" in profile_data:
-                existing_style = profile_data.get("learning_style", {})
-                if existing_style and existing_style.get("last_updated"):
-                    # Only use if recently updated (last 30 days)
-                    last_updated = datetime.datetime.fromisoformat(existing_style["last_updated"])
-                    if (datetime.datetime.utcnow() - last_updated).days < 30:
-                        return existing_style
-        
-        # Get conversations if not provided
-        if not conversation_history:
-            conversations = db.query(models.Conversation).filter(
-                models.Conversation.user_id == user_id
-            ).order_by(models.Conversation.created_at.desc()).limit(20).all()
+        # Use existing learning style information if recent enough
+        existing_style = self._get_fresh_learning_style(profile)
+        if existing_style:
+            self._cache_learning_style(user_id, existing_style)
+            return existing_style
+        
+        # Score the provided conversation, or the user's recent messages if none was given
+        if conversation_history:
+            text_scores = self._text_style_vector(conversation_history)
+        else:
+            text_scores = self._scan_texts(self._fetch_recent_messages(db, user_id))
+        
+        # Analyze activity patterns; without them the result rests on text alone
+        try:
+            activity_scores = self._analyze_activity_patterns(db, user_id)
+        except ActivityFetchError:
+            activity_scores = None
+        
+        return self._compute_learning_style(db, user_id, profile, text_scores, activity_scores)
+    
+    def _get_cached_learning_style(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a learning style computed recently in this process, if any"""
+        with _style_cache_lock:
+            return _style_cache.get(user_id)
+    
+    def _cache_learning_style(self, user_id: str, learning_style: Dict[str, Any]) -> None:
+        """Remember a learning style for subsequent calls in this process"""
+        with _style_cache_lock:
+            _style_cache[user_id] = learning_style
+    
+    def _get_fresh_learning_style(self, profile: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Return the stored learning style if it was updated in the last 30 days"""
+        if not profile:
+            return None
+        
+        profile_data = profile.get("study_preferences", {})
+        if profile_data and "learning_style" in profile_data:
+            existing_style = profile_data.get("learning_style", {})
+            if not existing_style:
+                return None
             
-            conversation_history = [
-                {"role": "user", "content": conv.message} 
-                for conv in conversations
-            ]
-        
-        # Analyze learning style based on conversation patterns
-        style_scores = self._analyze_text_for_style(conversation_history)
-        
-        # Analyze activity patterns
-        activity_styles = self._analyze_activity_patterns(db, user_id)
-        
-        # Combine both analyses with appropriate weights
-        final_scores = {}
-        # 60% weight to conversation analysis, 40% to activity analysis
-        for style, score in style_scores.items():
-            final_scores[style] = score * 0.6
+            # Epoch timestamp written alongside the ISO string; compare as plain numbers
+            updated_ts = existing_style.get("last_updated_ts")
+            if updated_ts is not None:
+                if time.time() - updated_ts < STYLE_MAX_AGE_SECONDS:
+                    return existing_style
+                return None
             
-        for style, score in activity_styles.items():
-            if style in final_scores:
-                final_scores[style] += score * 0.4
-            else:
-                final_scores[style] = score * 0.4
+            # Styles stored before last_updated_ts existed only have the ISO string
+            if existing_style.get("last_updated"):
+                last_updated = datetime.datetime.fromisoformat(existing_style["last_updated"])
+                if (datetime.datetime.utcnow() - last_updated).total_seconds() < STYLE_MAX_AGE_SECONDS:
+                    return existing_style
+        return None
+    
+    def _fetch_recent_messages(self, db, user_id: str) -> List[Optional[str]]:
+        """Load the text of the user's 20 most recent messages, oldest first"""
+        from app.models import models
+        
+        # Only the user's side is scored, so leave the (much longer) responses in the database
+        messages = db.query(models.Conversation.message).filter(
+            models.Conversation.user_id == user_id
+        ).order_by(models.Conversation.created_at.desc()).limit(20).all()
+        
+        return [message for (message,) in reversed(messages)]
+    
+    def _load_topic_inputs(self, db, user_id: str, topic: str) -> Tuple[Dict[str, Any], Any]:
+        """
+        Load the learning style and topic progress from the database in one go
+        
+        Runs synchronously so callers can push it to a worker thread and overlap
+        it with vector retrieval. Conversation and activity queries are skipped
+        when a cached or stored learning style is still fresh; otherwise the
+        style is recomputed and stored here, off the event loop.
+        
+        Returns:
+            Tuple of (learning style, topic progress record)
+        """
+        from app.models import models, repository
+        
+        profile = None
+        existing_style = self._get_cached_learning_style(user_id)
+        if existing_style is None:
+            profile = repository.get_user_profile(db, user_id)
+            existing_style = self._get_fresh_learning_style(profile)
+            if existing_style:
+                self._cache_learning_style(user_id, existing_style)
+        
+        text_scores, activity_scores = None, None
+        if not existing_style:
+            text_scores = self._scan_texts(self._fetch_recent_messages(db, user_id))
+            try:
+                activity_scores = self._analyze_activity_patterns(db, user_id)
+            except ActivityFetchError:
+                activity_scores = None
+        
+        # Detect learning style; this may commit, so it runs before progress is
+        # loaded to keep the returned record from being expired
+        learning_style = existing_style or self._compute_learning_style(
+            db, user_id, profile, text_scores, activity_scores
+        )
+        
+        progress = db.query(models.ProgressTracking).filter(
+            models.ProgressTracking.user_id == user_id,
+            models.ProgressTracking.topic == topic
+        ).first()
+        
+        return learning_style, progress
+    
+    def _compute_learning_style(self, db, user_id: str, profile: Optional[Dict[str, Any]],
+                                text_scores: np.ndarray, activity_scores: Optional[np.ndarray]) -> Dict[str, Any]:
+        """
+        Combine text and activity scores into a learning style and store it on the profile
+        
+        If activity_scores is None (the activity queries failed) the style is
+        derived from text alone and neither stored nor cached, so a transient
+        database problem does not overwrite a good stored style.
+        """
+        from app.models import repository
+        
+        profile_data = profile.get("study_preferences", {}) if profile else {}
+        
+        activity_loaded = activity_scores is not None
+        if not activity_loaded:
+            activity_scores = np.zeros(len(self.STYLE_ORDER))
+        
+        # Weighted blend of conversation analysis and activity analysis
+        final_scores = text_scores * TEXT_WEIGHT + activity_scores * ACTIVITY_WEIGHT
         
         # Normalize scores
-        total = sum(final_scores.values()) if sum(final_scores.values()) > 0 else 1
-        normalized_scores = {style: score/total for style, score in final_scores.items()}
+        normalized = final_scores / (float(final_scores.sum()) or 1.0)
         
-        # Get primary and secondary styles
-        sorted_styles = sorted(normalized_scores.items(), key=lambda x: x[1], reverse=True)
-        primary_style = sorted_styles[0][0] if sorted_styles else self.default_style
-        secondary_style = sorted_styles[1][0] if len(sorted_styles) > 1 else None
+        # Get primary and secondary styles (stable, so ties keep STYLE_ORDER)
+        order = np.argsort(-normalized, kind="stable")
+        primary_style = self.STYLE_ORDER[order[0]]
+        secondary_style = self.STYLE_ORDER[order[1]]
         
         # Clear confidence - how strong is the primary vs others
-        if len(sorted_styles) > 1:
-            primary_confidence = sorted_styles[0][1] - sorted_styles[1][1]
-        else:
-            primary_confidence = 1.0
+        primary_confidence = float(normalized[order[0]] - normalized[order[1]])
+        normalized_scores = dict(zip(self.STYLE_ORDER, normalized.tolist()))
             
         result = {
             "primary_style": primary_style,
             "secondary_style": secondary_style,
             "confidence": primary_confidence,
             "scores": normalized_scores,
-            "last_updated": datetime.datetime.utcnow().isoformat()
+            "last_updated": datetime.datetime.utcnow().isoformat(),
+            "last_updated_ts": time.time()
         }
         
+        if not activity_loaded:
+            return result
+        
         # Update user profile with learning style
         if profile:
             preferences = profile_data or {}
             preferences["learning_style"] = result
             repository.update_user_profile(db, user_id, {"study_preferences": preferences})
         
+        self._cache_learning_style(user_id, result)
         return result
     
     def _analyze_text_for_style(self, conversation_history: List[Dict[str, Any]]) -> Dict[str, float]:
@@ -127,41 +417,125 @@ class PersonalizationEngine:
         Analyze conversation text for learning style indicators
         
         Args:
-            conversation_history: List of conversation entries
+            conversation_history: List of conversation entries, oldest first
             
         Returns:
             Dict with scores for each learning style
         """
-        style_scores = {style: 0 for style in self.LEARNING_STYLES.keys()}
+        return dict(zip(self.STYLE_ORDER, self._text_style_vector(conversation_history).tolist()))
+    
+    def _text_style_vector(self, conversation_history: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Score the user messages of a conversation for learning style indicators
         
-        if not conversation_history:
-            return style_scores
+        Args:
+            conversation_history: List of conversation entries, oldest first
             
-        # Combine all user messages
-        all_text = " ".join([
-            entry["content"].lower() 
-            for entry in conversation_history 
-            if entry.get("role") == "user" and entry.get("content")
+        Returns:
+            Array of scores indexed like STYLE_ORDER
+        """
+        return self._scan_texts([
+            entry.get("content") for entry in conversation_history if entry.get("role") == "user"
         ])
+    
+    def _scan_texts(self, texts: List[Optional[str]]) -> np.ndarray:
+        """
+        Score raw user message texts for learning style indicators
+        
+        Only the most recent MAX_STYLE_SCAN_CHARS characters are scanned.
         
-        # Count keyword occurrences
-        for style, indicators in self.LEARNING_STYLES.items():
-            # Check keywords
-            for keyword in indicators["keywords"]:
-                # Count word occurrences with word boundaries
-                pattern = r'\b' + re.escape(keyword) + r'\b'
-                matches = re.findall(pattern, all_text)
-                style_scores[style] += len(matches)
+        Args:
+            texts: Message texts, oldest first; empty entries are ignored
             
-            # Check patterns (phrases)
-            for pattern in indicators["patterns"]:
-                if pattern.lower() in all_text:
-                    # Patterns get higher weight than single keywords
-                    style_scores[style] += 2
+        Returns:
+            Array of scores indexed like STYLE_ORDER
+        """
+        # Combine messages newest-first until the character budget is spent
+        recent_texts = []
+        remaining = self.MAX_STYLE_SCAN_CHARS
+        for text in reversed(texts):
+            if not text:
+                continue
+            recent_texts.append(text[-remaining:])
+            remaining -= len(text)
+            if remaining <= 0:
+                break
+        
+        if not recent_texts:
+            return np.zeros(len(self.STYLE_ORDER))
+        
+        recent_texts.reverse()
+        all_text = " ".join(recent_texts).lower()
+        
+        if AHOCORASICK_AVAILABLE:
+            return self._score_text_with_automaton(all_text)
+        
+        # One scan for all keywords, streamed straight into the per-style tally
+        keyword_styles = chain.from_iterable(
+            _KEYWORD_STYLES[match.group()] for match in _KEYWORD_REGEX.finditer(all_text)
+        )
+        scores = np.bincount(np.fromiter(keyword_styles, dtype=np.intp), minlength=len(self.STYLE_ORDER))
+        scores = scores.astype(np.float64)
+        
+        # Patterns (phrases) get higher weight than single keywords
+        for pattern in {match.group() for match in _PATTERN_REGEX.finditer(all_text)}:
+            for style_idx in _PATTERN_STYLES[pattern]:
+                scores[style_idx] += 2
+        
+        return scores
+    
+    def _score_text_with_automaton(self, all_text: str) -> np.ndarray:
+        """
+        Score keywords and patterns in a single pass over the text
+        
+        Keywords count once per whole-word occurrence; each pattern (phrase)
+        adds 2 the first time it appears, matching the regex-based scoring.
+        """
+        style_scores = np.zeros(len(self.STYLE_ORDER))
+        text_length = len(all_text)
+        matched_patterns = set()
+        
+        for end, (term, entries) in _STYLE_AUTOMATON.iter(all_text):
+            start = end - len(term) + 1
+            whole_word = (
+                (start == 0 or not _is_word_char(all_text[start - 1])) and
+                (end + 1 == text_length or not _is_word_char(all_text[end + 1]))
+            )
+            for style_idx, is_pattern in entries:
+                if is_pattern:
+                    if (style_idx, term) not in matched_patterns:
+                        matched_patterns.add((style_idx, term))
+                        # Patterns get higher weight than single keywords
+                        style_scores[style_idx] += 2
+                elif whole_word:
+                    style_scores[style_idx] += 1
         
         return style_scores
     
-    def _analyze_activity_patterns(self, db, user_id: str) -> Dict[str, float]:
+    def _fetch_activity_counts(self, db, user_id: str) -> Tuple[int, int, int]:
+        """
+        Count a user's quiz attempts, flashcard reviews and conversations
+        
+        The three COUNT(*) aggregates run as scalar subqueries of a single
+        SELECT, so only three integers come back in one round trip.
+        """
+        from sqlalchemy import func
+        from app.models import models
+        
+        quiz_count = db.query(func.count(models.QuizAttempt.id)).filter(
+            models.QuizAttempt.user_id == user_id
+        ).scalar_subquery()
+        flashcard_count = db.query(func.count(models.FlashcardReview.id)).filter(
+            models.FlashcardReview.user_id == user_id
+        ).scalar_subquery()
+        conversation_count = db.query(func.count(models.Conversation.id)).filter(
+            models.Conversation.user_id == user_id
+        ).scalar_subquery()
+        
+        counts = db.query(quiz_count, flashcard_count, conversation_count).one()
+        return tuple(count or 0 for count in counts)
+    
+    def _analyze_activity_patterns(self, db, user_id: str) -> np.ndarray:
         """
         Analyze user activity patterns for learning style indicators
         
@@ -170,87 +544,51 @@ class PersonalizationEngine:
             user_id: User ID
             
         Returns:
-            Dict with scores for each learning style
+            Array of scores indexed like STYLE_ORDER
+            
+        Raises:
+            ActivityFetchError: If the activity counts could not be loaded
         """
-        from app.models import models
-        
-        style_scores = {style: 0 for style in self.LEARNING_STYLES.keys()}
-        
         try:
-            # Analyze quiz attempts (favors reading/writing)
-            quiz_attempts = db.query(models.QuizAttempt).filter(
-                models.QuizAttempt.user_id == user_id
-            ).all()
-            style_scores["reading_writing"] += len(quiz_attempts) * 0.5
-            
-            # Analyze flashcard reviews (favors visual and reading/writing)
-            flashcard_reviews = db.query(models.FlashcardReview).filter(
-                models.FlashcardReview.user_id == user_id
-            ).all()
-            style_scores["visual"] += len(flashcard_reviews) * 0.3
-            style_scores["reading_writing"] += len(flashcard_reviews) * 0.2
-            
-            # Analyze conversation history (favors auditory)
-            conversations = db.query(models.Conversation).filter(
-                models.Conversation.user_id == user_id
-            ).all()
-            style_scores["auditory"] += len(conversations) * 0.4
-            
-            # Look for patterns in time spent on different activities
-            # (Would need more data to implement fully)
+            activity_counts = self._fetch_activity_counts(db, user_id)
+        except SQLAlchemyError as e:
+            logger.warning("Activity pattern query failed for user %s", user_id, exc_info=True)
+            raise ActivityFetchError(f"Could not load activity for user {user_id}") from e
+        
+        # Each activity contributes its row of ACTIVITY_WEIGHTS per occurrence
+        style_scores = np.array(activity_counts, dtype=np.float64) @ ACTIVITY_WEIGHTS
         
-        except Exception as e:
-            print(f"Error analyzing activity patterns: {e}")
+        # Look for patterns in time spent on different activities
+        # (Would need more data to implement fully)
         
         return style_scores
     
-    async def adapt_content_for_style(self, content: Dict[str, Any], learning_style: Dict[str, Any]) -> Dict[str, Any]:
+    async def adapt_content_for_style(self, content: Dict[str, Any], learning_style: Dict[str, Any],
+                                      in_place: bool = False) -> Dict[str, Any]:
         """
         Adapt learning content based on detected learning style
         
         Args:
             content: Original content to adapt
             learning_style: Learning style information
+            in_place: Add the style keys to content itself instead of a copy;
+                use when the original is not needed afterwards (e.g. it is
+                serialized straight into a response)
             
         Returns:
             Adapted content with style-specific enhancements
         """
         primary_style = learning_style.get("primary_style", self.default_style)
-        adapted_content = dict(content)  # Make a copy
+        adapted_content = content if in_place else dict(content)
         
         # Add style-specific enhancements
-        if primary_style == "visual":
-            adapted_content["presentation_hints"] = [
-                "Include diagrams where possible",
-                "Use visual metaphors to explain concepts",
-                "Incorporate charts and graphs for data",
-                "Use color coding for important information"
-            ]
-        elif primary_style == "auditory":
-            adapted_content["presentation_hints"] = [
-                "Suggest reading explanations aloud",
-                "Include discussion questions",
-                "Use auditory metaphors and sound-based examples",
-                "Suggest verbal mnemonics for memorization"
-            ]
-        elif primary_style == "reading_writing":
-            adapted_content["presentation_hints"] = [
-                "Provide detailed written explanations",
-                "Include suggested note-taking strategies",
-                "Present information in lists and structured formats",
-                "Include suggested reading materials"
-            ]
-        elif primary_style == "kinesthetic":
-            adapted_content["presentation_hints"] = [
-                "Include hands-on exercises to try",
-                "Suggest practical applications of concepts",
-                "Break learning into active steps",
-                "Use physical metaphors and examples"
-            ]
+        hints = PRESENTATION_HINTS.get(primary_style)
+        if hints:
+            adapted_content["presentation_hints"] = list(hints)
         
         # Add a style-based difficulty adjustment (example of dynamic difficulty)
         confidence = learning_style.get("confidence", 0.5)
-        if confidence > 0.7:
+        if confidence > STRONG_STYLE_CONFIDENCE:
             # Strong style preference - tailor strongly
             adapted_content["style_weight"] = "strong"
         else:
@@ -262,9 +600,41 @@ class PersonalizationEngine:
             
         return adapted_content
     
+    async def prepare_topic_session(self, db, user_id: str, topic: str, vector_client=None) -> TopicSession:
+        """
+        Load the learning style, topic progress and topic context for a user
+        
+        Callers generating both a quiz and flashcards for the same topic can
+        prepare this once and pass it to both, so the vector store is queried
+        only once.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            topic: Topic to retrieve context for
+            vector_client: Vector store client
+            
+        Returns:
+            TopicSession with learning style, progress record, context and sources
+        """
+        from app.utils.context_retrieval import retrieve_topic_context
+        
+        # Load the learning style and progress in a worker thread while the vector store is queried
+        (learning_style, progress), context_result = await asyncio.gather(
+            asyncio.to_thread(self._load_topic_inputs, db, user_id, topic),
+            retrieve_topic_context(vector_client, topic, min_chunks=8, max_chunks=15)
+        )
+        
+        return TopicSession(
+            learning_style=learning_style,
+            progress=progress,
+            context=context_result["context"],
+            sources=context_result["sources"]
+        )
+    
     async def generate_personalized_quiz(self, db, user_id: str, topic: str, 
                                       quiz_generator=None, vector_client=None, 
-                                      processor=None) -> Dict[str, Any]:
+                                      processor=None, topic_session: Optional[TopicSession] = None) -> Dict[str, Any]:
         """
         Generate a personalized quiz based on user's learning style and progress
         
@@ -275,45 +645,34 @@ class PersonalizationEngine:
             quiz_generator: QuizGenerator instance
             vector_client: Vector store client
             processor: Message processor
+            topic_session: Result of prepare_topic_session to reuse; loaded if omitted
             
         Returns:
             Personalized quiz with style-specific enhancements
         """
-        from app.models import repository, models
-        from app.utils.context_retrieval import retrieve_topic_context
+        from app.models import repository
         
-        # Detect learning style
-        learning_style = await self.analyze_learning_style(db, user_id)
-        primary_style = learning_style.get("primary_style", self.default_style)
+        if topic_session is None:
+            topic_session = await self.prepare_topic_session(db, user_id, topic, vector_client)
         
-        # Get progress data to adjust difficulty
-        progress = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id,
-            models.ProgressTracking.topic == topic
-        ).first()
+        learning_style = topic_session.learning_style
+        progress = topic_session.progress
+        primary_style = learning_style.get("primary_style", self.default_style)
         
         # Set difficulty based on proficiency
         difficulty = "medium"  # Default
         num_questions = 5  # Default
         
         if progress:
-            if progress.proficiency < 0.3:
+            if progress.proficiency < LOW_PROFICIENCY:
                 difficulty = "easy"
                 num_questions = 3  # Fewer questions for beginners
-            elif progress.proficiency > 0.7:
+            elif progress.proficiency > HIGH_PROFICIENCY:
                 difficulty = "hard"
                 num_questions = 7  # More questions for advanced users
         
-        # Get context for the quiz
-        context_result = await retrieve_topic_context(
-            vector_client, 
-            topic, 
-            min_chunks=8,
-            max_chunks=15
-        )
-        
-        context = context_result["context"]
-        context_sources = context_result["sources"]
+        context = topic_session.context
+        context_sources = topic_session.sources
         
         if not context:
             return {"error": "Could not find relevant content for quiz generation"}
@@ -333,15 +692,10 @@ class PersonalizationEngine:
             
         # Enhance quiz for learning style
         # Add learning style hints to each question
-        for question in quiz_result["questions"]:
-            if primary_style == "visual":
-                question["style_hint"] = "Try to visualize the concept in your mind."
-            elif primary_style == "auditory":
-                question["style_hint"] = "Try reading the question aloud to yourself."
-            elif primary_style == "reading_writing":
-                question["style_hint"] = "Consider writing down key points before answering."
-            elif primary_style == "kinesthetic":
-                question["style_hint"] = "Think about how you would apply this concept practically."
+        style_hint = QUESTION_STYLE_HINTS.get(primary_style)
+        if style_hint:
+            for question in quiz_result["questions"]:
+                question["style_hint"] = style_hint
         
         # Add personalization metadata
         quiz_result["metadata"]["personalized"] = True
@@ -363,7 +717,7 @@ class PersonalizationEngine:
     
     async def generate_personalized_flashcards(self, db, user_id: str, topic: str,
                                            flashcard_generator=None, vector_client=None,
-                                           processor=None) -> Dict[str, Any]:
+                                           processor=None, topic_session: Optional[TopicSession] = None) -> Dict[str, Any]:
         """
         Generate personalized flashcards based on user's learning style and progress
         
@@ -374,42 +728,31 @@ class PersonalizationEngine:
             flashcard_generator: FlashcardGenerator instance
             vector_client: Vector store client
             processor: Message processor
+            topic_session: Result of prepare_topic_session to reuse; loaded if omitted
             
         Returns:
             Personalized flashcards with style-specific enhancements
         """
-        from app.models import repository, models
-        from app.utils.context_retrieval import retrieve_topic_context
+        from app.models import repository
         
-        # Detect learning style
-        learning_style = await self.analyze_learning_style(db, user_id)
-        primary_style = learning_style.get("primary_style", self.default_style)
+        if topic_session is None:
+            topic_session = await self.prepare_topic_session(db, user_id, topic, vector_client)
         
-        # Get progress data
-        progress = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id,
-            models.ProgressTracking.topic == topic
-        ).first()
+        learning_style = topic_session.learning_style
+        progress = topic_session.progress
+        primary_style = learning_style.get("primary_style", self.default_style)
         
         # Adjust number of flashcards based on proficiency
         num_cards = 8  # Default
         
         if progress:
-            if progress.proficiency < 0.3:
+            if progress.proficiency < LOW_PROFICIENCY:
                 num_cards = 5  # Fewer cards for beginners
-            elif progress.proficiency > 0.7:
+            elif progress.proficiency > HIGH_PROFICIENCY:
                 num_cards = 10  # More cards for advanced users
         
-        # Get context for the flashcards
-        context_result = await retrieve_topic_context(
-            vector_client, 
-            topic, 
-            min_chunks=8,
-            max_chunks=15
-        )
-        
-        context = context_result["context"]
-        context_sources = context_result["sources"]
+        context = topic_session.context
+        context_sources = topic_session.sources
         
         if not context:
             return {"error": "Could not find relevant content for flashcard generation"}
@@ -427,15 +770,10 @@ class PersonalizationEngine:
             return flashcard_result
             
         # Enhance flashcards for learning style
-        for card in flashcard_result["cards"]:
-            if primary_style == "visual":
-                card["style_hint"] = "Visualize an image representing this concept."
-            elif primary_style == "auditory":
-                card["style_hint"] = "Read the card aloud and discuss the concept."
-            elif primary_style == "reading_writing":
-                card["style_hint"] = "Write a summary in your own words after reviewing."
-            elif primary_style == "kinesthetic":
-                card["style_hint"] = "Think of a real-world example where you'd apply this."
+        style_hint = FLASHCARD_STYLE_HINTS.get(primary_style)
+        if style_hint:
+            for card in flashcard_result["cards"]:
+                card["style_hint"] = style_hint
         
         # Add personalization metadata
         flashcard_result["metadata"]["personalized"] = True
@@ -471,22 +809,7 @@ class PersonalizationEngine:
         primary_style = learning_style.get("primary_style", self.default_style)
         
         # Adapt response based on learning style
-        if primary_style == "visual":
-            # Add visual-oriented suggestions
-            enhanced = response + "\n\nVisualization tip: Try creating a mental image or diagram to represent this concept."
-        elif primary_style == "auditory":
-            # Add auditory-oriented suggestions
-            enhanced = response + "\n\nAuditory tip: Try explaining this concept aloud to solidify your understanding."
-        elif primary_style == "reading_writing":
-            # Add reading/writing-oriented suggestions
-            enhanced = response + "\n\nReading/writing tip: Take a moment to write down the key points from this explanation."
-        elif primary_style == "kinesthetic":
-            # Add kinesthetic-oriented suggestions
-            enhanced = response + "\n\nHands-on tip: Think about a practical example where you could apply this concept."
-        else:
-            enhanced = response
-            
-        return enhanced
+        return response + TUTORING_TIPS.get(primary_style, "")
     
     def get_learning_style_strategies(self, learning_style: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -500,38 +823,9 @@ class PersonalizationEngine:
         """
         primary_style = learning_style.get("primary_style", self.default_style)
         
-        strategies = {
-            "visual": [
-                "Use colored highlighters in your notes",
-                "Create mind maps for complex topics",
-                "Draw diagrams to represent concepts",
-                "Watch video explanations when available",
-                "Use flashcards with images or symbols"
-            ],
-            "auditory": [
-                "Record and listen to your notes",
-                "Discuss topics with study partners",
-                "Read important material aloud",
-                "Use verbal repetition for memorization",
-                "Create musical mnemonics for key concepts"
-            ],
-            "reading_writing": [
-                "Take detailed notes during study sessions",
-                "Rewrite key concepts in your own words",
-                "Create outlines and structured study guides",
-                "Use written repetition for memorization",
-                "Summarize what you've learned after each session"
-            ],
-            "kinesthetic": [
-                "Take breaks for physical movement",
-                "Use physical objects to represent concepts",
-                "Act out processes or sequences",
-                "Apply concepts to real-world scenarios",
-                "Study while standing or moving around"
-            ]
-        }
+        strategies = STUDY_STRATEGIES.get(primary_style, STUDY_STRATEGIES["reading_writing"])
         
         return {
             "primary_style": primary_style,
-            "recommended_strategies": strategies.get(primary_style, strategies["reading_writing"])
-        }
\ No newline at end of file
+            "recommended_strategies": list(strategies)
+        }
@@ -2,15 +2,45 @@
 from typing import Dict, Any, List
 import datetime
 
+# How strongly one activity's performance moves a topic's proficiency
+ACTIVITY_WEIGHTS = {
+    "quiz": 0.7,
+    "flashcard": 0.5,
+    "chat": 0.3
+}
+
+def _blend_progress(current_proficiency: float, current_confidence: float, activity_type: str,
+                    performance: float, confidence: float = None):
+    """Blend one activity result into stored proficiency and confidence"""
+    activity_weight = ACTIVITY_WEIGHTS.get(activity_type, 0.5)
+    updated_proficiency = (performance * activity_weight) + (current_proficiency * (1 - activity_weight))
+    
+    if confidence is not None:
+        updated_confidence = (confidence * 0.6) + (current_confidence * 0.4)
+    elif updated_proficiency > current_proficiency:
+        updated_confidence = min(1.0, current_confidence + 0.1)
+    else:
+        updated_confidence = max(0.1, current_confidence - 0.05)
+    
+    return updated_proficiency, updated_confidence
+
+def _utcnow() -> datetime.datetime:
+    """Current UTC time as a naive datetime, matching the stored timestamp columns"""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
 class ProgressTracker:
     """Tracks student progress across learning activities"""
     
     def update_topic_progress(self, db, user_id: str, topic: str, 
                              activity_type: str, performance: float, 
-                             confidence: float = None):
+                             confidence: float = None, now: datetime.datetime = None):
         """
         Update student progress for a topic
         
+        Inserts the record or blends the new performance into the existing one
+        with a single INSERT ... ON CONFLICT DO UPDATE, so concurrent updates
+        for the same topic cannot race between a read and a write.
+        
         Args:
             db: Database session
             user_id: User ID
@@ -18,72 +48,146 @@ class ProgressTracker:
             activity_type: Type of activity (quiz, flashcard, chat)
             performance: Score between 0-1 representing performance
             confidence: Optional self-reported confidence between 0-1
+            now: Interaction time (naive UTC); defaults to the current time
         
         Returns:
             Updated progress record
         """
-        from app.models import repository, models
+        from sqlalchemy import case, func
+        from sqlalchemy.dialects.sqlite import insert
+        from app.models import models
         
-        # Get existing progress
-        progress = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id,
-            models.ProgressTracking.topic == topic
-        ).first()
+        progress_table = models.ProgressTracking
+        if now is None:
+            now = _utcnow()
         
-        now = datetime.datetime.utcnow()
+        # Weight the new performance based on activity type
+        activity_weight = ACTIVITY_WEIGHTS.get(activity_type, 0.5)
         
-        if progress:
-            # Update existing progress
-            current_proficiency = progress.proficiency
-            
-            # Weight the new performance based on activity type
-            weights = {
-                "quiz": 0.7,
-                "flashcard": 0.5,
-                "chat": 0.3
-            }
-            activity_weight = weights.get(activity_type, 0.5)
-            
-            # Calculate new weighted proficiency
-            updated_proficiency = (performance * activity_weight) + (current_proficiency * (1 - activity_weight))
-            
-            # Update confidence if provided, otherwise use a heuristic
-            if confidence is not None:
-                updated_confidence = (confidence * 0.6) + (progress.confidence * 0.4)
-            else:
-                # If proficiency improved, slightly increase confidence
-                if updated_proficiency > current_proficiency:
-                    updated_confidence = min(1.0, progress.confidence + 0.1)
-                else:
-                    updated_confidence = max(0.1, progress.confidence - 0.05)
-            
-            progress.proficiency = updated_proficiency
-            progress.confidence = updated_confidence
-            progress.last_interaction = now
-            progress.interaction_type = activity_type
-            
-            db.commit()
-            db.refresh(progress)
-            return progress
+        # Calculate new weighted proficiency from the stored value
+        updated_proficiency = (performance * activity_weight) + (progress_table.proficiency * (1 - activity_weight))
+        
+        # Update confidence if provided, otherwise use a heuristic
+        if confidence is not None:
+            updated_confidence = (confidence * 0.6) + (progress_table.confidence * 0.4)
         else:
-            # Create new progress record
-            if confidence is None:
-                confidence = 0.5  # Default starting confidence
-                
-            new_progress = models.ProgressTracking(
-                user_id=user_id,
-                topic=topic,
-                proficiency=performance,
-                confidence=confidence,
-                interaction_type=activity_type
+            # If proficiency improved, slightly increase confidence
+            updated_confidence = case(
+                (updated_proficiency > progress_table.proficiency, func.min(1.0, progress_table.confidence + 0.1)),
+                else_=func.max(0.1, progress_table.confidence - 0.05)
+            )
+        
+        stmt = insert(progress_table).values(
+            user_id=user_id,
+            topic=topic,
+            proficiency=performance,
+            confidence=confidence if confidence is not None else 0.5,  # Default starting confidence
+            last_interaction=now,
+            interaction_type=activity_type
+        ).on_conflict_do_update(
+            index_elements=[progress_table.user_id, progress_table.topic],
+            set_={
+                "proficiency": updated_proficiency,
+                "confidence": updated_confidence,
+                "last_interaction": now,
+                "interaction_type": activity_type
+            }
+        ).returning(progress_table)
+        
+        progress = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+        db.commit()
+        return progress
+    
+    def bulk_update_topic_progress(self, db, user_id: str, updates: List[Dict[str, Any]],
+                                   now: datetime.datetime = None):
+        """
+        Apply several progress updates for one user in a single transaction
+        
+        Existing records are loaded with one query, the same blending rules as
+        update_topic_progress are applied in Python (in order, so repeated
+        topics compound), and the results are written with one bulk update,
+        one bulk insert and one commit.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            updates: Dicts with topic, activity_type, performance and optional confidence
+            now: Interaction time (naive UTC) for every update; defaults to the current time
+        
+        Returns:
+            Dict mapping each topic to its updated proficiency and confidence
+        """
+        from app.models import models
+        
+        if not updates:
+            return {}
+        
+        if now is None:
+            now = _utcnow()
+        topics = {update["topic"] for update in updates}
+        
+        existing = {
+            record.topic: {
+                "id": record.id,
+                "proficiency": record.proficiency,
+                "confidence": record.confidence
+            }
+            for record in db.query(
+                models.ProgressTracking.id,
+                models.ProgressTracking.topic,
+                models.ProgressTracking.proficiency,
+                models.ProgressTracking.confidence
+            ).filter(
+                models.ProgressTracking.user_id == user_id,
+                models.ProgressTracking.topic.in_(topics)
             )
+        }
+        
+        pending_updates = {}
+        pending_inserts = {}
+        for update in updates:
+            topic = update["topic"]
+            activity_type = update["activity_type"]
+            performance = update["performance"]
+            confidence = update.get("confidence")
             
-            db.add(new_progress)
-            db.commit()
-            db.refresh(new_progress)
-            return new_progress
+            current = pending_updates.get(topic) or pending_inserts.get(topic) or existing.get(topic)
+            if current:
+                proficiency, confidence = _blend_progress(
+                    current["proficiency"], current["confidence"], activity_type, performance, confidence
+                )
+                target = pending_inserts if topic in pending_inserts else pending_updates
+                target[topic] = {
+                    **current,
+                    "proficiency": proficiency,
+                    "confidence": confidence,
+                    "last_interaction": now,
+                    "interaction_type": activity_type
+                }
+            else:
+                pending_inserts[topic] = {
+                    "id": models.generate_uuid(),
+                    "user_id": user_id,
+                    "topic": topic,
+                    "proficiency": performance,
+                    "confidence": confidence if confidence is not None else 0.5,  # Default starting confidence
+                    "last_interaction": now,
+                    "interaction_type": activity_type
+                }
+        
+        if pending_updates:
+            db.bulk_update_mappings(models.ProgressTracking, list(pending_updates.values()))
+        if pending_inserts:
+            db.bulk_insert_mappings(models.ProgressTracking, list(pending_inserts.values()))
+        db.commit()
+        
+        return {
+            topic: {"proficiency": values["proficiency"], "confidence": values["confidence"]}
+            for topic, values in {**pending_updates, **pending_inserts}.items()
+        }
     
-    def get_student_progress(self, db, user_id: str, topics: List[str] = None):
+    def get_student_progress(self, db, user_id: str, topics: List[str] = None,
+                             include_topics: bool = True):
         """
         Get progress summary for a student
         
@@ -91,35 +195,62 @@ class ProgressTracker:
             db: Database session
             user_id: User ID
             topics: Optional list of topics to filter by
+            include_topics: Include the per-topic breakdown; when False only the
+                overall averages are computed, in the database
             
         Returns:
             Dict with progress summary
         """
+        from sqlalchemy import func
         from app.models import repository, models
         
-        query = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id
-        )
-        
+        filters = [models.ProgressTracking.user_id == user_id]
         if topics:
-            query = query.filter(models.ProgressTracking.topic.in_(topics))
+            filters.append(models.ProgressTracking.topic.in_(topics))
         
-        progress_records = query.all()
+        if not include_topics:
+            # Let the database aggregate instead of loading every record
+            avg_proficiency, avg_confidence, topics_count = db.query(
+                func.avg(models.ProgressTracking.proficiency),
+                func.avg(models.ProgressTracking.confidence),
+                func.count(models.ProgressTracking.topic.distinct())
+            ).filter(*filters).one()
+            
+            return {
+                "user_id": user_id,
+                "overall_proficiency": avg_proficiency or 0,
+                "overall_confidence": avg_confidence or 0,
+                "topics": {},
+                "topics_count": topics_count
+            }
         
-        # Calculate average proficiency and confidence
-        avg_proficiency = sum([p.proficiency for p in progress_records]) / len(progress_records) if progress_records else 0
-        avg_confidence = sum([p.confidence for p in progress_records]) / len(progress_records) if progress_records else 0
+        # Select plain column rows; nothing here needs full ORM instances
+        progress_table = models.ProgressTracking
+        progress_records = db.query(
+            progress_table.topic,
+            progress_table.proficiency,
+            progress_table.confidence,
+            progress_table.last_interaction,
+            progress_table.interaction_type
+        ).filter(*filters).all()
         
-        # Organize by topic
+        # Organize by topic while totalling proficiency and confidence
+        proficiency_sum = confidence_sum = 0.0
         topics_progress = {}
-        for record in progress_records:
-            topics_progress[record.topic] = {
-                "proficiency": record.proficiency,
-                "confidence": record.confidence,
-                "last_interaction": record.last_interaction.isoformat(),
-                "interaction_type": record.interaction_type
+        for topic, proficiency, confidence, last_interaction, interaction_type in progress_records:
+            proficiency_sum += proficiency
+            confidence_sum += confidence
+            topics_progress[topic] = {
+                "proficiency": proficiency,
+                "confidence": confidence,
+                "last_interaction": last_interaction.isoformat(),
+                "interaction_type": interaction_type
             }
         
+        # Calculate average proficiency and confidence
+        avg_proficiency = proficiency_sum / len(progress_records) if progress_records else 0
+        avg_confidence = confidence_sum / len(progress_records) if progress_records else 0
+        
         return {
             "user_id": user_id,
             "overall_proficiency": avg_proficiency,
@@ -141,13 +272,33 @@ class ProgressTracker:
         """
         from app.models import repository, models
         
-        # Get all progress records
-        progress_records = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id
-        ).all()
+        progress_table = models.ProgressTracking
+        user_filter = progress_table.user_id == user_id
+        
+        # Get up to three topics with low proficiency, weakest first
+        weak_topics = [topic for (topic,) in db.query(progress_table.topic).filter(
+            user_filter,
+            progress_table.proficiency < 0.7
+        ).order_by(progress_table.proficiency).limit(3)]
+        
+        # Get topics with high confidence but low proficiency (potential overconfidence)
+        overconfident_topics = [topic for (topic,) in db.query(progress_table.topic).filter(
+            user_filter,
+            progress_table.confidence > 0.7,
+            progress_table.proficiency < 0.6
+        )]
+        
+        # Get topics not reviewed recently (more than 7 days)
+        one_week_ago = _utcnow() - datetime.timedelta(days=7)
+        stale_topics = [topic for (topic,) in db.query(progress_table.topic).filter(
+            user_filter,
+            progress_table.last_interaction < one_week_ago
+        )]
         
         # No recommendations if no progress data
-        if not progress_records:
+        has_progress = bool(weak_topics or overconfident_topics or stale_topics) or \
+            db.query(progress_table.id).filter(user_filter).first() is not None
+        if not has_progress:
             return {
                 "recommendations": [
                     "Start by taking a quiz or reviewing flashcards to build your progress profile."
@@ -155,50 +306,36 @@ class ProgressTracker:
                 "focus_topics": []
             }
         
-        # Sort topics by proficiency (ascending)
-        sorted_by_proficiency = sorted(progress_records, key=lambda p: p.proficiency)
-        
-        # Get topics with low proficiency
-        weak_topics = [p.topic for p in sorted_by_proficiency[:3] if p.proficiency < 0.7]
-        
-        # Get topics with high confidence but low proficiency (potential overconfidence)
-        overconfident_topics = [
-            p.topic for p in progress_records
-            if p.confidence > 0.7 and p.proficiency < 0.6
-        ]
-        
-        # Get topics not reviewed recently (more than 7 days)
-        one_week_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
-        stale_topics = [
-            p.topic for p in progress_records
-            if p.last_interaction < one_week_ago
-        ]
-        
         # Generate recommendations
         recommendations = []
         
         if weak_topics:
-            weak_topics_str = ", ".join(weak_topics)
-            recommendations.append(f"Focus on improving your understanding of: {weak_topics_str}")
-            recommendations.append("Try using the tutoring mode to get a deeper explanation of these concepts.")
+            recommendations.extend((
+                f"Focus on improving your understanding of: {', '.join(weak_topics)}",
+                "Try using the tutoring mode to get a deeper explanation of these concepts."
+            ))
         
         if overconfident_topics:
-            overconfident_topics_str = ", ".join(overconfident_topics)
-            recommendations.append(f"You may need to reassess your understanding of: {overconfident_topics_str}")
-            recommendations.append("Consider taking a more challenging quiz on these topics.")
+            recommendations.extend((
+                f"You may need to reassess your understanding of: {', '.join(overconfident_topics)}",
+                "Consider taking a more challenging quiz on these topics."
+            ))
         
         if stale_topics:
-            stale_topics_str = ", ".join(stale_topics)
-            recommendations.append(f"It's time to review these topics to reinforce your memory: {stale_topics_str}")
-            recommendations.append("Review your flashcards for these topics to maintain your knowledge.")
+            recommendations.extend((
+                f"It's time to review these topics to reinforce your memory: {', '.join(stale_topics)}",
+                "Review your flashcards for these topics to maintain your knowledge."
+            ))
         
         # Add a general recommendation if list is empty
         if not recommendations:
-            recommendations.append("You're making good progress! Continue with regular review sessions.")
-            recommendations.append("Try exploring new topics to expand your knowledge.")
+            recommendations.extend((
+                "You're making good progress! Continue with regular review sessions.",
+                "Try exploring new topics to expand your knowledge."
+            ))
         
         return {
             "recommendations": recommendations,
-            "focus_topics": weak_topics + overconfident_topics,
+            "focus_topics": [*weak_topics, *overconfident_topics],
             "review_topics": stale_topics
         }
\ No newline at end of file
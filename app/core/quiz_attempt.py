@@ -23,24 +23,28 @@ class QuizScorer:
         total_questions = len(questions)
         correct_count = 0
         question_results = []
+        missed_questions = []
         
         for question in questions:
             q_id = question["id"]
-            is_correct = False
-            user_answer = user_answers.get(q_id, None)
+            correct_answer = question["correct_answer"]
+            user_answer = user_answers.get(q_id)
             
-            if user_answer and user_answer == question["correct_answer"]:
-                correct_count += 1
-                is_correct = True
+            # An unanswered question (None) never equals the correct answer
+            is_correct = user_answer == correct_answer
+            correct_count += is_correct
             
             # Add result for this question
-            question_results.append({
+            result = {
                 "question_id": q_id,
                 "correct": is_correct,
                 "user_answer": user_answer,
-                "correct_answer": question["correct_answer"],
+                "correct_answer": correct_answer,
                 "explanation": question["explanation"]
-            })
+            }
+            question_results.append(result)
+            if not is_correct:
+                missed_questions.append(result)
         
         # Calculate score percentage
         score_percentage = (correct_count / total_questions * 100) if total_questions > 0 else 0
@@ -53,11 +57,11 @@ class QuizScorer:
                 "percentage": score_percentage
             },
             "question_results": question_results,
-            "feedback": self._generate_feedback(score_percentage, question_results)
+            "feedback": self._generate_feedback(score_percentage, missed_questions)
         }
     
-    def _generate_feedback(self, score_percentage: float, question_results: List[Dict[str, Any]]) -> str:
-        """Generate feedback based on quiz performance"""
+    def _generate_feedback(self, score_percentage: float, missed_questions: List[Dict[str, Any]]) -> str:
+        """Generate feedback based on quiz performance and the questions answered incorrectly"""
         if score_percentage >= 90:
             feedback = "Excellent work! You have a strong understanding of this material."
         elif score_percentage >= 70:
@@ -68,7 +72,6 @@ class QuizScorer:
             feedback = "You might need more study time with this material. Focus on the explanations provided."
         
         # Add specific feedback on missed questions
-        missed_questions = [result for result in question_results if not result["correct"]]
         if missed_questions:
             feedback += "\n\nFocus on reviewing these concepts:\n"
             for idx, result in enumerate(missed_questions[:3]):  # Limit to first 3 missed questions
@@ -1,7 +1,162 @@
 # app/core/quiz_generator.py - Final fixed version
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 import re
 import json
+import asyncio
+import logging
+
+from app.utils.tokens import get_encoding
+
+logger = logging.getLogger(__name__)
+
+# Token budget for document context in quiz prompts (roughly the old 4000 character cap)
+CONTEXT_TOKEN_BUDGET = 1000
+# Character estimate per token when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "... [truncated for length]"
+
+# Upper bound on simultaneous LLM requests when generating quizzes for several topics
+MAX_CONCURRENT_QUIZZES = 4
+
+def _truncate_to_token_budget(text: str, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Cut text down to at most budget tokens, estimating from characters without tiktoken"""
+    # Every token spans at least one character, so short text never needs encoding
+    if len(text) <= budget:
+        return text
+    
+    encoding = get_encoding()
+    if encoding is None:
+        max_chars = budget * CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars] + TRUNCATION_MARKER
+    
+    tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:budget]) + TRUNCATION_MARKER
+
+# Line patterns for the primary quiz parser
+QUESTION_LINE_RE = re.compile(r"^\s*(?:Q|Question\s*)(\d+)\s*[:.]\s*(.*)$")
+OPTION_LINE_RE = re.compile(r"^\s*\(?([A-D])(?:[.)]\s*|\s+)(.*)$")
+ANSWER_LINE_RE = re.compile(
+    r"^\s*(?:(?i:correct answer|answer|correct)\s*:|(?i:the correct answer is))\s*\(?([A-D])\b"
+)
+EXPLANATION_LINE_RE = re.compile(r"^\s*(?i:explanation|why)\s*:\s*(.*)$")
+
+# Any of these markers means the response contains at least a first question
+Q1_MARKERS = ("Q1:", "Q1.", "Question 1:")
+
+QUIZ_SYSTEM_PROMPT = "You are a quiz generation assistant specialized in creating multiple-choice educational quizzes. Follow the requested format exactly."
+
+# Patterns for the backup quiz parser
+BACKUP_CHUNK_SPLIT_RE = re.compile(r'\n\s*\n|\n(?=Q\d+:|\d+\.)')
+BACKUP_QUESTION_RE = re.compile(r'(?:Q\d+:|^\d+\.|Question \d+:)?\s*(.*?)(?=\nA\.|\n\(A\)|\nA\s)', re.DOTALL)
+BACKUP_FIRST_OPTION_SPLIT_RE = re.compile(r'\n(?=A\.|\(A\)|A\s)')
+BACKUP_OPTION_RES = {
+    letter: re.compile(
+        r'(?:' + letter + r'\.|' + letter + r'\s|\(' + letter + r'\))\s*(.*?)(?=\n[A-D]\.|\n\([A-D]\)|\n[A-D]\s|Correct|Answer|correct|$)',
+        re.DOTALL
+    )
+    for letter in "ABCD"
+}
+BACKUP_ANSWER_RES = (
+    re.compile(r'(?:Correct Answer|Answer|correct)(?::|\sis)?\s*([A-D])'),
+    re.compile(r'The answer is ([A-D])')
+)
+
+class QuizLineParser:
+    """
+    Incremental parser for the line-based quiz format
+    
+    Lines are fed one at a time. A question header ("Q1:", "Q1." or
+    "Question 1:") starts a new question; following lines are question text
+    until the first option, option lines (with continuation lines) until the
+    answer line, and the explanation after that. An answer line without an
+    "Explanation:" label uses the text after it as the explanation. A question
+    is complete when the next header arrives or the input is closed.
+    """
+    
+    def __init__(self):
+        self.current = None
+    
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """Consume one line, returning the previous question if this line completed it"""
+        q_match = QUESTION_LINE_RE.match(line)
+        if q_match:
+            finished = self.close()
+            self.current = {
+                "number": q_match.group(1),
+                "text": [q_match.group(2)],
+                "options": {},
+                "last_option": None,
+                "answer": None,
+                "explanation": [],
+                "after_answer": [],
+                "state": "question"
+            }
+            return finished
+        
+        current = self.current
+        if current is None:
+            return None
+        
+        if current["answer"] is None:
+            answer_match = ANSWER_LINE_RE.match(line)
+            if answer_match:
+                current["answer"] = answer_match.group(1)
+                if current["state"] != "explanation":
+                    current["state"] = "answer"
+                return None
+        
+        explanation_match = EXPLANATION_LINE_RE.match(line)
+        if explanation_match and not current["explanation"]:
+            current["explanation"].append(explanation_match.group(1))
+            current["state"] = "explanation"
+            return None
+        
+        state = current["state"]
+        if state in ("question", "options"):
+            option_match = OPTION_LINE_RE.match(line)
+            if option_match:
+                letter = option_match.group(1)
+                current["options"][letter] = [option_match.group(2)]
+                current["last_option"] = letter
+                current["state"] = "options"
+            elif state == "question":
+                current["text"].append(line)
+            else:
+                current["options"][current["last_option"]].append(line)
+        elif state == "answer":
+            current["after_answer"].append(line)
+        else:
+            current["explanation"].append(line)
+        return None
+    
+    def close(self) -> Optional[Dict[str, Any]]:
+        """Finish the question in progress, returning it if it has options and an answer"""
+        current = self.current
+        self.current = None
+        if current is None:
+            return None
+        
+        q_number = current["number"]
+        explanation = "\n".join(current["explanation"] or current["after_answer"]).strip()
+        options = {letter: "\n".join(lines).strip() for letter, lines in current["options"].items()}
+        correct_answer = current["answer"]
+        
+        # Debug the question parsing
+        logger.debug("Parsed Q%s: options=%d, answer=%s, explanation_length=%d",
+                     q_number, len(options), correct_answer, len(explanation))
+        
+        # Only return the question if we have all required components
+        if len(options) > 0 and correct_answer:
+            return {
+                "id": f"q{q_number}",
+                "text": "\n".join(current["text"]).strip(),
+                "options": options,
+                "correct_answer": correct_answer,
+                "explanation": explanation if explanation else "No explanation provided."
+            }
+        return None
 
 class QuizGenerator:
     """Service for generating quizzes from document content"""
@@ -35,18 +190,18 @@ class QuizGenerator:
             Dict containing quiz questions and metadata
         """
         if not context or not client:
-            print("Missing context or client in generate_quiz")
+            logger.warning("Missing context or client in generate_quiz")
             return {"questions": [], "metadata": {}, "error": "Missing context or LLM client"}
         
         # Build prompt for quiz generation
         prompt = self._build_quiz_prompt(context, num_questions, difficulty, topic)
         
         try:
-            print(f"Sending prompt to model {model_name} - prompt length: {len(prompt)}")
+            logger.debug("Sending prompt to model %s - prompt length: %d", model_name, len(prompt))
             
             # Call the LLM to generate quiz
             messages = [
-                {"role": "system", "content": "You are a quiz generation assistant specialized in creating multiple-choice educational quizzes. Follow the requested format exactly."},
+                {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
             
@@ -58,18 +213,17 @@ class QuizGenerator:
             )
             
             quiz_text = response.choices[0].message.content
-            print(f"Received response - length: {len(quiz_text)}")
-            print(f"First 300 chars of response: {quiz_text[:300]}")
+            logger.debug("Received response - length: %d", len(quiz_text))
             
             # Parse the generated quiz
             questions = self._parse_quiz_response(quiz_text)
-            print(f"Parsed {len(questions)} questions from response")
+            logger.debug("Parsed %d questions from response", len(questions))
             
             # If parsing failed, try a backup structured approach
             if len(questions) == 0:
-                print("Primary parsing failed, trying backup approach...")
+                logger.debug("Primary parsing failed, trying backup approach")
                 questions = self._backup_parse_quiz(quiz_text, num_questions)
-                print(f"Backup parsing found {len(questions)} questions")
+                logger.debug("Backup parsing found %d questions", len(questions))
             
             return {
                 "questions": questions,
@@ -80,17 +234,135 @@ class QuizGenerator:
                 }
             }
         except Exception as e:
-            import traceback
-            print(f"Error generating quiz: {e}")
-            traceback.print_exc()
+            logger.exception("Error generating quiz: %s", e)
             return {"questions": [], "metadata": {}, "error": str(e)}
     
+    async def stream_quiz(self,
+                          context: str,
+                          num_questions: int = 5,
+                          difficulty: str = "medium",
+                          topic: str = None,
+                          client=None,
+                          model_name: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a quiz, yielding each question as soon as the model finishes it
+        
+        The response is requested with stream=True and fed line by line to the
+        quiz parser, so the first question is available while later ones are
+        still being generated. If no question parses, the backup parser is run
+        on the full response once the stream ends.
+        
+        Args:
+            context: Text from retrieved documents
+            num_questions: Number of questions to generate
+            difficulty: easy, medium, or hard
+            topic: Optional specific topic to focus on
+            client: LLM client
+            model_name: LLM model name
+            
+        Yields:
+            Question dicts in the same form as generate_quiz's "questions"
+        """
+        if not context or not client:
+            return
+        
+        prompt = self._build_quiz_prompt(context, num_questions, difficulty, topic)
+        stream = await client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=2000,
+            model=model_name,
+            stream=True
+        )
+        
+        parser = QuizLineParser()
+        chunks = []
+        pending = ""
+        yielded = 0
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            chunks.append(delta)
+            
+            # Only complete lines are parsed; the tail waits for the next chunk
+            *lines, pending = (pending + delta).split("\n")
+            for line in lines:
+                question = parser.feed(line.rstrip("\r"))
+                if question:
+                    yielded += 1
+                    yield question
+        
+        if pending:
+            question = parser.feed(pending)
+            if question:
+                yielded += 1
+                yield question
+        question = parser.close()
+        if question:
+            yielded += 1
+            yield question
+        
+        if yielded == 0:
+            for question in self._backup_parse_quiz("".join(chunks), num_questions):
+                yield question
+    
+    async def generate_quizzes(self,
+                               contexts: Dict[str, str],
+                               num_questions: int = 5,
+                               difficulty: str = "medium",
+                               client=None,
+                               model_name: str = None,
+                               max_concurrency: int = MAX_CONCURRENT_QUIZZES) -> Dict[str, Dict[str, Any]]:
+        """
+        Generate one quiz per topic, running the LLM requests concurrently
+        
+        Args:
+            contexts: Mapping of topic to the document text for that topic
+            num_questions: Number of questions to generate per quiz
+            difficulty: easy, medium, or hard
+            client: LLM client
+            model_name: LLM model name
+            max_concurrency: Maximum number of quiz requests in flight at once
+            
+        Returns:
+            Dict mapping each topic to its quiz, in the same form as generate_quiz
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate_for_topic(topic: str, context: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.generate_quiz(
+                    context=context,
+                    num_questions=num_questions,
+                    difficulty=difficulty,
+                    topic=topic,
+                    client=client,
+                    model_name=model_name
+                )
+        
+        topics = list(contexts)
+        results = await asyncio.gather(
+            *(generate_for_topic(topic, contexts[topic]) for topic in topics),
+            return_exceptions=True
+        )
+        
+        # Report a failed topic the same way generate_quiz does instead of failing the batch
+        return {
+            topic: ({"questions": [], "metadata": {}, "error": str(result)}
+                    if isinstance(result, Exception) else result)
+            for topic, result in zip(topics, results)
+        }
+    
     def _build_quiz_prompt(self, context: str, num_questions: int, difficulty: str, topic: str = None) -> str:
         """Build the prompt for quiz generation"""
-        # Cap context length to avoid token issues
-        max_context_length = 4000
-        if len(context) > max_context_length:
-            context = context[:max_context_length] + "... [truncated for length]"
+        # Cap context by tokens rather than characters so dense text isn't oversized
+        context = _truncate_to_token_budget(context)
         
         topic_instruction = f"focusing on {topic}" if topic else "covering key concepts"
         
@@ -126,93 +398,30 @@ Remember to follow the exact format specified above. Each question should have:
         return prompt
     
     def _parse_quiz_response(self, quiz_text: str) -> List[Dict[str, Any]]:
-        """Parse the generated quiz text into structured questions"""
-        questions = []
+        """
+        Parse the generated quiz text into structured questions
         
+        Walks the text line by line once. A question header ("Q1:", "Q1." or
+        "Question 1:") starts a new question; following lines are question text
+        until the first option, option lines (with continuation lines) until the
+        answer line, and the explanation after that. An answer line without an
+        "Explanation:" label uses the text after it as the explanation.
+        """
         # First, determine if we have any questions at all
-        if not ("Q1:" in quiz_text or "Q1." in quiz_text or "Question 1:" in quiz_text):
-            print("No questions found in quiz text using primary format detection")
-            return questions
-            
-        # Normalize question format
-        quiz_text = quiz_text.replace("Q1.", "Q1:").replace("Q2.", "Q2:").replace("Q3.", "Q3:")
-        quiz_text = quiz_text.replace("Q4.", "Q4:").replace("Q5.", "Q5:").replace("Q6.", "Q6:")
-        quiz_text = quiz_text.replace("Question 1:", "Q1:").replace("Question 2:", "Q2:").replace("Question 3:", "Q3:")
-        
-        # Pattern to identify questions
-        question_pattern = r"Q(\d+):\s*(.*?)(?=\nA\.|\nA\s|$)"
+        if not any(marker in quiz_text for marker in Q1_MARKERS):
+            logger.debug("No questions found in quiz text using primary format detection")
+            return []
         
-        # Find all questions
-        question_matches = re.finditer(question_pattern, quiz_text, re.DOTALL)
+        parser = QuizLineParser()
+        questions = []
+        for line in quiz_text.splitlines():
+            question = parser.feed(line)
+            if question:
+                questions.append(question)
         
-        for q_match in question_matches:
-            q_number = q_match.group(1)
-            q_text = q_match.group(2).strip()
-            
-            # Extract the full question block
-            question_start_pos = q_match.start()
-            next_q_pattern = r"\nQ" + str(int(q_number) + 1) + ":"
-            next_q_match = re.search(next_q_pattern, quiz_text[question_start_pos:])
-            if next_q_match:
-                question_end_pos = question_start_pos + next_q_match.start()
-                question_block = quiz_text[question_start_pos:question_end_pos]
-            else:
-                question_block = quiz_text[question_start_pos:]
-            
-            # Find options, answer and explanation
-            options_pattern = r"([A-D])\.?\s*(.*?)(?=\n[A-D]\.|\n[A-D]\s|Correct Answer:|$)"
-            
-            # Try different answer patterns
-            answer_patterns = [
-                r"Correct Answer:\s*([A-D])",
-                r"Correct Answer:\s*([A-D])\.?",
-                r"Answer:\s*([A-D])",
-                r"Answer: ([A-D])\.",
-                r"The correct answer is ([A-D])",
-                r"Correct: ([A-D])"
-            ]
-            
-            explanation_pattern = r"(?:Explanation|Explanation:|Why):\s*(.*?)(?=\nQ\d+:|$)"
-            
-            # Find options
-            options = {}
-            for opt_match in re.finditer(options_pattern, question_block, re.DOTALL):
-                opt_letter = opt_match.group(1)
-                opt_text = opt_match.group(2).strip()
-                options[opt_letter] = opt_text
-            
-            # Find correct answer using multiple patterns
-            correct_answer = None
-            for pattern in answer_patterns:
-                answer_match = re.search(pattern, question_block)
-                if answer_match:
-                    correct_answer = answer_match.group(1)
-                    break
-            
-            # Find explanation
-            explanation_match = re.search(explanation_pattern, question_block, re.DOTALL)
-            explanation = explanation_match.group(1).strip() if explanation_match else ""
-            
-            # If we can't find the explanation with the pattern, try to infer it
-            if not explanation and correct_answer:
-                # Try to find any text after "Correct Answer: X" until the next question
-                explanation_pattern_alt = r"Correct Answer:.*?([A-D]).*?\n(.*?)(?=\nQ\d+:|$)"
-                explanation_match_alt = re.search(explanation_pattern_alt, question_block, re.DOTALL)
-                if explanation_match_alt:
-                    explanation = explanation_match_alt.group(2).strip()
-            
-            # Debug the question parsing
-            print(f"Parsed Q{q_number}: options={len(options)}, answer={correct_answer}, explanation_length={len(explanation)}")
-            
-            # Add question to list if we have all required components
-            if len(options) > 0 and correct_answer:
-                questions.append({
-                    "id": f"q{q_number}",
-                    "text": q_text,
-                    "options": options,
-                    "correct_answer": correct_answer,
-                    "explanation": explanation if explanation else "No explanation provided."
-                })
+        question = parser.close()
+        if question:
+            questions.append(question)
         
         return questions
     
@@ -221,7 +430,7 @@ Remember to follow the exact format specified above. Each question should have:
         questions = []
         
         # Split by blank lines or question numbers
-        chunks = re.split(r'\n\s*\n|\n(?=Q\d+:|\d+\.)', quiz_text)
+        chunks = BACKUP_CHUNK_SPLIT_RE.split(quiz_text)
         
         for i, chunk in enumerate(chunks):
             if not chunk.strip():
@@ -236,13 +445,13 @@ Remember to follow the exact format specified above. Each question should have:
             options_text = chunk
             
             # Try to find the question text
-            q_match = re.search(r'(?:Q\d+:|^\d+\.|Question \d+:)?\s*(.*?)(?=\nA\.|\n\(A\)|\nA\s)', chunk, re.DOTALL)
+            q_match = BACKUP_QUESTION_RE.search(chunk)
             if q_match:
                 question_text = q_match.group(1).strip()
                 options_text = chunk[q_match.end():]
             else:
                 # Fallback - just get everything before the first option
-                parts = re.split(r'\n(?=A\.|\(A\)|A\s)', chunk, 1)
+                parts = BACKUP_FIRST_OPTION_SPLIT_RE.split(chunk, 1)
                 if len(parts) > 1:
                     question_text = parts[0].strip()
                     options_text = parts[1]
@@ -251,19 +460,15 @@ Remember to follow the exact format specified above. Each question should have:
             
             # Find all options
             options = {}
-            for letter in ['A', 'B', 'C', 'D']:
-                opt_pattern = r'(?:' + letter + r'\.|' + letter + r'\s|\(' + letter + r'\))\s*(.*?)(?=\n[A-D]\.|\n\([A-D]\)|\n[A-D]\s|Correct|Answer|correct|$)'
-                opt_match = re.search(opt_pattern, options_text, re.DOTALL)
+            for letter, opt_pattern in BACKUP_OPTION_RES.items():
+                opt_match = opt_pattern.search(options_text)
                 if opt_match:
                     options[letter] = opt_match.group(1).strip()
             
             # Try to find correct answer
             correct_answer = None
-            for pattern in [
-                r'(?:Correct Answer|Answer|correct)(?::|\sis)?\s*([A-D])',
-                r'The answer is ([A-D])'
-            ]:
-                answer_match = re.search(pattern, chunk)
+            for pattern in BACKUP_ANSWER_RES:
+                answer_match = pattern.search(chunk)
                 if answer_match:
                     correct_answer = answer_match.group(1)
                     break
@@ -278,7 +483,7 @@ Remember to follow the exact format specified above. Each question should have:
             # If still no answer, select 'A' as default (better than nothing)
             if not correct_answer and options.get('A'):
                 correct_answer = 'A'
-                print(f"Warning: No correct answer found for question {i+1}, defaulting to A")
+                logger.warning("No correct answer found for question %d, defaulting to A", i + 1)
             
             # Add to questions if we have enough info
             if question_text and len(options) >= 2 and correct_answer:
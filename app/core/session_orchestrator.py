@@ -1,8 +1,78 @@
 # app/core/session_orchestrator.py
-from typing import Dict, Any, List, Optional
-import json
-import datetime
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+import asyncio
+from datetime import datetime, timezone
+import logging
 import uuid
+import orjson
+from cachetools import TTLCache
+
+from app.models import repository
+from app.utils.context_retrieval import retrieve_topic_context
+
+logger = logging.getLogger(__name__)
+
+# Activity prompts depend only on the activity parameters and session context,
+# so a user's generated introductions, quizzes, flashcards and summaries are
+# reused across their sessions
+ACTIVITY_CACHE_SIZE = 512
+ACTIVITY_CACHE_TTL_SECONDS = 3600
+
+# Sessions idle for longer than this, or pushed out once the sessions in
+# memory hold more than ACTIVE_SESSION_MAX_BYTES of context and results, are
+# dropped from memory; they are rebuilt from the database on their next use
+ACTIVE_SESSION_MAX_BYTES = 256 * 1024 * 1024
+ACTIVE_SESSION_TTL_SECONDS = 3600
+# Approximate size of a plan's activities and metadata
+SESSION_OVERHEAD_BYTES = 2048
+
+# Queued activity results are written when their session completes, and at
+# least this often otherwise so abandoned sessions don't hold them in memory
+SESSION_FLUSH_INTERVAL_SECONDS = 30
+
+# Sessions up to this long pick either flashcards or a quiz, not both
+SHORT_SESSION_MAX_MINUTES = 10
+
+# (activity type, description template) for each activity of a quick session
+SHORT_SESSION_ACTIVITIES = (
+    ("introduction", "Quick introduction to {topic}"),
+    ("flashcard", "Review key concepts in {topic}")
+)
+FULL_SESSION_ACTIVITIES = (
+    ("introduction", "Introduction to {topic}"),
+    ("flashcard", "Review key concepts in {topic}"),
+    ("quiz", "Test your knowledge of {topic}"),
+    ("summary", "Review what you've learned about {topic}")
+)
+
+def _session_size(plan: Dict[str, Any]) -> int:
+    """Approximate the memory held by a session plan, dominated by its context and results"""
+    size = SESSION_OVERHEAD_BYTES + len(plan.get("context") or "")
+    for entry in plan.get("results", {}).values():
+        result = entry.get("result")
+        if isinstance(result, str):
+            size += len(result)
+    return size
+
+def _split_duration(duration_minutes: int) -> tuple:
+    """Split a session's minutes across its activities, in template order"""
+    intro_time = min(5, duration_minutes // 5)
+    remaining_time = duration_minutes - intro_time
+    if duration_minutes <= SHORT_SESSION_MAX_MINUTES:
+        return intro_time, remaining_time
+    
+    flashcard_time = remaining_time // 3
+    quiz_time = remaining_time // 3
+    summary_time = remaining_time - flashcard_time - quiz_time
+    return intro_time, flashcard_time, quiz_time, summary_time
+
+def _activity_parameters(activity_type: str, minutes: int, topic: str) -> Dict[str, Any]:
+    """Build the parameters for an activity from the time it was given"""
+    if activity_type == "flashcard":
+        return {"num_cards": min(5, minutes // 2), "topic": topic}
+    if activity_type == "quiz":
+        return {"num_questions": min(3, minutes // 3), "difficulty": "medium", "topic": topic}
+    return {"topic": topic}
 
 class SessionOrchestrator:
     """
@@ -12,7 +82,16 @@ class SessionOrchestrator:
     
     def __init__(self):
         """Initialize the session orchestrator"""
-        self.active_sessions = {}
+        self.active_sessions = TTLCache(maxsize=ACTIVE_SESSION_MAX_BYTES, ttl=ACTIVE_SESSION_TTL_SECONDS,
+                                        getsizeof=_session_size)
+        self._activity_cache = TTLCache(maxsize=ACTIVITY_CACHE_SIZE, ttl=ACTIVITY_CACHE_TTL_SECONDS)
+        self._activity_inflight = {}
+        # Activity result events not yet written to the database, by session ID
+        self._pending_events = {}
+        # Batches of events taken from _pending_events whose write is in progress
+        self._writing_events = []
+        self._flush_task = None
+        self._processor = None
     
     async def create_quick_session(self, user_id: str, topic: str, duration_minutes: int = 15, 
                                  db = None, vector_client = None) -> Dict[str, Any]:
@@ -29,91 +108,48 @@ class SessionOrchestrator:
         Returns:
             Session plan
         """
+        context = await self._retrieve_context(topic, vector_client)
+        activities = self._default_activities(topic, duration_minutes)
+        return await self._start_session(user_id, topic, duration_minutes, context, activities, db)
+    
+    async def _retrieve_context(self, topic: str, vector_client = None) -> str:
+        """Get context for the topic if vector_client available"""
+        if not vector_client:
+            return ""
+        context_result = await retrieve_topic_context(
+            vector_client,
+            topic,
+            min_chunks=3,
+            max_chunks=7
+        )
+        return context_result.get("context", "")
+    
+    def _default_activities(self, topic: str, duration_minutes: int) -> List[Dict[str, Any]]:
+        """Lay out the standard activities for the available time"""
+        templates = SHORT_SESSION_ACTIVITIES if duration_minutes <= SHORT_SESSION_MAX_MINUTES else FULL_SESSION_ACTIVITIES
+        return [
+            {
+                "type": activity_type,
+                "duration_minutes": minutes,
+                "description": description.format(topic=topic),
+                "parameters": _activity_parameters(activity_type, minutes, topic)
+            }
+            for (activity_type, description), minutes in zip(templates, _split_duration(duration_minutes))
+        ]
+    
+    async def _start_session(self, user_id: str, topic: str, duration_minutes: int, context: str,
+                             activities: List[Dict[str, Any]], db = None) -> Dict[str, Any]:
+        """Create a session plan, make it active and save it to the database if possible"""
         # Generate session ID
         session_id = str(uuid.uuid4())
         
-        # Get context for the topic if vector_client available
-        context = ""
-        if vector_client:
-            from app.utils.context_retrieval import retrieve_topic_context
-            context_result = await retrieve_topic_context(
-                vector_client,
-                topic,
-                min_chunks=3,
-                max_chunks=7
-            )
-            context = context_result.get("context", "")
-        
-        # Calculate activity durations based on total time
-        intro_time = min(5, duration_minutes // 5)
-        remaining_time = duration_minutes - intro_time
-        
-        # For shorter sessions, pick either flashcards or quiz, not both
-        if duration_minutes <= 10:
-            activities = [
-                {
-                    "type": "introduction",
-                    "duration_minutes": intro_time,
-                    "description": f"Quick introduction to {topic}",
-                    "parameters": {"topic": topic}
-                },
-                {
-                    "type": "flashcard",
-                    "duration_minutes": remaining_time,
-                    "description": f"Review key concepts in {topic}",
-                    "parameters": {
-                        "num_cards": min(5, remaining_time // 2),
-                        "topic": topic
-                    }
-                }
-            ]
-        else:
-            # For longer sessions, include multiple activity types
-            flashcard_time = remaining_time // 3
-            quiz_time = remaining_time // 3
-            summary_time = remaining_time - flashcard_time - quiz_time
-            
-            activities = [
-                {
-                    "type": "introduction",
-                    "duration_minutes": intro_time,
-                    "description": f"Introduction to {topic}",
-                    "parameters": {"topic": topic}
-                },
-                {
-                    "type": "flashcard",
-                    "duration_minutes": flashcard_time,
-                    "description": f"Review key concepts in {topic}",
-                    "parameters": {
-                        "num_cards": min(5, flashcard_time // 2),
-                        "topic": topic
-                    }
-                },
-                {
-                    "type": "quiz",
-                    "duration_minutes": quiz_time,
-                    "description": f"Test your knowledge of {topic}",
-                    "parameters": {
-                        "num_questions": min(3, quiz_time // 3),
-                        "difficulty": "medium",
-                        "topic": topic
-                    }
-                },
-                {
-                    "type": "summary",
-                    "duration_minutes": summary_time,
-                    "description": f"Review what you've learned about {topic}",
-                    "parameters": {"topic": topic}
-                }
-            ]
-        
         # Create the session plan
         plan = {
             "session_id": session_id,
             "user_id": user_id,
             "topic": topic,
             "duration_minutes": duration_minutes,
-            "created_at": datetime.datetime.utcnow().isoformat(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
             "context": context,
             "activities": activities,
             "status": "planned",
@@ -123,10 +159,11 @@ class SessionOrchestrator:
         # Store the active session
         self.active_sessions[session_id] = plan
         
-        # Save to database if possible
+        # Save to database if possible, committing off the event loop
         if db:
-            from app.models import repository
-            session_record = repository.create_study_session(db, user_id, json.dumps(plan))
+            session_record = await asyncio.to_thread(
+                repository.create_study_session, db, user_id, orjson.dumps(plan).decode(), session_id
+            )
             plan["record_id"] = session_record.id
         
         return plan
@@ -144,21 +181,10 @@ class SessionOrchestrator:
         Returns:
             Result of the activity execution
         """
-        # Check if session exists
-        if session_id not in self.active_sessions:
-            if db:
-                # Try to load from database
-                from app.models import repository
-                session_record = repository.get_study_session(db, session_id)
-                if session_record:
-                    self.active_sessions[session_id] = json.loads(session_record.content)
-                else:
-                    return {"error": f"Session {session_id} not found"}
-            else:
-                return {"error": f"Session {session_id} not found"}
-        
         # Get session plan
-        plan = self.active_sessions[session_id]
+        plan = await self._load_plan(session_id, db)
+        if plan is None:
+            return {"error": f"Session {session_id} not found"}
         
         # Determine activity index
         if activity_index is None:
@@ -172,8 +198,7 @@ class SessionOrchestrator:
         activity = plan["activities"][activity_index]
         
         # Get message processor
-        from app.core.agent import get_message_processor
-        processor = get_message_processor()
+        processor = self._get_processor()
         
         # Execute activity based on type
         result = await self._execute_activity(
@@ -184,7 +209,327 @@ class SessionOrchestrator:
             processor
         )
         
-        # Update session state
+        # Update session state and store the activity result, deferring the
+        # database write until the session completes
+        self._store_result(session_id, plan, activity_index, activity["type"], result)
+        if db and plan["status"] == "completed":
+            await self.flush_sessions_async(db)
+        
+        return {
+            "session_id": session_id,
+            "activity": activity,
+            "result": result,
+            "next_activity_index": plan["current_activity_index"] if plan["status"] != "completed" else None,
+            "status": plan["status"]
+        }
+    
+    async def execute_all_activities(self, session_id: str, db = None) -> Dict[str, Any]:
+        """
+        Execute every remaining activity in a session concurrently
+        
+        Activities only share the session context, so they are generated at
+        the same time and the session is written to the database once at the
+        end. A failed activity is recorded with its error instead of failing
+        the others.
+        
+        Args:
+            session_id: Session ID
+            db: Optional database session
+            
+        Returns:
+            Results of the executed activities in plan order
+        """
+        plan = await self._load_plan(session_id, db)
+        if plan is None:
+            return {"error": f"Session {session_id} not found"}
+        
+        indices = range(plan["current_activity_index"], len(plan["activities"]))
+        
+        processor = self._get_processor()
+        
+        results = await asyncio.gather(
+            *(self._execute_activity(
+                plan["activities"][index]["type"],
+                plan["activities"][index]["parameters"],
+                plan["context"],
+                plan["user_id"],
+                processor
+            ) for index in indices),
+            return_exceptions=True
+        )
+        
+        executed = []
+        for index, result in zip(indices, results):
+            if isinstance(result, BaseException):
+                logger.warning("Activity %d of session %s failed: %r", index, session_id, result)
+                result = f"Error executing activity: {result}"
+            activity = plan["activities"][index]
+            self._store_result(session_id, plan, index, activity["type"], result)
+            executed.append({"activity_index": index, "activity": activity, "result": result})
+        
+        # One write for the whole batch
+        if db and executed:
+            await self.flush_sessions_async(db)
+        
+        return {
+            "session_id": session_id,
+            "results": executed,
+            "status": plan["status"]
+        }
+    
+    async def execute_activity_stream(self, session_id: str, activity_index: int = None,
+                                      db = None) -> AsyncIterator[str]:
+        """
+        Execute a specific activity in a session, yielding its result as it is generated
+        
+        The session is advanced and the full result recorded once the stream
+        ends. If the stream fails or is abandoned part way, the activity is
+        left unexecuted.
+        
+        Args:
+            session_id: Session ID
+            activity_index: Optional activity index, defaults to current
+            db: Optional database session
+            
+        Yields:
+            Chunks of the activity result text
+            
+        Raises:
+            ValueError: If the session does not exist or the index is invalid
+        """
+        plan = await self._load_plan(session_id, db)
+        if plan is None:
+            raise ValueError(f"Session {session_id} not found")
+        
+        if activity_index is None:
+            activity_index = plan["current_activity_index"]
+        
+        if activity_index < 0 or activity_index >= len(plan["activities"]):
+            raise ValueError(f"Invalid activity index: {activity_index}")
+        
+        activity = plan["activities"][activity_index]
+        request = self._activity_prompt(activity["type"], activity["parameters"])
+        if request is None:
+            chunks = [f"Unknown activity type: {activity['type']}"]
+            yield chunks[0]
+        else:
+            mode, prompt = request
+            chunks = []
+            async for chunk in self._generate_stream(prompt, mode, plan["context"], plan["user_id"],
+                                                     self._get_processor()):
+                chunks.append(chunk)
+                yield chunk
+        
+        self._store_result(session_id, plan, activity_index, activity["type"], "".join(chunks))
+        if db and plan["status"] == "completed":
+            await self.flush_sessions_async(db)
+    
+    def flush_sessions(self, db) -> int:
+        """
+        Write every pending activity result to the database in one transaction
+        
+        Each result is appended as its own study session event, so the stored
+        plan is never rewritten as it grows.
+        
+        Args:
+            db: Database session
+            
+        Returns:
+            Number of events written
+        """
+        pending = self._take_pending_events()
+        try:
+            self._write_events(db, pending)
+        except Exception:
+            self._requeue_events(pending)
+            raise
+        return sum(len(events) for events in pending.values())
+    
+    async def flush_sessions_async(self, db = None) -> int:
+        """
+        Write every pending activity result to the database from a worker thread
+        
+        Args:
+            db: Database session; a new one is opened in the worker thread if not given
+            
+        Returns:
+            Number of events written
+        """
+        pending = self._take_pending_events()
+        if not pending:
+            return 0
+        # Sessions reloaded while the write runs still see these results
+        self._writing_events.append(pending)
+        try:
+            await asyncio.to_thread(self._write_events, db, pending)
+        except Exception:
+            # Keep the results for the next flush rather than losing them
+            self._requeue_events(pending)
+            raise
+        finally:
+            self._writing_events.remove(pending)
+        return sum(len(events) for events in pending.values())
+    
+    def start_periodic_flush(self, interval: float = SESSION_FLUSH_INTERVAL_SECONDS) -> asyncio.Task:
+        """
+        Start writing pending activity results in the background every interval seconds
+        
+        Results of sessions that never complete would otherwise stay in memory
+        until shutdown. Must be called from a running event loop.
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically(interval))
+        return self._flush_task
+    
+    async def stop_periodic_flush(self) -> None:
+        """Stop the background flush started by start_periodic_flush"""
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _flush_periodically(self, interval: float) -> None:
+        """Flush pending results on a timer until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_sessions_async()
+            except Exception as e:
+                logger.warning("Writing study session results failed, will retry: %s", e)
+    
+    def _take_pending_events(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Remove and return every queued event, by session ID"""
+        pending, self._pending_events = self._pending_events, {}
+        return pending
+    
+    def _requeue_events(self, pending: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Put events back ahead of any queued since they were taken"""
+        for session_id, events in pending.items():
+            self._pending_events[session_id] = events + self._pending_events.get(session_id, [])
+    
+    def _write_events(self, db, pending: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Insert queued events in one transaction, opening a database session if none is given"""
+        events = [event for session_events in pending.values() for event in session_events]
+        if not events:
+            return
+        if db is not None:
+            repository.add_study_session_events(db, events)
+            return
+        
+        from app.models.db import SessionLocal
+        db = SessionLocal()
+        try:
+            repository.add_study_session_events(db, events)
+        finally:
+            db.close()
+    
+    def plan_from_record(self, session_record, events) -> Dict[str, Any]:
+        """
+        Rebuild a session plan from its stored record and activity result events
+        
+        Args:
+            session_record: StudySession record holding the plan as created
+            events: The session's StudySessionEvent records in execution order
+            
+        Returns:
+            Session plan with results and progress restored
+        """
+        plan = orjson.loads(session_record.content)
+        plan["record_id"] = session_record.id
+        for event in events:
+            self._record_result(plan, event.activity_index, event.activity_type,
+                                orjson.loads(event.result), event.executed_at)
+        return plan
+    
+    def _store_result(self, session_id: str, plan: Dict[str, Any], activity_index: int,
+                      activity_type: str, result: str) -> None:
+        """Record a new activity result in an active session and queue it for the database"""
+        self._record_result(plan, activity_index, activity_type, result)
+        # Reinsert so the session's size includes the new result
+        self.active_sessions[session_id] = plan
+        self._queue_event(session_id, plan, activity_index)
+    
+    def _queue_event(self, session_id: str, plan: Dict[str, Any], activity_index: int) -> None:
+        """Queue an activity result for the next flush if the session has a database record"""
+        if "record_id" not in plan:
+            return
+        entry = plan["results"][str(activity_index)]
+        self._pending_events.setdefault(session_id, []).append({
+            "session_id": plan["record_id"],
+            "activity_index": activity_index,
+            "activity_type": entry["activity_type"],
+            "result": orjson.dumps(entry["result"]).decode(),
+            # Stored as naive UTC like the other database timestamps
+            "executed_at": datetime.fromisoformat(entry["executed_at"]).replace(tzinfo=None)
+        })
+    
+    def _get_processor(self):
+        """Get the shared message processor, resolving it on first use"""
+        if self._processor is None:
+            # app.core.agent imports the factory, which imports this module
+            from app.core.agent import get_message_processor
+            self._processor = get_message_processor()
+        return self._processor
+    
+    async def _load_plan(self, session_id: str, db = None) -> Optional[Dict[str, Any]]:
+        """
+        Get a session plan from memory, loading it from the database if needed
+        
+        The database read and plan rebuild run in a worker thread so they don't
+        block the event loop. Results not yet written are replayed on top; those
+        a flush wrote while the read ran are recognised and not applied twice.
+        """
+        plan = self.active_sessions.get(session_id)
+        if plan is not None:
+            # Reinsert to restart the idle timer
+            self.active_sessions[session_id] = plan
+            return plan
+        if not db:
+            return None
+        
+        unwritten = self._unwritten_events(session_id)
+        loaded = await asyncio.to_thread(self._read_plan, session_id, db)
+        if loaded is None:
+            return None
+        
+        # Another request may have loaded the session while this one was reading
+        plan = self.active_sessions.get(session_id)
+        if plan is not None:
+            return plan
+        
+        # Results queued before the session was evicted may not be stored yet
+        plan, written = loaded
+        unwritten += [event for event in self._unwritten_events(session_id)
+                      if not any(event is seen for seen in unwritten)]
+        for event in unwritten:
+            if (event["activity_index"], event["executed_at"]) in written:
+                continue
+            self._record_result(plan, event["activity_index"], event["activity_type"],
+                                orjson.loads(event["result"]), event["executed_at"])
+        self.active_sessions[session_id] = plan
+        return plan
+    
+    def _read_plan(self, session_id: str, db) -> Optional[Tuple[Dict[str, Any], set]]:
+        """Rebuild a plan from the database, with the (activity index, time) of its stored events"""
+        session_record = repository.get_study_session(db, session_id)
+        if not session_record:
+            return None
+        events = repository.get_study_session_events(db, [session_record.id]).get(session_record.id, [])
+        plan = self.plan_from_record(session_record, events)
+        return plan, {(event.activity_index, event.executed_at) for event in events}
+    
+    def _unwritten_events(self, session_id: str) -> List[Dict[str, Any]]:
+        """Queued and in-flight events of a session, oldest first"""
+        unwritten = [event for batch in self._writing_events for event in batch.get(session_id, [])]
+        unwritten.extend(self._pending_events.get(session_id, []))
+        return unwritten
+    
+    def _record_result(self, plan: Dict[str, Any], activity_index: int, activity_type: str,
+                       result: str, executed_at: datetime = None) -> None:
+        """Advance the session past an activity and store its result"""
         plan["last_activity_index"] = activity_index
         plan["current_activity_index"] = activity_index + 1
         if plan["current_activity_index"] >= len(plan["activities"]):
@@ -192,27 +537,19 @@ class SessionOrchestrator:
         else:
             plan["status"] = "in_progress"
         
-        # Store activity result
+        if executed_at is None:
+            executed_at = datetime.now(timezone.utc)
+        elif executed_at.tzinfo is None:
+            # Database timestamps are naive UTC
+            executed_at = executed_at.replace(tzinfo=timezone.utc)
+        
         if "results" not in plan:
             plan["results"] = {}
         plan["results"][str(activity_index)] = {
-            "activity_type": activity["type"],
-            "executed_at": datetime.datetime.utcnow().isoformat(),
+            "activity_type": activity_type,
+            "executed_at": executed_at.isoformat(timespec="seconds"),
             "result": result
         }
-        
-        # Update in database if possible
-        if db:
-            from app.models import repository
-            repository.update_study_session(db, session_id, json.dumps(plan))
-        
-        return {
-            "session_id": session_id,
-            "activity": activity,
-            "result": result,
-            "next_activity_index": plan["current_activity_index"] if plan["status"] != "completed" else None,
-            "status": plan["status"]
-        }
     
     async def _execute_activity(self, activity_type: str, parameters: Dict[str, Any], 
                               context: str, user_id: str, processor) -> str:
@@ -229,83 +566,146 @@ class SessionOrchestrator:
         Returns:
             Result of the activity
         """
-        # Execute different activities based on type
+        request = self._activity_prompt(activity_type, parameters)
+        if request is None:
+            return f"Unknown activity type: {activity_type}"
+        
+        mode, prompt = request
+        return await self._generate(prompt, mode, context, user_id, processor)
+    
+    def _activity_prompt(self, activity_type: str, parameters: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """
+        Build the processor request for an activity
+        
+        Args:
+            activity_type: Type of activity
+            parameters: Activity parameters
+            
+        Returns:
+            Tuple of (processor mode, prompt), or None for an unknown activity type
+        """
+        topic = parameters.get("topic", "the topic")
+        
         if activity_type == "introduction":
-            return await self._execute_introduction(parameters, context, user_id, processor)
+            return "chat", f"Create a brief, engaging introduction to {topic} that will motivate the student to learn more. Keep it concise, under 150 words."
         elif activity_type == "quiz":
-            return await self._execute_quiz(parameters, context, user_id, processor)
+            num_questions = parameters.get("num_questions", 3)
+            difficulty = parameters.get("difficulty", "medium")
+            return "quiz", f"Create a quick quiz about {topic} with {num_questions} questions at {difficulty} difficulty level."
         elif activity_type == "flashcard":
-            return await self._execute_flashcard(parameters, context, user_id, processor)
+            num_cards = parameters.get("num_cards", 5)
+            return "flashcard", f"Create {num_cards} flashcards covering the key concepts of {topic}."
         elif activity_type == "summary":
-            return await self._execute_summary(parameters, context, user_id, processor)
-        else:
-            return f"Unknown activity type: {activity_type}"
+            return "chat", f"Create a brief summary of the key points about {topic}, highlighting what's most important to remember. Keep it concise, under 150 words."
+        return None
     
-    async def _execute_introduction(self, parameters: Dict[str, Any], context: str, 
-                                  user_id: str, processor) -> str:
-        """Execute an introduction activity"""
-        topic = parameters.get("topic", "the topic")
-        prompt = f"Create a brief, engaging introduction to {topic} that will motivate the student to learn more. Keep it concise, under 150 words."
+    async def _generate(self, prompt: str, mode: str, context: str, user_id: str, processor) -> str:
+        """
+        Generate an activity response, reusing a cached response for the same user and prompt
         
-        result = await processor.process_message(
-            user_id=user_id,
-            message=prompt,
-            mode="chat",
-            vector_search_client=None
-        )
+        The session context is handed to the processor as the document context,
+        so every activity in a session sends the same context ahead of its own
+        short instruction. Concurrent requests for the same prompt share one
+        in-flight call, and responses that came back as processing errors are
+        not cached.
         
-        return result["response"]
-    
-    async def _execute_quiz(self, parameters: Dict[str, Any], context: str, user_id: str, processor) -> str:
-        """Execute a quiz activity"""
-        topic = parameters.get("topic", "the topic")
-        num_questions = parameters.get("num_questions", 3)
-        difficulty = parameters.get("difficulty", "medium")
-        
-        prompt = f"Create a quick quiz about {topic} with {num_questions} questions at {difficulty} difficulty level."
+        Args:
+            prompt: Activity prompt
+            mode: Processor mode for the prompt
+            context: Session context
+            user_id: User ID
+            processor: Message processor
+            
+        Returns:
+            Response text
+        """
+        # Responses draw on the user's conversation history, so they are not shared across users
+        key = (user_id, mode, prompt, context)
+        cached = self._activity_cache.get(key)
+        if cached is not None:
+            return cached
         
-        result = await processor.process_message(
-            user_id=user_id,
-            message=prompt,
-            mode="quiz",
-            vector_search_client=None
-        )
+        shared = await self._await_inflight(key)
+        if shared is not None:
+            return shared
         
-        return result["response"]
+        future = asyncio.get_running_loop().create_future()
+        self._activity_inflight[key] = future
+        try:
+            result = await processor.process_message(
+                user_id=user_id,
+                message=prompt,
+                mode=mode,
+                vector_search_client=None,
+                context=context
+            )
+        except Exception as e:
+            # Waiters get the same error; retrieve it here so an unwatched future doesn't warn
+            future.set_exception(e)
+            future.exception()
+            raise
+        except BaseException:
+            # This call was cancelled; waiters make the call themselves
+            future.cancel()
+            raise
+        else:
+            response = result["response"]
+            if not result.get("error"):
+                self._activity_cache[key] = response
+            future.set_result(response)
+            return response
+        finally:
+            self._activity_inflight.pop(key, None)
     
-    async def _execute_flashcard(self, parameters: Dict[str, Any], context: str, user_id: str, processor) -> str:
-        """Execute a flashcard activity"""
-        topic = parameters.get("topic", "the topic")
-        num_cards = parameters.get("num_cards", 5)
-        
-        prompt = f"Create {num_cards} flashcards covering the key concepts of {topic}."
-        
-        result = await processor.process_message(
-            user_id=user_id,
-            message=prompt,
-            mode="flashcard",
-            vector_search_client=None
-        )
+    async def _await_inflight(self, key: tuple) -> Optional[str]:
+        """
+        Wait for an in-flight call for the same prompt and return its response
         
-        return result["response"]
+        Returns None when there is no call to share, including when the shared
+        call was cancelled, so the caller makes the call itself. Errors from the
+        shared call are raised to every waiter.
+        """
+        while (inflight := self._activity_inflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only retry when the shared call was cancelled, not this caller
+                if not inflight.cancelled():
+                    raise
+        return None
     
-    async def _execute_summary(self, parameters: Dict[str, Any], context: str, user_id: str, processor) -> str:
-        """Execute a summary activity"""
-        topic = parameters.get("topic", "the topic")
-        prompt = f"Create a brief summary of the key points about {topic}, highlighting what's most important to remember. Keep it concise, under 150 words."
+    async def _generate_stream(self, prompt: str, mode: str, context: str, user_id: str,
+                               processor) -> AsyncIterator[str]:
+        """
+        Stream an activity response, replaying a cached or in-flight response whole
+        
+        A streamed response is cached once it completes, so later non-streaming
+        requests for the same prompt reuse it.
+        """
+        # Responses draw on the user's conversation history, so they are not shared across users
+        key = (user_id, mode, prompt, context)
+        cached = self._activity_cache.get(key)
+        if cached is None:
+            cached = await self._await_inflight(key)
+        if cached is not None:
+            yield cached
+            return
         
-        result = await processor.process_message(
+        chunks = []
+        async for chunk in processor.process_message_stream(
             user_id=user_id,
             message=prompt,
-            mode="chat",
-            vector_search_client=None
-        )
-        
-        return result["response"]
+            mode=mode,
+            vector_search_client=None,
+            context=context
+        ):
+            chunks.append(chunk)
+            yield chunk
+        self._activity_cache[key] = "".join(chunks)
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get a session by ID"""
-        return self.active_sessions.get(session_id)
+    async def get_session(self, session_id: str, db = None) -> Optional[Dict[str, Any]]:
+        """Get a session by ID, loading it from the database if a session is given"""
+        return await self._load_plan(session_id, db)
     
     def get_active_sessions(self, user_id: str = None) -> List[Dict[str, Any]]:
         """Get all active sessions, optionally filtered by user ID"""
@@ -1,10 +1,24 @@
 # app/core/sk/connectors/processor_adapter.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 import os
 import json
+import logging
 import semantic_kernel as sk
-from semantic_kernel.planners.sequential_planner import SequentialPlanner
 from app.core.message_processor import MessageProcessor
+from app.core.sk.skills.quiz_skill import register_quiz_skill
+from app.core.sk.skills.flashcard_skill import register_flashcard_skill
+from app.core.sk.skills.tutor_skill import register_tutor_skill
+from app.core.sk.skills.chat_skill import register_chat_skill
+
+logger = logging.getLogger(__name__)
+
+# Kernel (plugin, function) that handles each chat mode; unknown modes use chat
+MODE_FUNCTIONS = {
+    "chat": ("ChatSkill", "GenerateResponse"),
+    "tutor": ("TutorSkill", "GenerateTutoringResponse"),
+    "quiz": ("QuizSkill", "GenerateQuizResponse"),
+    "flashcard": ("FlashcardSkill", "GenerateFlashcardResponse")
+}
 
 class SKMessageProcessor(MessageProcessor):
     """Semantic Kernel implementation of MessageProcessor"""
@@ -14,7 +28,9 @@ class SKMessageProcessor(MessageProcessor):
         super().__init__()
         # Defer the kernel import until it's actually needed
         self.kernel = None
-        self.planner = None
+        self._mode_functions = {}
+        # Per-user (last entry, formatted lines, formatted text) for incremental formatting
+        self._formatted_history = {}
         
     def _ensure_kernel(self):
         """Lazy-load the kernel and initialize components only when needed"""
@@ -24,43 +40,53 @@ class SKMessageProcessor(MessageProcessor):
             self.kernel = get_kernel()
             # Register skills
             self._register_skills()
-            # Create planner with service_id parameter for SK 1.28.1
-            self.planner = SequentialPlanner(self.kernel, service_id="github")
+            # Resolve each mode's kernel function once instead of on every message
+            self._mode_functions = {
+                mode: self.kernel.get_function(plugin_name, function_name)
+                for mode, (plugin_name, function_name) in MODE_FUNCTIONS.items()
+            }
     
     def _register_skills(self):
         """Register all required skills with the kernel"""
-        # Import skills here to avoid circular imports
-        from app.core.sk.skills.quiz_skill import register_quiz_skill
-        from app.core.sk.skills.flashcard_skill import register_flashcard_skill
-        from app.core.sk.skills.tutor_skill import register_tutor_skill
-        from app.core.sk.skills.chat_skill import register_chat_skill
-        
         register_quiz_skill(self.kernel)
         register_flashcard_skill(self.kernel)
         register_tutor_skill(self.kernel)
         register_chat_skill(self.kernel)
     
-    async def process_message(self, user_id: str, message: str, mode: str = "chat", 
-                             vector_search_client=None) -> Dict[str, Any]:
-        """Process a message using Semantic Kernel"""
+    def _get_formatted_history(self, user_id: str, history: List[Dict[str, str]]) -> str:
+        """Format a user's history, reusing the text maintained by _append_history"""
+        cached = self._formatted_history.get(user_id)
+        if cached and history and len(cached[1]) == len(history) and cached[0] is history[-1]:
+            return cached[2]
+        formatted = self._format_history(history)
+        if history:
+            lines = [self._format_entry(entry) for entry in history]
+            self._formatted_history[user_id] = (history[-1], lines, formatted)
+        return formatted
+    
+    async def _process_message(self, user_id: str, message: str, mode: str,
+                               vector_search_client, context: str = None) -> Dict[str, Any]:
+        """Process a message using Semantic Kernel, behind the base class's in-flight sharing"""
         # Ensure kernel is loaded and components are initialized
         self._ensure_kernel()
         
-        # Get conversation history for context
-        history = self.conversation_history.get(user_id, [])
-        formatted_history = self._format_history(history)
-        
-        # Retrieve context from vector store
+        # Retrieve context from vector store unless the caller supplied it
         search_results = None
-        context = ""
         context_sources = []
-        if vector_search_client:
+        supplied_context = context
+        if context is None:
+            context = ""
+        if supplied_context is None and vector_search_client:
             # Import here to avoid circular imports
             from app.utils.context_retrieval import retrieve_enhanced_context, format_context_by_source
             search_results = await retrieve_enhanced_context(vector_search_client, message)
             context, context_sources = format_context_by_source(search_results)
         
         try:
+            # Get conversation history for context
+            history = self.conversation_history.get(user_id, [])
+            formatted_history = self._get_formatted_history(user_id, history)
+            
             # Use SK's planning capabilities to process the message
             # Create variables for the planner - using KernelArguments for SK 1.28.1
             from semantic_kernel.functions import KernelArguments
@@ -72,43 +98,46 @@ class SKMessageProcessor(MessageProcessor):
                 user_id=user_id  # Added user_id for functions that need it
             )
             
-            # Create a plan and execute it
-            if mode == "chat":
-                function_name = "ChatSkill.GenerateResponse"
-            elif mode == "tutor":
-                function_name = "TutorSkill.GenerateTutoringResponse"
-            elif mode == "quiz":
-                function_name = "QuizSkill.GenerateQuizResponse"
-            elif mode == "flashcard":
-                function_name = "FlashcardSkill.GenerateFlashcardResponse"
-            else:
-                function_name = "ChatSkill.GenerateResponse"  # Default to chat
-            
-            # Get the function and execute it - updated for SK 1.28.1 API
-            plugin_name, function_name = function_name.split('.')
-            result = await self.kernel.invoke(
-                function_name=function_name,
-                plugin_name=plugin_name,
-                arguments=arguments
-            )
+            # Execute the function for this mode
+            function = self._mode_functions.get(mode) or self._mode_functions["chat"]
+            result = await function.invoke(self.kernel, arguments)
             response_text = str(result)
             
-            # Update conversation history
-            history.append({"role": "user", "content": message})
-            history.append({"role": "assistant", "content": response_text})
-            
-            # Keep history to a reasonable size
-            if len(history) > 20:
-                history = history[-20:]
-            self.conversation_history[user_id] = history
+            # The tutor skill tracks its own session, so only the history is updated
+            self._append_history(user_id, message, response_text)
             
             return {
                 "response": response_text,
                 "context_used": context_sources
             }
         except Exception as e:
-            print(f"Error processing message with SK: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error processing message with SK: %s", e)
             # Fall back to the original implementation
-            return await super().process_message(user_id, message, mode, vector_search_client)
\ No newline at end of file
+            return await super()._process_message(user_id, message, mode, vector_search_client, supplied_context)
+    
+    def _append_history(self, user_id: str, message: str, response_text: str) -> None:
+        """Append an exchange to the user's history, keeping its formatted lines in step"""
+        history = self.conversation_history.get(user_id, [])
+        # Formatting the current history leaves its lines in the cache
+        self._get_formatted_history(user_id, history)
+        lines = self._formatted_history[user_id][1] if history else []
+        super()._append_history(user_id, message, response_text)
+        history = self.conversation_history[user_id]
+        
+        # Add the new turn's lines and drop the oldest ones along with the trimmed entries
+        lines = lines + [self._format_entry(entry) for entry in history[-2:]]
+        lines = lines[-len(history):]
+        self._formatted_history[user_id] = (history[-1], lines, "\n".join(lines))
+    
+    async def process_message_stream(self, user_id: str, message: str, mode: str = "chat",
+                                     vector_search_client=None, context: str = None) -> AsyncIterator[str]:
+        """
+        Process a message using Semantic Kernel, yielding the response as one chunk
+        
+        The registered skill functions return complete responses, so there are no
+        partial results to forward.
+        """
+        result = await self.process_message(user_id, message, mode, vector_search_client, context)
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        yield result["response"]
@@ -1,14 +1,13 @@
 # app/core/sk/kernel_factory.py
 import os
+import threading
 import semantic_kernel as sk
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
-# load the environment variables from .env file
-from dotenv import load_dotenv
-load_dotenv()
 
 class KernelFactory:
     def __init__(self) -> None:
         self._kernel: sk.Kernel | None = None
+        self._lock = threading.Lock()
         self._api_key   = os.getenv("GITHUB_TOKEN")
         self._endpoint  = os.getenv("ENDPOINT", "https://models.inference.ai.azure.com")
         # Get model name and ensure it doesn't have the "openai/" prefix for SK 1.28.1 compatibility
@@ -16,8 +15,11 @@ class KernelFactory:
         self._model = model_env.split("/")[-1] if "/" in model_env else model_env
 
     def get_kernel(self) -> sk.Kernel:
+        # Double-checked so concurrent first requests build only one kernel
         if self._kernel is None:
-            self._kernel = self._build_kernel()
+            with self._lock:
+                if self._kernel is None:
+                    self._kernel = self._build_kernel()
         return self._kernel
 
     def _build_kernel(self) -> sk.Kernel:
@@ -1,17 +1,151 @@
 # app/core/sk/planners/study_planner.py
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import datetime
+import logging
+import orjson
 import semantic_kernel as sk
 import re  # Added import for regex
-from semantic_kernel.planners.sequential_planner import SequentialPlanner
+from cachetools import TTLCache
+from sqlalchemy import func
 # Import the correct ChatHistory class for Semantic Kernel 1.28.1
 from semantic_kernel.contents.chat_history import ChatHistory
-from app.core.study_planner import StudyPlanGenerator
+from app.core.study_planner import StudyPlanGenerator, DAY_NAMES, PLAN_DAYS, plan_week
+from app.utils.json_scan import JsonObjectScanner
 
 # Import the PromptExecutionSettings class to create settings for the chat completion
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 
+logger = logging.getLogger(__name__)
+
+# Patterns for building a plan from a response that is not JSON
+DAY_NAME_RE = re.compile("|".join(DAY_NAMES), re.IGNORECASE)
+TOPIC_LINE_RE = re.compile(r"[*-]\s+([A-Za-z\s]+)(?:\(|:|\n)")
+ACTIVITY_RE = re.compile(r"([A-Za-z\s]+)(?:\((\d+)\s*min(?:utes)?\))?")
+GOALS_SECTION_RE = re.compile(
+    rf"(?:Weekly Goals|Goals|Objectives):?\s*(.*?)(?=$|(?:{'|'.join(DAY_NAMES)}))",
+    re.DOTALL | re.IGNORECASE
+)
+GOAL_ITEM_RE = re.compile(r'(?:^|\n)(?:\d+\.?|[-*•])\s*(.*?)(?=\n\d+\.?|$|\n[-*•])')
+
+# Parses a plan object that has text before or after it
+PLAN_DECODER = json.JSONDecoder()
+
+# Generated plans are reused while a user's progress stays about the same
+PLAN_CACHE_SIZE = 1024
+PLAN_CACHE_TTL_SECONDS = 600
+# Proficiency and confidence are compared to one decimal place, interactions by day
+PROGRESS_CACHE_PRECISION = 1
+
+_plan_cache = TTLCache(maxsize=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL_SECONDS)
+
+# Loaded progress by user, reused until the user's progress records change
+PROGRESS_CACHE_SIZE = 1024
+PROGRESS_CACHE_TTL_SECONDS = 3600
+
+_progress_cache = TTLCache(maxsize=PROGRESS_CACHE_SIZE, ttl=PROGRESS_CACHE_TTL_SECONDS)
+
+# Static instructions come first so the provider can cache the shared prompt prefix
+PLAN_SYSTEM_PROMPT = """You are a specialized study plan generator that creates personalized learning schedules.
+Create a 7-day personalized study plan for the user based on the learning progress data they send.
+
+The progress data is a tab-separated table with a header row and one row per topic:
+topic name, proficiency (0-1), confidence (0-1), and days since the topic was last studied
+("-" if unknown).
+
+FORMAT:
+Return a JSON object with this structure:
+{
+    "user_id": "the user's ID",
+    "generated_at": "current_date_time",
+    "schedule": [
+        {
+            "date": "YYYY-MM-DD",
+            "day_of_week": "Monday",
+            "topics": [
+                {
+                    "topic": "Topic Name",
+                    "activities": [
+                        {
+                            "type": "quiz|flashcard|reading|practice",
+                            "duration": minutes_as_integer,
+                            "description": "Activity description"
+                        }
+                    ],
+                    "total_duration": sum_of_activity_durations
+                }
+            ],
+            "total_duration": sum_of_topic_durations
+        }
+    ],
+    "weekly_goals": [
+        "Goal 1",
+        "Goal 2"
+    ]
+}
+
+RULES:
+1. Prioritize topics with low proficiency (< 0.5)
+2. Include topics not studied recently (> 7 days)
+3. Balance activities based on learning needs
+4. Keep daily study time reasonable (30-120 minutes)
+5. Include 2-3 specific weekly goals
+6. Weekly goals should be concrete and measurable
+
+The plan should be adaptive to the student's strengths and weaknesses."""
+
+# Template conversation copied for each request
+PLAN_HISTORY = ChatHistory()
+PLAN_HISTORY.add_system_message(PLAN_SYSTEM_PROMPT)
+
+def _plan_cache_key(user_id: str, progress_data: Dict[str, Any]) -> Tuple:
+    """Build a cache key that ignores small changes in a user's progress"""
+    topics = progress_data.get("topics") or {}
+    return (user_id, tuple(sorted(
+        (
+            topic,
+            round(data.get("proficiency") or 0.0, PROGRESS_CACHE_PRECISION),
+            round(data.get("confidence") or 0.0, PROGRESS_CACHE_PRECISION),
+            str(data.get("last_interaction", ""))[:10]
+        )
+        for topic, data in topics.items()
+    )))
+
+def _format_progress_table(progress_data: Dict[str, Any], now: datetime.datetime) -> str:
+    """
+    Render progress data as a compact tab-separated table for the planning prompt
+    
+    Args:
+        progress_data: Progress data with a topics mapping
+        now: Current naive UTC time, for the days since each topic was studied
+        
+    Returns:
+        Header row followed by one row per topic
+    """
+    lines = ["topic\tproficiency\tconfidence\tdays_ago"]
+    for topic, data in (progress_data.get("topics") or {}).items():
+        try:
+            days_ago = (now - datetime.datetime.fromisoformat(data["last_interaction"])).days
+        except (KeyError, TypeError, ValueError):
+            days_ago = "-"
+        lines.append(
+            f"{topic}\t{data.get('proficiency') or 0.0:.2f}\t{data.get('confidence') or 0.0:.2f}\t{days_ago}"
+        )
+    return "\n".join(lines)
+
+def _copy_plan(plan: Dict[str, Any], days: int = 0) -> Dict[str, Any]:
+    """Copy a cached plan, moving its schedule forward by a number of days"""
+    plan = orjson.loads(orjson.dumps(plan))
+    if days and isinstance(plan, dict):
+        for day in plan.get("schedule") or []:
+            try:
+                day_date = datetime.date.fromisoformat(day["date"]) + datetime.timedelta(days=days)
+            except (KeyError, TypeError, ValueError):
+                continue
+            day["date"] = day_date.isoformat()
+            day["day_of_week"] = DAY_NAMES[day_date.weekday()]
+    return plan
+
 class SKStudyPlanGenerator(StudyPlanGenerator):
     """Semantic Kernel implementation of study planning"""
     
@@ -20,16 +154,18 @@ class SKStudyPlanGenerator(StudyPlanGenerator):
         super().__init__()
         # Defer the kernel import until it's actually needed
         self.kernel = None
-        self.planner = None
+        self._chat_service = None
+        self._execution_settings = None
     
     def _ensure_kernel(self):
-        """Lazy-load the kernel and planner only when needed"""
+        """Lazy-load the shared kernel, its chat service and default settings only when needed"""
         if self.kernel is None:
             # Import here to avoid circular dependency
             from app.core.sk.kernel_factory import get_kernel
-            self.kernel = get_kernel()
-            # Create planner
-            self.planner = SequentialPlanner(self.kernel, service_id="study_planner")
+            kernel = get_kernel()
+            self._chat_service = kernel.get_service("github")
+            self._execution_settings = PromptExecutionSettings()
+            self.kernel = kernel
     
     async def generate_plan(self, db, user_id: str, progress_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """Generate a personalized study plan using Semantic Kernel planning"""
@@ -42,140 +178,167 @@ class SKStudyPlanGenerator(StudyPlanGenerator):
                 # Use the parent class method to get progress data
                 progress_data = await self._get_progress_data(db, user_id)
             
-            # Convert progress data to string format for the planner
-            progress_json = json.dumps(progress_data, indent=2)
-            
-            # Create the planner prompt
-            plan_prompt = f"""
-            You are a specialized study plan generator. Create a 7-day personalized study plan
-            for user {user_id} based on their learning progress data below.
-            
-            PROGRESS DATA:
-            {progress_json}
+            # Without any tracked topics there is nothing to personalize
+            if not progress_data.get("topics"):
+                return self._generate_empty_plan(user_id)
             
-            FORMAT:
-            Return a JSON object with this structure:
-            {{
-                "user_id": "{user_id}",
-                "generated_at": "current_date_time",
-                "schedule": [
-                    {{
-                        "date": "YYYY-MM-DD",
-                        "day_of_week": "Monday",
-                        "topics": [
-                            {{
-                                "topic": "Topic Name",
-                                "activities": [
-                                    {{
-                                        "type": "quiz|flashcard|reading|practice",
-                                        "duration": minutes_as_integer,
-                                        "description": "Activity description"
-                                    }}
-                                ],
-                                "total_duration": sum_of_activity_durations
-                            }}
-                        ],
-                        "total_duration": sum_of_topic_durations
-                    }}
-                ],
-                "weekly_goals": [
-                    "Goal 1",
-                    "Goal 2"
-                ]
-            }}
+            # Reuse a recent plan generated from the same progress
+            cache_key = _plan_cache_key(user_id, progress_data)
+            today = datetime.datetime.utcnow().date()
+            cached = _plan_cache.get(cache_key)
+            if cached is not None:
+                cached_on, cached_plan = cached
+                return _copy_plan(cached_plan, (today - cached_on).days)
             
-            RULES:
-            1. Prioritize topics with low proficiency (< 0.5)
-            2. Include topics not studied recently (> 7 days)
-            3. Balance activities based on learning needs
-            4. Keep daily study time reasonable (30-120 minutes)
-            5. Include 2-3 specific weekly goals
-            6. Weekly goals should be concrete and measurable
-            
-            The plan should be adaptive to the student's strengths and weaknesses.
-            """
-            
-            # Execute using SK reasoning
-            chat_completion_service = self.kernel.get_service("github")
+            # Only the user-specific part of the prompt changes between requests
+            plan_prompt = f"""Create the study plan for user {user_id}.
+
+PROGRESS DATA:
+{_format_progress_table(progress_data, datetime.datetime.utcnow())}"""
             
-            # Create chat history using the correct import
-            chat_history = ChatHistory()
-            chat_history.add_system_message("You are a specialized study plan generator that creates personalized learning schedules.")
+            # Copy the template conversation and add this user's request
+            chat_history = ChatHistory(messages=list(PLAN_HISTORY.messages))
             chat_history.add_user_message(plan_prompt)
             
-            # Create the execution settings required by the get_chat_message_content method
-            execution_settings = PromptExecutionSettings()
+            # Execute using SK reasoning
+            result = await self._stream_plan_response(self._chat_service, chat_history, self._execution_settings)
             
-            # Updated to use the correct method in SK 1.28.1 with required settings parameter
-            completion = await chat_completion_service.get_chat_message_content(chat_history, settings=execution_settings)
-            result = completion.content
+            plan_data = self._decode_plan(result)
+            if plan_data is None:
+                # A plan scraped from prose is not cached, so the next request asks the model again
+                return self._plan_from_text(result, user_id)
             
-            # Try to parse the result as JSON
-            try:
-                plan_data = json.loads(result)
-                return plan_data
-            except json.JSONDecodeError:
-                # If parsing fails, create a structured plan from the text
-                
-                # Create a basic structure
-                now = datetime.datetime.utcnow()
-                schedule = []
-                
-                # Generate a week of dates
-                for i in range(7):
-                    day_date = now + datetime.timedelta(days=i)
-                    schedule.append({
-                        "date": day_date.strftime("%Y-%m-%d"),
-                        "day_of_week": day_date.strftime("%A"),
-                        "topics": self._extract_topics_from_text(result, day_date.strftime("%A")),
-                        "total_duration": 60  # Default
-                    })
-                
-                return {
-                    "user_id": user_id,
-                    "generated_at": now.isoformat(),
-                    "schedule": schedule,
-                    "weekly_goals": self._extract_goals_from_text(result)
-                }
+            # Drop any days the model generated past the week
+            if isinstance(plan_data, dict) and isinstance(plan_data.get("schedule"), list):
+                del plan_data["schedule"][PLAN_DAYS:]
+            _plan_cache[cache_key] = (today, plan_data)
+            return _copy_plan(plan_data)
                 
         except Exception as e:
-            print(f"Error generating study plan with SK: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error generating study plan with SK: %s", e)
             # Fall back to the original implementation
             return await super().generate_plan(db, user_id, progress_data)
     
-    def _extract_topics_from_text(self, text: str, day_name: str) -> List[Dict[str, Any]]:
-        """Extract topics and activities for a day from text"""
-        topics = []
+    async def _stream_plan_response(self, chat_completion_service, chat_history, execution_settings) -> str:
+        """
+        Stream the plan response, stopping as soon as the plan's JSON object is complete
+        
+        Args:
+            chat_completion_service: Chat completion service to generate with
+            chat_history: Planning conversation
+            execution_settings: Prompt execution settings
+            
+        Returns:
+            The response text received
+        """
+        parts = []
+        scanner = JsonObjectScanner()
+        stream = chat_completion_service.get_streaming_chat_message_content(
+            chat_history, settings=execution_settings
+        )
+        try:
+            async for chunk in stream:
+                text = chunk.content if chunk is not None else None
+                if not text:
+                    continue
+                parts.append(text)
+                if scanner.feed(text):
+                    break
+        finally:
+            # Closing the stream ends the request instead of reading any trailing prose
+            await stream.aclose()
+        return "".join(parts)
+    
+    def _plan_from_text(self, result: str, user_id: str) -> Dict[str, Any]:
+        """Build a structured plan from a response that has no plan JSON"""
+        now = datetime.datetime.utcnow()
+        schedule = []
+        
+        # Find every day's section in one pass over the text
+        day_sections = self._find_day_sections(result)
+        
+        # Generate a week of dates
+        for date_str, day_name in plan_week(now.date()):
+            schedule.append({
+                "date": date_str,
+                "day_of_week": day_name,
+                "topics": self._extract_topics_from_text(day_sections.get(day_name)),
+                "total_duration": 60  # Default
+            })
+        
+        return {
+            "user_id": user_id,
+            "generated_at": now.isoformat(),
+            "schedule": schedule,
+            "weekly_goals": self._extract_goals_from_text(result)
+        }
+    
+    def _decode_plan(self, result: str) -> Any:
+        """Decode the plan JSON from a response, or return None if it has none"""
+        # Try to parse the result as JSON
+        try:
+            return orjson.loads(result)
+        except orjson.JSONDecodeError:
+            pass
+        
+        # Accept a JSON object wrapped in markdown fences or followed by prose
+        start = result.find("{")
+        if start != -1:
+            try:
+                plan_data, _ = PLAN_DECODER.raw_decode(result, start)
+                if isinstance(plan_data, dict):
+                    return plan_data
+            except json.JSONDecodeError:
+                pass
+        return None
+    
+    def _find_day_sections(self, text: str) -> Dict[str, str]:
+        """
+        Split plan text into sections by day name
         
-        # Try to find the section for this day
-        day_pattern = rf"{day_name}:?.*?(?=(?:Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)|$)"
-        day_match = re.search(day_pattern, text, re.DOTALL | re.IGNORECASE)
+        Each day's section runs from the first mention of the day to the next
+        mention of any day, or to the end of the text.
         
-        if day_match:
-            day_text = day_match.group(0)
+        Args:
+            text: Plan text
             
+        Returns:
+            Dict mapping each day mentioned to its section text
+        """
+        sections = {}
+        # The end of the text, ignoring one trailing newline
+        text_end = len(text) - 1 if text.endswith("\n") else len(text)
+        matches = list(DAY_NAME_RE.finditer(text))
+        for match, next_match in zip(matches, matches[1:] + [None]):
+            day_name = match.group().capitalize()
+            if day_name not in sections:
+                sections[day_name] = text[match.start():next_match.start() if next_match else text_end]
+        return sections
+    
+    def _extract_topics_from_text(self, day_text: Optional[str]) -> List[Dict[str, Any]]:
+        """Extract topics and activities from a day's section of the plan text"""
+        topics = []
+        
+        if day_text:
             # Look for topic names
-            topic_pattern = r"[*-]\s+([A-Za-z\s]+)(?:\(|:|\n)"
-            topic_matches = re.finditer(topic_pattern, day_text)
+            topic_matches = TOPIC_LINE_RE.finditer(day_text)
             
             for topic_match in topic_matches:
                 topic_name = topic_match.group(1).strip()
                 
                 # Extract activities for this topic
                 activities = []
-                activities_text = day_text[topic_match.end():]
-                activity_pattern = r"([A-Za-z\s]+)(?:\((\d+)\s*min(?:utes)?\))?"
-                activity_matches = re.finditer(activity_pattern, activities_text)
+                # Scan from the end of the topic line rather than copying the rest of the day
+                activity_matches = ACTIVITY_RE.finditer(day_text, topic_match.end())
                 
                 for i, activity_match in enumerate(activity_matches):
                     if i >= 3:  # Limit to 3 activities per topic
                         break
-                        
-                    activity_type = "quiz" if "quiz" in activity_match.group(1).lower() else \
-                                  "flashcard" if "flashcard" in activity_match.group(1).lower() else \
-                                  "reading" if "read" in activity_match.group(1).lower() else "practice"
+                    
+                    activity_text = activity_match.group(1).lower()
+                    activity_type = "quiz" if "quiz" in activity_text else \
+                                  "flashcard" if "flashcard" in activity_text else \
+                                  "reading" if "read" in activity_text else "practice"
                                   
                     duration = int(activity_match.group(2)) if activity_match.group(2) else 20
                     
@@ -219,13 +382,12 @@ class SKStudyPlanGenerator(StudyPlanGenerator):
         goals = []
         
         # Look for goals section
-        goals_pattern = r"(?:Weekly Goals|Goals|Objectives):?\s*(.*?)(?=$|(?:Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday))"
-        goals_match = re.search(goals_pattern, text, re.DOTALL | re.IGNORECASE)
+        goals_match = GOALS_SECTION_RE.search(text)
         
         if goals_match:
             goals_text = goals_match.group(1).strip()
             # Extract bullet points or numbered items
-            goal_items = re.findall(r'(?:^|\n)(?:\d+\.?|[-*•])\s*(.*?)(?=\n\d+\.?|$|\n[-*•])', goals_text)
+            goal_items = GOAL_ITEM_RE.findall(goals_text)
             
             if goal_items:
                 goals = [item.strip() for item in goal_items if item.strip()]
@@ -248,20 +410,39 @@ class SKStudyPlanGenerator(StudyPlanGenerator):
             
         from app.models import models
         
+        progress_table = models.ProgressTracking
+        
+        # Every progress update moves last_interaction, so the latest one (read from
+        # the user/last_interaction index) and the row count tell whether anything changed
+        watermark = db.query(
+            func.max(progress_table.last_interaction),
+            func.count(progress_table.id)
+        ).filter(progress_table.user_id == user_id).one()
+        watermark = tuple(watermark)
+        
+        cached = _progress_cache.get(user_id)
+        if cached is not None and cached[0] == watermark:
+            return cached[1]
+        
         # Get all progress records for this user
-        progress_records = db.query(models.ProgressTracking).filter(
-            models.ProgressTracking.user_id == user_id
-        ).all()
+        progress_records = db.query(
+            progress_table.topic,
+            progress_table.proficiency,
+            progress_table.confidence,
+            progress_table.last_interaction
+        ).filter(progress_table.user_id == user_id).all()
         
         topics_data = {}
-        for record in progress_records:
-            topics_data[record.topic] = {
-                "proficiency": record.proficiency,
-                "confidence": record.confidence,
-                "last_interaction": record.last_interaction.isoformat()
+        for topic, proficiency, confidence, last_interaction in progress_records:
+            topics_data[topic] = {
+                "proficiency": proficiency,
+                "confidence": confidence,
+                "last_interaction": last_interaction.isoformat()
             }
         
-        return {
+        progress_data = {
             "user_id": user_id,
             "topics": topics_data
-        }
\ No newline at end of file
+        }
+        _progress_cache[user_id] = (watermark, progress_data)
+        return progress_data
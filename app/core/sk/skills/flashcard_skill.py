@@ -1,12 +1,26 @@
 # app/core/sk/skills/flashcard_skill.py
 from typing import Dict, Any, List
-import json
+import orjson
+import asyncio
 import semantic_kernel as sk
 # Updated imports for Semantic Kernel 1.28.1
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 from app.core.flashcard_generator import FlashcardGenerator
+from app.core.sk.skills.response_cache import SkillResponseCache, valid_params
+
+# Upper bound on concurrent LLM calls for a batch, to stay inside provider rate limits
+MAX_CONCURRENT_REQUESTS = 8
+
+# Used when the LLM's parameters can't be parsed
+DEFAULT_PARAMS = {
+    "num_cards": 8,
+    "topic": None
+}
+
+# Shared by every kernel's FlashcardSkill
+_response_cache = SkillResponseCache()
 
 class FlashcardSkill:
     """Semantic Kernel implementation of flashcard generation functionality"""
@@ -15,6 +29,16 @@ class FlashcardSkill:
         """Initialize the flashcard skill"""
         self.kernel = kernel
         self.flashcard_gen = FlashcardGenerator()
+        # Resolved on first use so the kernel's services can be added after the skill
+        self._chat_service = None
+        # Create settings - using PromptExecutionSettings for SK 1.28.1
+        self._execution_settings = PromptExecutionSettings()
+    
+    def _get_chat_service(self):
+        """Look up the kernel's chat service once and reuse it"""
+        if self._chat_service is None:
+            self._chat_service = self.kernel.get_service("github")
+        return self._chat_service
     
     @kernel_function(
         description="Generate flashcards based on educational content",
@@ -23,20 +47,37 @@ class FlashcardSkill:
     async def generate_flashcards(self, context: str, num_cards: str = "8", 
                                 topic: str = None) -> str:
         """Generate flashcards using SK function format"""
-        # Get the LLM service
-        chat_service = self.kernel.get_service("github")
-        
-        # Use the existing FlashcardGenerator but with SK's LLM
-        flashcard_result = await self.flashcard_gen.generate_flashcards(
-            context=context,
-            num_cards=int(num_cards),
-            topic=topic,
-            client=chat_service._client,
-            model_name=chat_service._ai_model_id
-        )
+        flashcard_result = await self._generate_flashcards_dict(context, int(num_cards), topic)
         
         # Convert to string format for SK
-        return json.dumps(flashcard_result)
+        return orjson.dumps(flashcard_result).decode()
+    
+    async def _generate_flashcards_dict(self, context: str, num_cards: int = 8,
+                                        topic: str = None) -> Dict[str, Any]:
+        """
+        Generate flashcards for in-process callers, skipping the SK string format
+        
+        The result may be shared with the response cache and must not be modified.
+        """
+        # Reuse cards generated for the same content and parameters
+        cache_key = (num_cards, topic or None)
+        flashcard_result = _response_cache.get_result(context, cache_key)
+        
+        if flashcard_result is None:
+            # Get the LLM service
+            chat_service = self._get_chat_service()
+            
+            # Use the existing FlashcardGenerator but with SK's LLM
+            flashcard_result = await self.flashcard_gen.generate_flashcards(
+                context=context,
+                num_cards=num_cards,
+                topic=topic,
+                client=chat_service._client,
+                model_name=chat_service._ai_model_id
+            )
+            _response_cache.set_result(context, cache_key, flashcard_result)
+        
+        return flashcard_result
     
     @kernel_function(
         description="Generate a flashcard response for the conversation",
@@ -44,8 +85,74 @@ class FlashcardSkill:
     )
     async def generate_flashcard_response(self, input: str, context: str, history: str) -> str:
         """Generate a conversational response for flashcard requests"""
+        params = await self._extract_params(input)
+        
+        # Generate the flashcards
+        flashcard_result = await self._generate_flashcards_dict(
+            context=context,
+            num_cards=int(params.get("num_cards", 8)),
+            topic=params.get("topic")
+        )
+        
+        return self._format_response(flashcard_result)
+    
+    async def generate_many(self, inputs: List[str], context: str, history: str,
+                            max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> List[str]:
+        """
+        Generate flashcard responses for several requests at once
+        
+        All parameter extractions run concurrently, then all generations, so a
+        batch costs about two LLM round-trips instead of two per request.
+        
+        Args:
+            inputs: User messages asking for flashcards
+            context: Educational content shared by every request
+            history: Conversation history
+            max_concurrency: Maximum number of LLM calls in flight at once
+            
+        Returns:
+            One response per input, in the same order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def extract(input: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._extract_params(input)
+        
+        async def generate(params: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._generate_flashcards_dict(
+                    context=context,
+                    num_cards=int(params.get("num_cards", 8)),
+                    topic=params.get("topic")
+                )
+        
+        extracted = await asyncio.gather(*(extract(input) for input in inputs), return_exceptions=True)
+        
+        # A failed extraction falls back to the default parameters
+        all_params = [
+            dict(DEFAULT_PARAMS) if isinstance(params, Exception) else params
+            for params in extracted
+        ]
+        
+        results = await asyncio.gather(*(generate(params) for params in all_params), return_exceptions=True)
+        
+        # Report a failed generation instead of failing the batch
+        return [
+            f"I couldn't generate flashcards for this request. Error details: {result}"
+            if isinstance(result, Exception) else self._format_response(result)
+            for result in results
+        ]
+    
+    async def _extract_params(self, input: str) -> Dict[str, Any]:
+        """Ask the LLM for the flashcard parameters in a user message"""
+        # Equivalent requests were already run through the extractor
+        params = _response_cache.get_params(input)
+        if params is not None:
+            return params
+        
         # Get chat service for LLM interactions
-        chat_service = self.kernel.get_service("github")
+        chat_service = self._get_chat_service()
         
         # Parse the request to determine parameters - updated for SK 1.28.1
         system_prompt = "You are a flashcard parameter extractor. Extract the parameters for flashcard generation from the user's message. Return a JSON with num_cards and topic."
@@ -55,41 +162,32 @@ class FlashcardSkill:
         param_chat_history.add_system_message(system_prompt)
         param_chat_history.add_user_message(input)
         
-        # Create settings - using PromptExecutionSettings for SK 1.28.1
-        settings = PromptExecutionSettings()
-        
         # Get parameters
-        chat_completion = await chat_service.get_chat_message_content(param_chat_history, settings)
+        chat_completion = await chat_service.get_chat_message_content(param_chat_history, self._execution_settings)
         
         try:
-            params = json.loads(chat_completion.content)
+            params = orjson.loads(chat_completion.content)
         except:
-            # Default parameters if extraction fails
-            params = {
-                "num_cards": 8,
-                "topic": None
-            }
+            params = None
         
-        # Generate the flashcards
-        flashcard_result = await self.generate_flashcards(
-            context=context,
-            num_cards=str(params.get("num_cards", 8)),
-            topic=params.get("topic")
-        )
-        
-        # Format the response
-        flashcard_data = json.loads(flashcard_result)
+        if valid_params(params):
+            _response_cache.set_params(input, params)
+        else:
+            # Default parameters if extraction fails or isn't a flat JSON object
+            params = dict(DEFAULT_PARAMS)
         
-        response = "Here are some flashcards based on the educational content:\n\n"
+        return params
+    
+    def _format_response(self, flashcard_data: Dict[str, Any]) -> str:
+        """Present generated flashcards as a chat message"""
+        parts = ["Here are some flashcards based on the educational content:\n\n"]
         
         for i, card in enumerate(flashcard_data.get("cards", [])):
-            response += f"Flashcard {i+1}:\n"
-            response += f"Front: {card.get('front', '')}\n"
-            response += f"Back: {card.get('back', '')}\n\n"
+            parts.append(f"Flashcard {i+1}:\nFront: {card.get('front', '')}\nBack: {card.get('back', '')}\n\n")
         
-        response += "Would you like to review these flashcards?"
+        parts.append("Would you like to review these flashcards?")
         
-        return response
+        return "".join(parts)
 
 class SKFlashcardGenerator(FlashcardGenerator):
     """SK adapter for FlashcardGenerator that maintains the same interface"""
@@ -99,6 +197,7 @@ class SKFlashcardGenerator(FlashcardGenerator):
         super().__init__()
         # Defer the kernel import until it's actually needed
         self.kernel = None
+        self.skill = None
     
     def _ensure_kernel(self):
         """Lazy-load the kernel only when needed"""
@@ -106,6 +205,7 @@ class SKFlashcardGenerator(FlashcardGenerator):
             # Import here to avoid circular dependency
             from app.core.sk.kernel_factory import get_kernel
             self.kernel = get_kernel()
+            self.skill = FlashcardSkill(self.kernel)
     
     async def generate_flashcards(self, context: str, num_cards: int = 8,
                                 topic: str = None, client=None, 
@@ -114,20 +214,11 @@ class SKFlashcardGenerator(FlashcardGenerator):
         # Ensure kernel is loaded
         self._ensure_kernel()
         
-        # Create variables for the function
-        context_variables = sk.ContextVariables()
-        context_variables["context"] = context
-        context_variables["num_cards"] = str(num_cards)
-        context_variables["topic"] = topic if topic else ""
-        
-        # Get the function
-        function = self.kernel.skills.get_function("FlashcardSkill", "GenerateFlashcards")
-        
         try:
-            # Execute the function
-            result = await self.kernel.run_async(function, input_vars=context_variables)
-            flashcard_result = json.loads(str(result))
-            return flashcard_result
+            # Call the skill directly; going through kernel.invoke would round-trip the result through JSON
+            flashcard_result = await self.skill._generate_flashcards_dict(context, num_cards, topic)
+            # Callers annotate the result, so give them their own copy of the cached one
+            return orjson.loads(orjson.dumps(flashcard_result))
         except Exception as e:
             print(f"Error generating flashcards with SK: {e}")
             # Fall back to the original implementation
@@ -1,9 +1,9 @@
 # app/core/sk/skills/personalization_skill.py
 from typing import Dict, Any, List, Optional
-import json
+import orjson
 import semantic_kernel as sk
 from semantic_kernel.functions import kernel_function
-from app.core.personalization_engine import PersonalizationEngine
+from app.core.personalization_engine import PersonalizationEngine, TopicSession
 
 class PersonalizationSkill:
     """Semantic Kernel implementation of personalization functionality"""
@@ -24,7 +24,7 @@ class PersonalizationSkill:
         
         # Parse history from string to list
         try:
-            conversation_history = json.loads(history) if history else []
+            conversation_history = orjson.loads(history) if history else []
         except:
             conversation_history = []
         
@@ -40,7 +40,7 @@ class PersonalizationSkill:
         )
         
         # Convert to string format for SK
-        return json.dumps(result)
+        return orjson.dumps(result).decode()
 
 class SKPersonalizationEngine(PersonalizationEngine):
     """SK adapter for PersonalizationEngine that maintains the same interface"""
@@ -69,7 +69,8 @@ class SKPersonalizationEngine(PersonalizationEngine):
         # For now, just use the parent class implementation
         return await super().analyze_learning_style(db, user_id, conversation_history)
     
-    async def adapt_content_for_style(self, content: Dict[str, Any], learning_style: Dict[str, Any]) -> Dict[str, Any]:
+    async def adapt_content_for_style(self, content: Dict[str, Any], learning_style: Dict[str, Any],
+                                      in_place: bool = False) -> Dict[str, Any]:
         """
         TODO: Implement a proper SK version of adapt_content_for_style
         For now, just use the base implementation
@@ -78,11 +79,11 @@ class SKPersonalizationEngine(PersonalizationEngine):
         self._ensure_kernel()
         
         # For now, just use the parent class implementation
-        return await super().adapt_content_for_style(content, learning_style)
+        return await super().adapt_content_for_style(content, learning_style, in_place=in_place)
     
     async def generate_personalized_quiz(self, db, user_id: str, topic: str, 
                                       quiz_generator=None, vector_client=None, 
-                                      processor=None) -> Dict[str, Any]:
+                                      processor=None, topic_session: Optional[TopicSession] = None) -> Dict[str, Any]:
         """
         TODO: Implement a proper SK version of generate_personalized_quiz
         For now, just use the base implementation
@@ -92,7 +93,8 @@ class SKPersonalizationEngine(PersonalizationEngine):
         
         # For now, just use the parent class implementation
         return await super().generate_personalized_quiz(
-            db, user_id, topic, quiz_generator, vector_client, processor
+            db, user_id, topic, quiz_generator, vector_client, processor,
+            topic_session=topic_session
         )
 
 def register_personalization_skill(kernel: sk.Kernel):
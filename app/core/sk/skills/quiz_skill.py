@@ -1,12 +1,27 @@
 # app/core/sk/skills/quiz_skill.py
 from typing import Dict, Any, List
-import json
+import orjson
+import asyncio
 import semantic_kernel as sk
 # Updated imports for Semantic Kernel 1.28.1
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 from app.core.quiz_generator import QuizGenerator
+from app.core.sk.skills.response_cache import SkillResponseCache, valid_params
+
+# Upper bound on concurrent LLM calls for a batch, to stay inside provider rate limits
+MAX_CONCURRENT_REQUESTS = 8
+
+# Used when the LLM's parameters can't be parsed
+DEFAULT_PARAMS = {
+    "num_questions": 5,
+    "difficulty": "medium",
+    "topic": None
+}
+
+# Shared by every kernel's QuizSkill
+_response_cache = SkillResponseCache()
 
 class QuizSkill:
     """Semantic Kernel implementation of quiz generation functionality"""
@@ -15,6 +30,16 @@ class QuizSkill:
         """Initialize the quiz skill"""
         self.kernel = kernel
         self.quiz_gen = QuizGenerator()
+        # Resolved on first use so the kernel's services can be added after the skill
+        self._chat_service = None
+        # Create settings - using PromptExecutionSettings for SK 1.28.1
+        self._execution_settings = PromptExecutionSettings()
+    
+    def _get_chat_service(self):
+        """Look up the kernel's chat service once and reuse it"""
+        if self._chat_service is None:
+            self._chat_service = self.kernel.get_service("github")
+        return self._chat_service
     
     @kernel_function(
         description="Generate a quiz based on educational content",
@@ -23,21 +48,38 @@ class QuizSkill:
     async def generate_quiz(self, context: str, num_questions: str = "5", 
                           difficulty: str = "medium", topic: str = None) -> str:
         """Generate a quiz using SK function format"""
-        # Get the LLM service
-        chat_service = self.kernel.get_service("github")
-        
-        # Use the existing QuizGenerator but with SK's LLM
-        quiz_result = await self.quiz_gen.generate_quiz(
-            context=context,
-            num_questions=int(num_questions),
-            difficulty=difficulty,
-            topic=topic,
-            client=chat_service._client,
-            model_name=chat_service._ai_model_id
-        )
+        quiz_result = await self._generate_quiz_dict(context, int(num_questions), difficulty, topic)
         
         # Convert to string format for SK
-        return json.dumps(quiz_result)
+        return orjson.dumps(quiz_result).decode()
+    
+    async def _generate_quiz_dict(self, context: str, num_questions: int = 5,
+                                  difficulty: str = "medium", topic: str = None) -> Dict[str, Any]:
+        """
+        Generate a quiz for in-process callers, skipping the SK string format
+        
+        The result may be shared with the response cache and must not be modified.
+        """
+        # Reuse a quiz generated for the same content and parameters
+        cache_key = (num_questions, difficulty, topic or None)
+        quiz_result = _response_cache.get_result(context, cache_key)
+        
+        if quiz_result is None:
+            # Get the LLM service
+            chat_service = self._get_chat_service()
+            
+            # Use the existing QuizGenerator but with SK's LLM
+            quiz_result = await self.quiz_gen.generate_quiz(
+                context=context,
+                num_questions=num_questions,
+                difficulty=difficulty,
+                topic=topic,
+                client=chat_service._client,
+                model_name=chat_service._ai_model_id
+            )
+            _response_cache.set_result(context, cache_key, quiz_result)
+        
+        return quiz_result
     
     @kernel_function(
         description="Generate a quiz response for the conversation",
@@ -45,8 +87,76 @@ class QuizSkill:
     )
     async def generate_quiz_response(self, input: str, context: str, history: str) -> str:
         """Generate a conversational response for quiz requests"""
+        params = await self._extract_params(input)
+        
+        # Generate the quiz
+        quiz_result = await self._generate_quiz_dict(
+            context=context,
+            num_questions=int(params.get("num_questions", 5)),
+            difficulty=params.get("difficulty", "medium"),
+            topic=params.get("topic")
+        )
+        
+        return self._format_response(quiz_result)
+    
+    async def generate_many(self, inputs: List[str], context: str, history: str,
+                            max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> List[str]:
+        """
+        Generate quiz responses for several requests at once
+        
+        All parameter extractions run concurrently, then all generations, so a
+        batch costs about two LLM round-trips instead of two per request.
+        
+        Args:
+            inputs: User messages asking for a quiz
+            context: Educational content shared by every request
+            history: Conversation history
+            max_concurrency: Maximum number of LLM calls in flight at once
+            
+        Returns:
+            One response per input, in the same order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def extract(input: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._extract_params(input)
+        
+        async def generate(params: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._generate_quiz_dict(
+                    context=context,
+                    num_questions=int(params.get("num_questions", 5)),
+                    difficulty=params.get("difficulty", "medium"),
+                    topic=params.get("topic")
+                )
+        
+        extracted = await asyncio.gather(*(extract(input) for input in inputs), return_exceptions=True)
+        
+        # A failed extraction falls back to the default parameters
+        all_params = [
+            dict(DEFAULT_PARAMS) if isinstance(params, Exception) else params
+            for params in extracted
+        ]
+        
+        results = await asyncio.gather(*(generate(params) for params in all_params), return_exceptions=True)
+        
+        # Report a failed generation instead of failing the batch
+        return [
+            f"I couldn't generate a quiz for this request. Error details: {result}"
+            if isinstance(result, Exception) else self._format_response(result)
+            for result in results
+        ]
+    
+    async def _extract_params(self, input: str) -> Dict[str, Any]:
+        """Ask the LLM for the quiz parameters in a user message"""
+        # Equivalent requests were already run through the extractor
+        params = _response_cache.get_params(input)
+        if params is not None:
+            return params
+        
         # Get chat service for LLM interactions
-        chat_service = self.kernel.get_service("github")
+        chat_service = self._get_chat_service()
         
         # Parse the request to determine parameters - updated for SK 1.28.1
         system_prompt = "You are a quiz parameter extractor. Extract the parameters for quiz generation from the user's message. Return a JSON with num_questions, difficulty, and topic."
@@ -56,44 +166,34 @@ class QuizSkill:
         param_chat_history.add_system_message(system_prompt)
         param_chat_history.add_user_message(input)
         
-        # Create settings - using PromptExecutionSettings for SK 1.28.1
-        settings = PromptExecutionSettings()
-        
         # Get parameters
-        chat_completion = await chat_service.get_chat_message_content(param_chat_history, settings)
+        chat_completion = await chat_service.get_chat_message_content(param_chat_history, self._execution_settings)
         
         try:
-            params = json.loads(chat_completion.content)
+            params = orjson.loads(chat_completion.content)
         except:
-            # Default parameters if extraction fails
-            params = {
-                "num_questions": 5,
-                "difficulty": "medium",
-                "topic": None
-            }
-        
-        # Generate the quiz
-        quiz_result = await self.generate_quiz(
-            context=context,
-            num_questions=str(params.get("num_questions", 5)),
-            difficulty=params.get("difficulty", "medium"),
-            topic=params.get("topic")
-        )
+            params = None
         
-        # Format the response
-        quiz_data = json.loads(quiz_result)
+        if valid_params(params):
+            _response_cache.set_params(input, params)
+        else:
+            # Default parameters if extraction fails or isn't a flat JSON object
+            params = dict(DEFAULT_PARAMS)
         
-        response = "Here's a quiz based on the educational content:\n\n"
+        return params
+    
+    def _format_response(self, quiz_data: Dict[str, Any]) -> str:
+        """Present a generated quiz as a chat message"""
+        parts = ["Here's a quiz based on the educational content:\n\n"]
         
         for i, question in enumerate(quiz_data.get("questions", [])):
-            response += f"Question {i+1}: {question['text']}\n"
-            for letter, option in question.get("options", {}).items():
-                response += f"{letter}. {option}\n"
-            response += "\n"
+            parts.append(f"Question {i+1}: {question['text']}\n")
+            parts.extend(f"{letter}. {option}\n" for letter, option in question.get("options", {}).items())
+            parts.append("\n")
         
-        response += "Let me know when you're ready for the answers!"
+        parts.append("Let me know when you're ready for the answers!")
         
-        return response
+        return "".join(parts)
 
 class SKQuizGenerator(QuizGenerator):
     """SK adapter for QuizGenerator that maintains the same interface"""
@@ -103,6 +203,7 @@ class SKQuizGenerator(QuizGenerator):
         super().__init__()
         # Defer the kernel import until it's actually needed
         self.kernel = None
+        self.skill = None
     
     def _ensure_kernel(self):
         """Lazy-load the kernel only when needed"""
@@ -110,6 +211,7 @@ class SKQuizGenerator(QuizGenerator):
             # Import here to avoid circular dependency
             from app.core.sk.kernel_factory import get_kernel
             self.kernel = get_kernel()
+            self.skill = QuizSkill(self.kernel)
     
     async def generate_quiz(self, context: str, num_questions: int = 5,
                           difficulty: str = "medium", topic: str = None,
@@ -118,21 +220,11 @@ class SKQuizGenerator(QuizGenerator):
         # Ensure kernel is loaded
         self._ensure_kernel()
         
-        # Create variables for the function
-        context_variables = sk.ContextVariables()
-        context_variables["context"] = context
-        context_variables["num_questions"] = str(num_questions)
-        context_variables["difficulty"] = difficulty
-        context_variables["topic"] = topic if topic else ""
-        
-        # Get the function
-        function = self.kernel.skills.get_function("QuizSkill", "GenerateQuiz")
-        
         try:
-            # Execute the function
-            result = await self.kernel.run_async(function, input_vars=context_variables)
-            quiz_result = json.loads(str(result))
-            return quiz_result
+            # Call the skill directly; going through kernel.invoke would round-trip the result through JSON
+            quiz_result = await self.skill._generate_quiz_dict(context, num_questions, difficulty, topic)
+            # Callers annotate the result, so give them their own copy of the cached one
+            return orjson.loads(orjson.dumps(quiz_result))
         except Exception as e:
             print(f"Error generating quiz with SK: {e}")
             # Fall back to the original implementation
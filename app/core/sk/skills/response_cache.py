@@ -0,0 +1,64 @@
+# app/core/sk/skills/response_cache.py
+import re
+import hashlib
+from typing import Dict, Any, Optional, Hashable
+from cachetools import TTLCache
+
+# Extracted parameters depend only on the wording of the request
+PARAMS_CACHE_SIZE = 4096
+PARAMS_CACHE_TTL_SECONDS = 3600
+
+# Generated content is reused for a short window only, so repeat requests stay fresh
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL_SECONDS = 600
+
+# Punctuation and case don't change what a request asks for
+NON_WORD_RE = re.compile(r"[^\w]+")
+
+# Parameter values that can be used directly and as part of a cache key
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+def normalize_request(text: str) -> str:
+    """Reduce a user request to lowercase words so trivially different phrasings share a key"""
+    return " ".join(NON_WORD_RE.split(text.lower())).strip()
+
+def context_digest(context: str) -> str:
+    """Fixed-size key for a (possibly very long) context string"""
+    return hashlib.blake2b(context.encode("utf-8"), digest_size=16).hexdigest()
+
+def valid_params(params: Any) -> bool:
+    """Check that extracted parameters are a JSON object of scalar values"""
+    return isinstance(params, dict) and all(isinstance(value, SCALAR_TYPES) for value in params.values())
+
+class SkillResponseCache:
+    """
+    Two-tier cache for a generation skill.
+    
+    The first tier maps a normalized user request to the parameters the LLM
+    extracted from it, so repeat requests skip the extractor round-trip. The
+    second tier maps (context, parameters) to the generated result.
+    """
+    
+    def __init__(self):
+        """Initialize both cache tiers"""
+        self._params = TTLCache(maxsize=PARAMS_CACHE_SIZE, ttl=PARAMS_CACHE_TTL_SECONDS)
+        self._results = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_SECONDS)
+    
+    def get_params(self, request: str) -> Optional[Dict[str, Any]]:
+        """Return previously extracted parameters for an equivalent request"""
+        params = self._params.get(normalize_request(request))
+        return dict(params) if params is not None else None
+    
+    def set_params(self, request: str, params: Dict[str, Any]) -> None:
+        """Remember the parameters extracted for a request"""
+        self._params[normalize_request(request)] = dict(params)
+    
+    def get_result(self, context: str, params: Hashable) -> Optional[Dict[str, Any]]:
+        """Return a result generated for the same context and parameters"""
+        return self._results.get((context_digest(context), params))
+    
+    def set_result(self, context: str, params: Hashable, result: Dict[str, Any]) -> None:
+        """Remember a generated result; failed or empty generations are never cached"""
+        if result.get("error") or not (result.get("cards") or result.get("questions")):
+            return
+        self._results[(context_digest(context), params)] = result
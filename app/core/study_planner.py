@@ -1,7 +1,33 @@
 # app/core/study_planner.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+import asyncio
 import datetime
 import json
+from functools import lru_cache
+
+# Plans generated at once by generate_plans_bulk
+MAX_CONCURRENT_PLANS = 32
+
+# Days covered by a study plan
+PLAN_DAYS = 7
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+@lru_cache(maxsize=4)
+def plan_week(start: datetime.date) -> Tuple[Tuple[str, str], ...]:
+    """
+    Get the (ISO date, day name) of each day of a plan starting on a date
+    
+    Args:
+        start: First day of the plan
+        
+    Returns:
+        PLAN_DAYS pairs of date string and day name, in order
+    """
+    week = []
+    for offset in range(PLAN_DAYS):
+        day = start + datetime.timedelta(days=offset)
+        week.append((day.isoformat(), DAY_NAMES[day.weekday()]))
+    return tuple(week)
 
 class StudyPlanGenerator:
     """Generates personalized study plans based on learning progress"""
@@ -53,71 +79,39 @@ class StudyPlanGenerator:
         # Organize topics by priority
         topics_by_priority = self._prioritize_topics(progress_data["topics"])
         
+        # Each day, focus on 1-3 topics
+        topic_count = len(topics_by_priority)
+        topics_per_day = min(3, topic_count)
+        
+        # Activities depend only on the topic, so each topic's are worked out once
+        topic_activities = {}
+        
         # Create a 7-day schedule
-        for day in range(7):
-            current_date = now + datetime.timedelta(days=day)
-            date_str = current_date.strftime("%Y-%m-%d")
-            
+        for day, (date_str, day_name) in enumerate(plan_week(now.date())):
             # Assign topics based on day of week and priority
             day_topics = []
             
-            # Each day, focus on 1-3 topics
-            topic_count = min(3, len(topics_by_priority))
-            
-            for i in range(min(topic_count, len(topics_by_priority))):
+            for i in range(topics_per_day):
                 # Rotate topics across days
-                topic_idx = (i + day) % len(topics_by_priority)
-                topic = topics_by_priority[topic_idx]
-                
-                # Get topic data
-                topic_data = progress_data["topics"][topic]
-                proficiency = topic_data["proficiency"]
+                topic = topics_by_priority[(i + day) % topic_count]
                 
-                # Recommend activities based on proficiency
-                activities = []
-                
-                if proficiency < 0.4:
-                    # Low proficiency - need foundational work
-                    activities.append({
-                        "type": "tutoring",
-                        "duration": 20,
-                        "description": f"Tutoring session on {topic} fundamentals"
-                    })
-                    activities.append({
-                        "type": "flashcard",
-                        "duration": 10,
-                        "description": f"Review basic {topic} flashcards"
-                    })
-                elif proficiency < 0.7:
-                    # Medium proficiency - need practice
-                    activities.append({
-                        "type": "quiz",
-                        "duration": 15,
-                        "description": f"Practice quiz on {topic}"
-                    })
-                    activities.append({
-                        "type": "flashcard",
-                        "duration": 10,
-                        "description": f"Review {topic} flashcards"
-                    })
-                else:
-                    # High proficiency - maintenance
-                    activities.append({
-                        "type": "flashcard",
-                        "duration": 10,
-                        "description": f"Quick review of {topic} flashcards"
-                    })
+                if topic not in topic_activities:
+                    topic_activities[topic] = self._recommend_activities(
+                        topic, progress_data["topics"][topic]["proficiency"]
+                    )
+                activities = topic_activities[topic]
                 
                 day_topics.append({
                     "topic": topic,
-                    "activities": activities,
+                    # Copied so days never share activity objects
+                    "activities": [dict(activity) for activity in activities],
                     "total_duration": sum(a["duration"] for a in activities)
                 })
             
             # Add to schedule
             schedule.append({
                 "date": date_str,
-                "day_of_week": current_date.strftime("%A"),
+                "day_of_week": day_name,
                 "topics": day_topics,
                 "total_duration": sum(topic["total_duration"] for topic in day_topics)
             })
@@ -132,19 +126,109 @@ class StudyPlanGenerator:
             "weekly_goals": goals
         }
     
+    async def generate_plans_bulk(self, db, user_ids: List[str],
+                                  max_concurrency: int = MAX_CONCURRENT_PLANS) -> Dict[str, Dict[str, Any]]:
+        """
+        Generate study plans for many users, running the generations concurrently
+        
+        Progress for every user is loaded with a single query before any plan
+        is generated.
+        
+        Args:
+            db: Database session
+            user_ids: IDs of the users to plan for
+            max_concurrency: Maximum number of plans generated at once
+            
+        Returns:
+            Dict mapping each user ID to their plan, or to an error for a failed plan
+        """
+        progress_by_user = self._get_progress_data_bulk(db, user_ids)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate_for_user(user_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.generate_plan(db, user_id, progress_by_user[user_id])
+        
+        user_ids = list(dict.fromkeys(user_ids))
+        results = await asyncio.gather(
+            *(generate_for_user(user_id) for user_id in user_ids),
+            return_exceptions=True
+        )
+        
+        # Report a failed plan instead of failing the batch
+        return {
+            user_id: ({"user_id": user_id, "error": str(result)}
+                      if isinstance(result, Exception) else result)
+            for user_id, result in zip(user_ids, results)
+        }
+    
+    def _get_progress_data_bulk(self, db, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Load progress data for several users in one query"""
+        from app.models import models
+        
+        progress_by_user = {user_id: {"user_id": user_id, "topics": {}} for user_id in user_ids}
+        progress_records = db.query(models.ProgressTracking).filter(
+            models.ProgressTracking.user_id.in_(list(progress_by_user))
+        ).all()
+        
+        for record in progress_records:
+            progress_by_user[record.user_id]["topics"][record.topic] = {
+                "proficiency": record.proficiency,
+                "confidence": record.confidence,
+                "last_interaction": record.last_interaction.isoformat()
+            }
+        
+        return progress_by_user
+    
+    def _recommend_activities(self, topic: str, proficiency: float) -> List[Dict[str, Any]]:
+        """Recommend activities for a topic based on proficiency"""
+        if proficiency < 0.4:
+            # Low proficiency - need foundational work
+            return [
+                {
+                    "type": "tutoring",
+                    "duration": 20,
+                    "description": f"Tutoring session on {topic} fundamentals"
+                },
+                {
+                    "type": "flashcard",
+                    "duration": 10,
+                    "description": f"Review basic {topic} flashcards"
+                }
+            ]
+        elif proficiency < 0.7:
+            # Medium proficiency - need practice
+            return [
+                {
+                    "type": "quiz",
+                    "duration": 15,
+                    "description": f"Practice quiz on {topic}"
+                },
+                {
+                    "type": "flashcard",
+                    "duration": 10,
+                    "description": f"Review {topic} flashcards"
+                }
+            ]
+        # High proficiency - maintenance
+        return [
+            {
+                "type": "flashcard",
+                "duration": 10,
+                "description": f"Quick review of {topic} flashcards"
+            }
+        ]
+    
     def _generate_empty_plan(self, user_id: str) -> Dict[str, Any]:
         """Generate an empty plan for new users"""
         now = datetime.datetime.utcnow()
         
         # Empty schedule for 7 days
         schedule = []
-        for day in range(7):
-            current_date = now + datetime.timedelta(days=day)
-            date_str = current_date.strftime("%Y-%m-%d")
-            
+        for date_str, day_name in plan_week(now.date()):
             schedule.append({
                 "date": date_str,
-                "day_of_week": current_date.strftime("%A"),
+                "day_of_week": day_name,
                 "topics": [],
                 "total_duration": 0,
                 "suggestion": "Upload study materials and take initial quizzes"
@@ -1,9 +1,35 @@
 # app/models/create_tables.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from .models import Base
 from .db import SQLALCHEMY_DATABASE_URL
 import os
 
+# Keeps the most recent record for each (user_id, topic) and deletes the rest
+DELETE_DUPLICATE_PROGRESS_SQL = text("""
+    DELETE FROM progress_tracking WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id, topic ORDER BY last_interaction DESC, id DESC
+            ) AS row_number
+            FROM progress_tracking
+            WHERE user_id IS NOT NULL AND topic IS NOT NULL
+        ) WHERE row_number > 1
+    )
+""")
+
+def remove_duplicate_progress(engine) -> int:
+    """
+    Delete duplicate progress records so the (user_id, topic) unique index can be built
+    
+    Older versions inserted progress with a read-then-insert, which could leave
+    several records for one user and topic. The most recently updated one is kept.
+    
+    Returns:
+        Number of records deleted
+    """
+    with engine.begin() as conn:
+        return conn.execute(DELETE_DUPLICATE_PROGRESS_SQL).rowcount
+
 def init_db():
     # Make sure the db directory exists
     db_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__))) + '/db'
@@ -12,6 +38,19 @@ def init_db():
     # Create engine and all tables
     engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
     Base.metadata.create_all(bind=engine)
+    
+    # A unique index cannot be added while duplicate rows exist, and progress
+    # upserts fail without it, so clear the duplicates before building it
+    existing_indexes = {index["name"] for index in inspect(engine).get_indexes("progress_tracking")}
+    if "uq_progress_tracking_user_topic" not in existing_indexes:
+        removed = remove_duplicate_progress(engine)
+        if removed:
+            print(f"Removed {removed} duplicate progress records")
+    
+    # create_all skips tables that already exist, so add any indexes they are missing
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("Database tables created successfully")
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Integer, Text
+from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Integer, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import uuid
@@ -53,6 +53,9 @@ class Conversation(Base):
    source = Column(Text)
    created_at = Column(DateTime, default=datetime.utcnow)
 
+   # Recent-history lookups filter by user and read newest first
+   __table_args__ = (Index('ix_conversations_user_created_desc', user_id, created_at.desc()),)
+
 class StudyPlan(Base):
    __tablename__ = 'study_plans'
    id = Column(String, primary_key=True, default=generate_uuid)
@@ -76,6 +79,8 @@ class QuizAttempt(Base):
    answers = Column(Text)  # JSON stored as string
    score = Column(Float)
    taken_at = Column(DateTime, default=datetime.utcnow)
+
+   __table_args__ = (Index('ix_quiz_attempts_user_id', user_id),)
    
 class ProgressTracking(Base):
    __tablename__ = 'progress_tracking'
@@ -87,6 +92,13 @@ class ProgressTracking(Base):
    last_interaction = Column(DateTime, default=datetime.utcnow)
    interaction_type = Column(String)
 
+   __table_args__ = (
+      # One record per user and topic; progress updates upsert on it
+      Index('uq_progress_tracking_user_topic', user_id, topic, unique=True),
+      # Stale-topic checks filter by user and last interaction time
+      Index('ix_progress_tracking_user_last_interaction', user_id, last_interaction),
+   )
+
 # Add to app/models/models.py (This model already exists in your repo, but let's make sure)
 class Flashcard(Base):
     __tablename__ = 'flashcards'
@@ -105,6 +117,8 @@ class FlashcardReview(Base):
     next_review_at = Column(DateTime)
     reviewed_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index('ix_flashcard_reviews_user_id', user_id),)
+
 # Add to app/models/models.py
 class StudySession(Base):
     __tablename__ = 'study_sessions'
@@ -112,4 +126,15 @@ class StudySession(Base):
     user_id = Column(String, ForeignKey('users.id'))
     content = Column(Text)  # JSON stored as string
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StudySessionEvent(Base):
+    __tablename__ = 'study_session_events'
+    id = Column(String, primary_key=True, default=generate_uuid)
+    session_id = Column(String, ForeignKey('study_sessions.id'), nullable=False)
+    activity_index = Column(Integer, nullable=False)
+    activity_type = Column(String)
+    result = Column(Text)  # JSON stored as string
+    executed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index('ix_study_session_events_session_id', session_id),)
\ No newline at end of file
@@ -294,6 +294,21 @@ def get_study_plans(db, user_id: str, limit: int = 5):
         "schedule": json.loads(plan.schedule) if plan.schedule else {}
     } for plan in plans]
 
+def _commit_keeping_loaded(db):
+    """
+    Commit without expiring the session's objects
+    
+    Their values were all set in Python and are written by the flush, so
+    reloading them on the next attribute read would only repeat a SELECT.
+    """
+    db.flush()
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
 def update_topic_progress(db, user_id: str, topic: str, 
                          activity_type: str, performance: float, 
                          confidence: float = None):
@@ -325,8 +340,7 @@ def update_topic_progress(db, user_id: str, topic: str,
         progress.confidence = updated_confidence
         progress.last_interaction = now
         progress.interaction_type = activity_type
-        db.commit()
-        db.refresh(progress)
+        _commit_keeping_loaded(db)
         return progress
     else:
         if confidence is None:
@@ -337,11 +351,11 @@ def update_topic_progress(db, user_id: str, topic: str,
             topic=topic,
             proficiency=performance,
             confidence=confidence,
+            last_interaction=now,
             interaction_type=activity_type
         )
         db.add(new_progress)
-        db.commit()
-        db.refresh(new_progress)
+        _commit_keeping_loaded(db)
         return new_progress
     
 # Add these functions to app/models/repository.py
@@ -511,11 +525,11 @@ def get_study_plan_progress(db, user_id: str, plan_id: str = None):
     return results
 
 # Add to app/models/repository.py
-def create_study_session(db, user_id: str, content: str):
+def create_study_session(db, user_id: str, content: str, session_id: str = None):
     """Create a new study session"""
     import uuid
     session = models.StudySession(
-        id=str(uuid.uuid4()),
+        id=session_id or str(uuid.uuid4()),
         user_id=user_id,
         content=content
     )
@@ -538,6 +552,27 @@ def update_study_session(db, session_id: str, content: str):
         db.refresh(session)
     return session
 
+def add_study_session_events(db, events: List[Dict[str, Any]]):
+    """Append activity result events for study sessions in one transaction"""
+    if not events:
+        return
+    db.bulk_insert_mappings(models.StudySessionEvent, [
+        {"id": models.generate_uuid(), **event} for event in events
+    ])
+    db.commit()
+
+def get_study_session_events(db, session_ids: List[str]):
+    """Get activity result events for study sessions, grouped by session ID in execution order"""
+    events = {}
+    if not session_ids:
+        return events
+    rows = db.query(models.StudySessionEvent).filter(
+        models.StudySessionEvent.session_id.in_(session_ids)
+    ).order_by(models.StudySessionEvent.executed_at, models.StudySessionEvent.activity_index).all()
+    for row in rows:
+        events.setdefault(row.session_id, []).append(row)
+    return events
+
 def get_user_study_sessions(db, user_id: str, limit: int = 10):
     """Get study sessions for a user"""
     return db.query(models.StudySession).filter(
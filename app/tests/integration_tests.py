@@ -8,6 +8,9 @@ from typing import Dict, Any, List
 # Add parent directory to path to import app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+# Entry points load .env before importing app modules
+from dotenv import load_dotenv
+load_dotenv()
 from app.core.agent import get_message_processor
 from app.core.vector_store import get_vector_store_client
 from app.core.quiz_generator import QuizGenerator
@@ -1,6 +1,9 @@
 # test_day3.py
 import asyncio
 import os
+# Entry points load .env before importing app modules
+from dotenv import load_dotenv
+load_dotenv()
 from app.core.agent import get_message_processor
 from app.core.vector_store import get_vector_store_client
 
@@ -1,6 +1,9 @@
 # test_quiz_final.py
 import asyncio
 import os
+# Entry points load .env before importing app modules
+from dotenv import load_dotenv
+load_dotenv()
 from app.core.quiz_generator import QuizGenerator
 from app.core.agent import get_message_processor
 
@@ -1,6 +1,9 @@
 # test_document_quiz.py
 import asyncio
 import os
+# Entry points load .env before importing app modules
+from dotenv import load_dotenv
+load_dotenv()
 from app.core.vector_store import get_vector_store_client
 from app.core.agent import get_message_processor
 from app.utils.context_retrieval import retrieve_topic_context
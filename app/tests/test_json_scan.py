@@ -0,0 +1,41 @@
+# test_json_scan.py - Unit tests for finding JSON objects in model responses
+import json
+from app.utils.json_scan import JsonObjectScanner, extract_json_object
+
+def test_extract_ignores_braces_inside_strings():
+    """Test that braces and escaped quotes in string values don't end the object early."""
+    text = 'Plan: {"title": "Sets {and} maps", "note": "say \\"}\\" twice", "steps": [{"n": 1}]} Done {later}'
+    extracted = extract_json_object(text)
+    assert json.loads(extracted) == {
+        "title": "Sets {and} maps",
+        "note": 'say "}" twice',
+        "steps": [{"n": 1}]
+    }
+
+def test_extract_from_code_fence():
+    """Test that a fenced JSON block with prose around it is extracted."""
+    text = 'Here is the plan:\n```json\n{"topic": "Graphs", "code": "if (x) { y(); }"}\n```\nLet me know {if} you need more.'
+    assert json.loads(extract_json_object(text)) == {"topic": "Graphs", "code": "if (x) { y(); }"}
+
+def test_extract_returns_none_for_unbalanced_object():
+    """Test that a truncated object is not returned."""
+    assert extract_json_object('{"topic": "Graphs", "steps": [') is None
+    assert extract_json_object("no json here") is None
+
+def test_scanner_across_chunk_boundaries():
+    """Test that streamed chunks split inside strings and escapes give the same result."""
+    text = 'prefix {"a": "x\\\\", "b": "}\\"{", "c": {"d": 1}} trailing'
+    for chunk_size in range(1, len(text) + 1):
+        scanner = JsonObjectScanner()
+        consumed = 0
+        completed = False
+        for start in range(0, len(text), chunk_size):
+            chunk = text[start:start + chunk_size]
+            if scanner.feed(chunk):
+                consumed = start + scanner.end
+                completed = True
+                break
+        assert completed, chunk_size
+        assert json.loads(text[text.index("{"):consumed]) == {"a": "x\\", "b": '}"{', "c": {"d": 1}}
+
+# To run: pytest test_json_scan.py
@@ -0,0 +1,52 @@
+# test_message_processor.py - Unit tests for concurrent message processing
+import pytest
+import asyncio
+import time
+from app.core.message_processor import MessageProcessor
+
+# How long the mock model takes to answer each request
+MODEL_DELAY_SECONDS = 0.2
+
+class DelayedClient:
+    """Mock OpenAI client that answers every request after a fixed delay."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.chat = self
+        self.completions = self
+
+    async def create(self, messages, temperature, max_tokens, model):
+        await asyncio.sleep(self.delay)
+        class Message:
+            content = f"Answer to: {messages[-1]['content'][-20:]}"
+        class Choice:
+            message = Message()
+        class Response:
+            choices = [Choice()]
+        return Response()
+
+@pytest.mark.asyncio
+async def test_requests_for_one_user_overlap():
+    """Test that a user's concurrent requests (e.g. a session's activities) don't wait on each other."""
+    processor = MessageProcessor()
+    processor.client = DelayedClient(MODEL_DELAY_SECONDS)
+    num_requests = 5
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        processor.process_message(
+            user_id="test_user",
+            message=f"Explain concept number {i}",
+            mode="chat",
+            context="Some study material."
+        )
+        for i in range(num_requests)
+    ))
+    elapsed = time.perf_counter() - start
+
+    assert all("error" not in result for result in results)
+    # Serialized requests would take num_requests * delay
+    assert elapsed < MODEL_DELAY_SECONDS * 2
+    # Every turn is still recorded
+    assert len(processor.conversation_history["test_user"]) == num_requests * 2
+
+# To run: pytest test_message_processor.py
@@ -0,0 +1,85 @@
+# test_progress_tracker.py - Unit tests for topic progress upserts
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.models import models
+from app.core.progress_tracker import ProgressTracker
+
+NOW = datetime.datetime(2025, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def db():
+    """In-memory SQLite session with the app's tables"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+def test_first_update_inserts_record(db):
+    """Test that the first update stores the performance as-is with the default confidence."""
+    progress = ProgressTracker().update_topic_progress(db, "user1", "Graphs", "quiz", 0.8, now=NOW)
+    assert progress.proficiency == pytest.approx(0.8)
+    assert progress.confidence == pytest.approx(0.5)
+    assert progress.last_interaction == NOW
+    assert db.query(models.ProgressTracking).count() == 1
+
+def test_repeat_update_blends_into_one_record(db):
+    """Test that later updates blend into the existing record by activity weight."""
+    tracker = ProgressTracker()
+    tracker.update_topic_progress(db, "user1", "Graphs", "quiz", 0.8, now=NOW)
+    later = NOW + datetime.timedelta(hours=1)
+    progress = tracker.update_topic_progress(db, "user1", "Graphs", "chat", 0.2, confidence=0.9, now=later)
+    # chat weighs 0.3: 0.2 * 0.3 + 0.8 * 0.7
+    assert progress.proficiency == pytest.approx(0.62)
+    # Reported confidence blends 0.6 new, 0.4 stored
+    assert progress.confidence == pytest.approx(0.9 * 0.6 + 0.5 * 0.4)
+    assert progress.interaction_type == "chat"
+    assert progress.last_interaction == later
+    assert db.query(models.ProgressTracking).count() == 1
+
+def test_confidence_heuristic_is_clamped(db):
+    """Test that confidence moves by the heuristic steps and stays within its bounds."""
+    tracker = ProgressTracker()
+    tracker.update_topic_progress(db, "user1", "Graphs", "quiz", 0.5, confidence=0.98, now=NOW)
+    # Improving raises confidence by 0.1, capped at 1.0
+    progress = tracker.update_topic_progress(db, "user1", "Graphs", "quiz", 1.0, now=NOW)
+    assert progress.confidence == pytest.approx(1.0)
+
+    tracker.update_topic_progress(db, "user1", "Trees", "quiz", 0.9, confidence=0.12, now=NOW)
+    # Getting worse lowers confidence by 0.05, floored at 0.1
+    progress = tracker.update_topic_progress(db, "user1", "Trees", "quiz", 0.1, now=NOW)
+    assert progress.confidence == pytest.approx(0.1)
+
+def test_bulk_update_matches_single_updates(db):
+    """Test that a bulk update compounds repeated topics like sequential single updates would."""
+    updates = [
+        {"topic": "Graphs", "activity_type": "quiz", "performance": 0.8},
+        {"topic": "Trees", "activity_type": "flashcard", "performance": 0.4, "confidence": 0.7},
+        {"topic": "Graphs", "activity_type": "chat", "performance": 0.2}
+    ]
+    tracker = ProgressTracker()
+    tracker.update_topic_progress(db, "user1", "Trees", "quiz", 0.6, now=NOW)
+
+    results = tracker.bulk_update_topic_progress(db, "user1", updates, now=NOW)
+
+    # New topic: inserted from the first update, then blended with the second
+    assert results["Graphs"]["proficiency"] == pytest.approx(0.2 * 0.3 + 0.8 * 0.7)
+    assert results["Graphs"]["confidence"] == pytest.approx(0.45)
+    # Existing topic: blended into the stored record
+    assert results["Trees"]["proficiency"] == pytest.approx(0.4 * 0.5 + 0.6 * 0.5)
+    assert results["Trees"]["confidence"] == pytest.approx(0.7 * 0.6 + 0.5 * 0.4)
+
+    stored = {
+        record.topic: record
+        for record in db.query(models.ProgressTracking).filter(models.ProgressTracking.user_id == "user1")
+    }
+    assert len(stored) == 2
+    for topic, values in results.items():
+        assert stored[topic].proficiency == pytest.approx(values["proficiency"])
+        assert stored[topic].confidence == pytest.approx(values["confidence"])
+
+# To run: pytest test_progress_tracker.py
@@ -0,0 +1,93 @@
+# test_quiz_parser.py - Unit tests for streamed quiz parsing
+import pytest
+from app.core.quiz_generator import QuizGenerator, QuizLineParser
+
+QUIZ_TEXT = """Here is your quiz.
+
+Q1: What does supervised learning use?
+A. Labeled data
+B. Unlabeled data
+C. Rewards only
+D. No data
+Correct Answer: A
+Explanation: Supervised learning trains on labeled examples.
+
+Q2: Which task is an example of clustering?
+A. Predicting house prices
+B. Grouping customers by behaviour
+C. Classifying spam
+D. Playing chess
+Correct Answer: B
+Explanation: Clustering groups similar items
+without using labels.
+"""
+
+class StreamingClient:
+    """Mock OpenAI client that streams a fixed response in chunks of a given size."""
+    def __init__(self, text, chunk_size):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.chat = self
+        self.completions = self
+
+    async def create(self, messages, temperature, max_tokens, model, stream):
+        async def chunks():
+            for start in range(0, len(self.text), self.chunk_size):
+                class Delta:
+                    content = self.text[start:start + self.chunk_size]
+                class Choice:
+                    delta = Delta()
+                class Chunk:
+                    choices = [Choice()]
+                yield Chunk()
+        return chunks()
+
+def test_line_parser_completes_question_on_next_header():
+    """Test that a question is only returned once the next header (or close) arrives."""
+    parser = QuizLineParser()
+    lines = QUIZ_TEXT.splitlines()
+    second_header = lines.index("Q2: Which task is an example of clustering?")
+    results = [parser.feed(line) for line in lines[:second_header]]
+    assert not any(results)
+    first = parser.feed(lines[second_header])
+    assert first["id"] == "q1"
+    assert first["correct_answer"] == "A"
+    assert first["options"]["B"] == "Unlabeled data"
+    for line in lines[second_header + 1:]:
+        assert parser.feed(line) is None
+    second = parser.close()
+    assert second["id"] == "q2"
+    assert second["explanation"] == "Clustering groups similar items\nwithout using labels."
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 16, len(QUIZ_TEXT)])
+async def test_stream_quiz_handles_chunk_boundaries(chunk_size):
+    """Test that streamed questions match the full-text parse however the text is split."""
+    generator = QuizGenerator()
+    expected = generator._parse_quiz_response(QUIZ_TEXT)
+    questions = [
+        question async for question in generator.stream_quiz(
+            context="Machine learning basics.",
+            num_questions=2,
+            client=StreamingClient(QUIZ_TEXT, chunk_size),
+            model_name="mock-model"
+        )
+    ]
+    assert len(questions) == 2
+    assert questions == expected
+
+@pytest.mark.asyncio
+async def test_stream_quiz_parses_last_line_without_newline():
+    """Test that an answer on the final, unterminated line is still parsed."""
+    text = "Q1: What is 2 + 2?\nA. 3\nB. 4\nCorrect Answer: B"
+    questions = [
+        question async for question in QuizGenerator().stream_quiz(
+            context="Arithmetic.",
+            client=StreamingClient(text, 5),
+            model_name="mock-model"
+        )
+    ]
+    assert len(questions) == 1
+    assert questions[0]["correct_answer"] == "B"
+
+# To run: pytest test_quiz_parser.py
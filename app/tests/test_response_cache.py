@@ -0,0 +1,48 @@
+# test_response_cache.py - Unit tests for the SK skill response cache
+from app.core.sk.skills.response_cache import SkillResponseCache, valid_params
+
+CONTEXT = "Photosynthesis converts light energy into chemical energy."
+
+def test_params_shared_by_equivalent_requests():
+    """Test that requests differing only in case and punctuation share extracted parameters."""
+    cache = SkillResponseCache()
+    cache.set_params("Make 5 flashcards about Photosynthesis!", {"num_cards": 5, "topic": "photosynthesis"})
+    params = cache.get_params("make 5 flashcards, about photosynthesis")
+    assert params == {"num_cards": 5, "topic": "photosynthesis"}
+    # Callers get a copy, so changing it doesn't change the cache
+    params["num_cards"] = 8
+    assert cache.get_params("make 5 flashcards about photosynthesis")["num_cards"] == 5
+
+def test_results_keyed_by_context_and_params():
+    """Test that a cached result is only returned for the same context and parameters."""
+    cache = SkillResponseCache()
+    result = {"cards": [{"front": "What is photosynthesis?", "back": "Turning light into chemical energy."}]}
+    cache.set_result(CONTEXT, (1, "photosynthesis"), result)
+    assert cache.get_result(CONTEXT, (1, "photosynthesis")) == result
+    assert cache.get_result(CONTEXT, (2, "photosynthesis")) is None
+    assert cache.get_result(CONTEXT + " More text.", (1, "photosynthesis")) is None
+
+def test_failed_generations_are_not_cached():
+    """Test that error results are not stored, so the next request generates again."""
+    cache = SkillResponseCache()
+    cache.set_result(CONTEXT, (3, "photosynthesis"), {"cards": [], "error": "rate limited"})
+    assert cache.get_result(CONTEXT, (3, "photosynthesis")) is None
+
+def test_empty_generations_are_not_cached():
+    """Test that results without any cards or questions are not stored."""
+    cache = SkillResponseCache()
+    cache.set_result(CONTEXT, (3, "photosynthesis"), {"cards": []})
+    cache.set_result(CONTEXT, (3, "medium", "photosynthesis"), {"questions": []})
+    assert cache.get_result(CONTEXT, (3, "photosynthesis")) is None
+    assert cache.get_result(CONTEXT, (3, "medium", "photosynthesis")) is None
+
+def test_valid_params_requires_flat_object():
+    """Test that only JSON objects of scalar values are accepted as extracted parameters."""
+    assert valid_params({"num_cards": 5, "topic": "photosynthesis"})
+    assert valid_params({"num_questions": 3, "difficulty": "easy", "topic": None})
+    assert not valid_params(["num_cards", 5])
+    assert not valid_params("5 cards")
+    assert not valid_params({"num_cards": 5, "topic": ["light", "energy"]})
+    assert not valid_params({"num_cards": 5, "topic": {"name": "photosynthesis"}})
+
+# To run: pytest test_response_cache.py
@@ -0,0 +1,99 @@
+# test_session_events.py - Unit tests for queued study session results
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.models import models, repository
+from app.core.session_orchestrator import SessionOrchestrator
+
+class StubProcessor:
+    """Message processor that answers every activity prompt immediately."""
+    def __init__(self):
+        self.calls = 0
+
+    async def process_message(self, user_id, message, mode, vector_search_client=None, context=None):
+        self.calls += 1
+        return {"response": f"{mode} for {user_id}: {message[:30]}", "context_used": []}
+
+@pytest.fixture
+def db():
+    """In-memory SQLite session with the app's tables"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+@pytest.fixture
+def orchestrator():
+    """Session orchestrator using the stub processor"""
+    orchestrator = SessionOrchestrator()
+    orchestrator._processor = StubProcessor()
+    return orchestrator
+
+@pytest.mark.asyncio
+async def test_results_queue_until_session_completes(db, orchestrator):
+    """Test that results are queued, then written once when the last activity runs."""
+    plan = await orchestrator.create_quick_session("user1", "Graphs", duration_minutes=10, db=db)
+    session_id = plan["session_id"]
+
+    await orchestrator.execute_activity(session_id, db=db)
+    assert len(orchestrator._pending_events[session_id]) == 1
+    assert db.query(models.StudySessionEvent).count() == 0
+
+    result = await orchestrator.execute_activity(session_id, db=db)
+    assert result["status"] == "completed"
+    assert orchestrator._pending_events == {}
+    assert db.query(models.StudySessionEvent).count() == 2
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_and_replays_events(db, orchestrator, monkeypatch):
+    """Test that results from a failed flush are kept, replayed on reload and written later."""
+    plan = await orchestrator.create_quick_session("user1", "Graphs", duration_minutes=30, db=db)
+    session_id = plan["session_id"]
+    await orchestrator.execute_activity(session_id, db=db)
+
+    def failing_write(db, events):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(repository, "add_study_session_events", failing_write)
+    with pytest.raises(RuntimeError):
+        await orchestrator.flush_sessions_async(db)
+    assert len(orchestrator._pending_events[session_id]) == 1
+
+    # Another result queued after the failure stays behind the requeued one
+    await orchestrator.execute_activity(session_id, db=db)
+    assert [event["activity_index"] for event in orchestrator._pending_events[session_id]] == [0, 1]
+
+    # A session evicted from memory is rebuilt with its unwritten results
+    orchestrator.active_sessions.clear()
+    reloaded = await orchestrator._load_plan(session_id, db)
+    assert reloaded["current_activity_index"] == 2
+    assert set(reloaded["results"]) == {"0", "1"}
+
+    monkeypatch.undo()
+    assert await orchestrator.flush_sessions_async(db) == 2
+    assert orchestrator._pending_events == {}
+
+    # Once written, the results come back from the database alone
+    orchestrator.active_sessions.clear()
+    reloaded = await orchestrator._load_plan(session_id, db)
+    assert reloaded["current_activity_index"] == 2
+    assert reloaded["results"]["1"]["result"] == plan["results"]["1"]["result"]
+
+@pytest.mark.asyncio
+async def test_cached_activities_are_not_shared_across_users(orchestrator):
+    """Test that an activity response is reused for the same user only."""
+    first = await orchestrator.create_quick_session("user1", "Graphs", duration_minutes=10)
+    again = await orchestrator.create_quick_session("user1", "Graphs", duration_minutes=10)
+    other = await orchestrator.create_quick_session("user2", "Graphs", duration_minutes=10)
+
+    result = await orchestrator.execute_activity(first["session_id"])
+    assert (await orchestrator.execute_activity(again["session_id"]))["result"] == result["result"]
+    assert orchestrator._processor.calls == 1
+
+    other_result = await orchestrator.execute_activity(other["session_id"])
+    assert orchestrator._processor.calls == 2
+    assert "user2" in other_result["result"]
+
+# To run: pytest test_session_events.py
@@ -0,0 +1,81 @@
+# test_session_stream.py - Unit tests for the streamed activity endpoint
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import session as session_api
+
+class StubDbSession:
+    """Database session that only records being closed."""
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+class StubOrchestrator:
+    """Orchestrator whose activity stream yields fixed chunks, then optionally fails."""
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def execute_activity_stream(self, session_id, activity_index=None, db=None):
+        if session_id != "known":
+            raise ValueError(f"Session {session_id} not found")
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Build a test client for the session router around a stub orchestrator"""
+    sessions = []
+
+    def make(orchestrator):
+        class StubFactory:
+            def get_session_orchestrator(self):
+                return orchestrator
+
+        def open_session():
+            db_session = StubDbSession()
+            sessions.append(db_session)
+            return db_session
+
+        monkeypatch.setattr(session_api, "get_factory", lambda: StubFactory())
+        monkeypatch.setattr(session_api.db, "SessionLocal", open_session)
+        app = FastAPI()
+        app.include_router(session_api.router, prefix="/session")
+        return TestClient(app), sessions
+    return make
+
+def test_stream_sends_chunks_then_done(make_client):
+    """Test that each chunk becomes a data event, split on newlines, followed by a done event."""
+    client, sessions = make_client(StubOrchestrator(["Hello", " world\nSecond line"]))
+    response = client.post("/session/execute/stream", json={"session_id": "known"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        "data: Hello\n\n"
+        "data:  world\ndata: Second line\n\n"
+        "event: done\ndata: \n\n"
+    )
+    assert all(db_session.closed for db_session in sessions)
+
+def test_unknown_session_is_404(make_client):
+    """Test that an error before the first chunk is an HTTP error, not an event."""
+    client, sessions = make_client(StubOrchestrator(["unused"]))
+    response = client.post("/session/execute/stream", json={"session_id": "missing"})
+    assert response.status_code == 404
+    assert all(db_session.closed for db_session in sessions)
+
+def test_failure_mid_stream_is_error_event(make_client):
+    """Test that a failure after the stream started ends it with an error event."""
+    client, sessions = make_client(StubOrchestrator(["Partial"], error=RuntimeError("model timed out")))
+    response = client.post("/session/execute/stream", json={"session_id": "known"})
+    assert response.status_code == 200
+    assert response.text == (
+        "data: Partial\n\n"
+        "event: error\ndata: Error executing activity: model timed out\n\n"
+    )
+    assert all(db_session.closed for db_session in sessions)
+
+# To run: pytest test_session_stream.py
@@ -3,13 +3,10 @@ import os
 import sys
 # Add the project root to sys.path to allow 'app' imports regardless of how the test is run
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-# test_sk_kernel.py
-import asyncio
-from app.core.sk.kernel_factory import get_kernel
-from semantic_kernel.functions.kernel_arguments import KernelArguments
-
-# test_sk_kernel.py  (fixed)
 import asyncio
+# Entry points load .env before importing app modules
+from dotenv import load_dotenv
+load_dotenv()
 from app.core.sk.kernel_factory import get_kernel
 from semantic_kernel.functions.kernel_arguments import KernelArguments
 
@@ -44,6 +44,10 @@ class DatabaseError(StudyBuddyError):
     def __init__(self, message: str):
         super().__init__(message, "database_error", 500)
 
+class ActivityFetchError(DatabaseError):
+    """Error loading a user's activity history (quizzes, reviews, conversations)"""
+    pass
+
 # Error handler for FastAPI
 async def study_buddy_exception_handler(request: Request, exc: StudyBuddyError):
     """Handle Study Buddy specific exceptions"""
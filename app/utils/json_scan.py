@@ -0,0 +1,81 @@
+# app/utils/json_scan.py
+import re
+from typing import Optional
+
+# Characters that change brace depth or string state while scanning for JSON
+JSON_STRUCTURE_RE = re.compile(r'[{}"\\]')
+
+class JsonObjectScanner:
+    """
+    Track whether streamed text has closed its first JSON object
+    
+    Text before the first opening brace is ignored, as are braces inside
+    string values, so the stream can be stopped as soon as the plan is
+    complete instead of waiting for any prose the model adds after it.
+    """
+    
+    def __init__(self):
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        # Offset in the last chunk just past the object's closing brace, once complete
+        self.end = None
+        # Characters to skip at the start of the next chunk after a trailing backslash
+        self._carry_skip = 0
+    
+    def feed(self, text: str) -> bool:
+        """
+        Scan the next chunk of text
+        
+        Args:
+            text: Next chunk of the response
+            
+        Returns:
+            True once the first JSON object is complete
+        """
+        skip_to = self._carry_skip
+        self._carry_skip = 0
+        for match in JSON_STRUCTURE_RE.finditer(text):
+            pos = match.start()
+            if pos < skip_to:
+                # Escaped character inside a string
+                continue
+            char = match.group()
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+            elif self.in_string:
+                if char == "\\":
+                    skip_to = pos + 2
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = pos + 1
+                    return True
+        self._carry_skip = max(skip_to - len(text), 0)
+        return False
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Find the first complete JSON object in a model response
+    
+    Braces inside string values are ignored, so prose after the object
+    cannot extend the match.
+    
+    Args:
+        text: Response text, possibly with prose around the JSON
+        
+    Returns:
+        The object's text, or None if there is no balanced object
+    """
+    scanner = JsonObjectScanner()
+    if not scanner.feed(text):
+        return None
+    return text[text.index("{"):scanner.end]
@@ -0,0 +1,51 @@
+# app/utils/logging_config.py
+import os
+import queue
+import atexit
+import logging
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Per-request context attached to every log record
+request_user_id: ContextVar[str] = ContextVar("request_user_id", default="-")
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [user=%(user_id)s] %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+class RequestContextFilter(logging.Filter):
+    """Copy request context variables onto log records"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.user_id = request_user_id.get()
+        return True
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """
+    Route all logging through a queue so request handlers never block on I/O.
+
+    Records are enqueued by the calling coroutine and written to stderr by a
+    background listener thread. The level defaults to the LOG_LEVEL environment
+    variable (INFO if unset); set it to WARNING in production to drop debug output.
+    Calling this more than once is a no-op.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,37 @@
+# app/utils/tokens.py
+import logging
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Encoding of the gpt-4o family, used when the model has no known encoding
+DEFAULT_ENCODING = "o200k_base"
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: Optional[str] = None):
+    """
+    Get the tiktoken encoding for a model, or the default encoding if none is given
+    
+    Returns None when tiktoken is missing or its encoding files can't be loaded
+    (for example offline, when they have to be downloaded). The result is cached
+    either way, so a failed load is not retried on every call.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    if model_name:
+        try:
+            return tiktoken.encoding_for_model(model_name.split("/")[-1])
+        except Exception:
+            pass
+    try:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logger.warning("Token counting falling back to estimates: %s", e)
+        return None
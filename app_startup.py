@@ -13,15 +13,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Load .env before any app module reads its configuration
+from dotenv import load_dotenv
+load_dotenv()
+
 # Import core components
 from app.core.component_registry import get_registry, setup_standard_components
 from app.models.create_tables import init_db
 from app.utils.error_handler import register_error_handlers
 from app.utils.optimization import timing_decorator, response_time_monitor
 
-from dotenv import load_dotenv
-load_dotenv()
-
 class StudyBuddyStartup:
     """Handles application startup and health checks"""
     
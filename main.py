@@ -9,11 +9,43 @@
 
 
 # main.py: FastAPI entry point
+# Load .env once, before any app module reads its configuration
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.utils.logging_config import setup_logging
+setup_logging()
+
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import api_router
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the Semantic Kernel and register its skills before the first request
+    from app.core.factory import get_factory
+    processor = get_factory().get_message_processor()
+    if hasattr(processor, "_ensure_kernel"):
+        try:
+            processor._ensure_kernel()
+        except Exception as e:
+            logger.warning("Semantic Kernel warm-up failed, it will load on first use: %s", e)
+    
+    # Write study session results periodically so abandoned sessions aren't held until exit
+    orchestrator = get_factory().get_session_orchestrator()
+    orchestrator.start_periodic_flush()
+    
+    yield
+    
+    # Write study session results still held in memory before exiting
+    await orchestrator.stop_periodic_flush()
+    await orchestrator.flush_sessions_async()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(